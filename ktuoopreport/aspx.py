@@ -0,0 +1,125 @@
+from concurrent.futures import ProcessPoolExecutor
+from html import unescape
+from typing import Iterator, Optional, TextIO
+import hashlib
+import os.path as path
+import os
+import re
+
+from .layout import fingerprint_path
+
+# Attributes of a server control, without its "ID" and "runat"
+ControlProperties = dict[str, str]
+
+# Markup is matched only from the start of a tag. Anything that can't be a
+# complete tag yet means that more of the file needs to be read.
+TAG = re.compile(r"""
+      <%.*?%>                                           # directive or server code
+    | <!--.*?-->                                        # comment
+    | <(?!!--)[!?/][^>]*>                               # doctype, end tag, etc.
+    | <(?P<name>[A-Za-z][\w:.-]*)
+       (?P<attributes>(?:"[^"]*"|'[^']*'|[^"'<>])*)>    # start tag
+""", re.DOTALL | re.VERBOSE)
+
+# Longer unfinished markup is not treated as a tag, so that a lone "<" (like
+# in inline scripts) doesn't make the whole file get read into memory
+MAX_TAG_LENGTH = 256 * 1024
+
+ATTRIBUTE = re.compile(r"""([^\s"'<>/=]+)(?:\s*=\s*("[^"]*"|'[^']*'|[^\s"'<>]+))?""")
+
+# Files bigger than this (in total) are parsed in separate processes
+PARALLEL_PARSE_SIZE = 4 * 1024 * 1024
+
+# Parsed files by their path, size and modification time
+parsed_files: dict[str, dict[str, ControlProperties]] = {}
+
+def iter_start_tags(f: TextIO, chunk_size: int = 64 * 1024) -> Iterator[tuple[str, str]]:
+    """
+    Yield name and unparsed attributes of every start tag, while reading the
+    file in chunks. Server code, comments and end tags are skipped.
+    """
+    buffer = ""
+    position = 0
+    eof = False
+    while True:
+        start = buffer.find("<", position)
+        if start != -1:
+            match = TAG.match(buffer, start)
+            if match:
+                if match["name"]:
+                    yield match["name"], match["attributes"]
+                position = match.end()
+                continue
+            if eof or len(buffer) - start > MAX_TAG_LENGTH:
+                # A lone "<", which isn't part of any tag
+                position = start + 1
+                continue
+        elif eof:
+            return
+
+        # Only the unfinished tag (if any) is kept, before reading more
+        buffer = buffer[start:] if start != -1 else ""
+        position = 0
+        chunk = f.read(chunk_size)
+        if chunk:
+            buffer += chunk
+        else:
+            eof = True
+
+def parse_attributes(text: str) -> dict[str, str]:
+    attributes = {}
+    for match in ATTRIBUTE.finditer(text):
+        value = match[2] or ""
+        if value[:1] in ('"', "'"):
+            value = value[1:-1]
+        attributes[match[1]] = unescape(value)
+    return attributes
+
+def parse_server_controls(f: TextIO) -> dict[str, ControlProperties]:
+    """
+    Find properties of controls which run on the server ("ID" and "runat"
+    attributes), that were changed from their defaults
+    """
+    controls = {}
+    for _, text in iter_start_tags(f):
+        # Most tags are plain html, which can be skipped without parsing
+        if "runat" not in text:
+            continue
+        attributes = parse_attributes(text)
+        if "ID" not in attributes or "runat" not in attributes:
+            continue
+        control_id = attributes.pop("ID")
+        del attributes["runat"]
+        if attributes:
+            controls[control_id] = attributes
+    return controls
+
+def parse_file(filename: str) -> dict[str, ControlProperties]:
+    with open(filename, "r", encoding="utf-8-sig") as f:
+        return parse_server_controls(f)
+
+def get_file_key(filename: str) -> str:
+    digest = hashlib.sha1()
+    fingerprint_path(path.abspath(filename), digest)
+    return digest.hexdigest()
+
+def parse_files(filenames: list[str], max_workers: Optional[int] = None) -> list[dict[str, ControlProperties]]:
+    """
+    Parse server controls of every file. Files which weren't changed since
+    they were last parsed are taken from cache, and big files are parsed in
+    parallel.
+    """
+    keys = [get_file_key(filename) for filename in filenames]
+    missing = [(key, filename) for key, filename in zip(keys, filenames) if key not in parsed_files]
+
+    total_size = sum(path.getsize(filename) for _, filename in missing)
+    if len(missing) > 1 and total_size >= PARALLEL_PARSE_SIZE and (os.cpu_count() or 1) > 1:
+        with ProcessPoolExecutor(max_workers or min(len(missing), os.cpu_count())) as executor:
+            results = executor.map(parse_file, [filename for _, filename in missing])
+            for (key, _), controls in zip(missing, results):
+                parsed_files[key] = controls
+    else:
+        for key, filename in missing:
+            parsed_files[key] = parse_file(filename)
+
+    return [parsed_files[key] for key in keys]
@@ -0,0 +1,108 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from tempfile import TemporaryDirectory
+from threading import Lock
+from typing import Optional
+import os.path as path
+import shutil
+
+from . import dotnet
+
+class BuildRegistry:
+    """
+    Keeps track of all of the projects that need to be built while generating
+    a single report. Every project is built only once, no matter how many
+    sections reference it, and all of the builds run concurrently.
+    """
+    executor: ThreadPoolExecutor
+    builds: dict[str, Future]
+    locks: dict[str, Lock]
+    build_directories: list[TemporaryDirectory]
+
+    def __init__(self, max_workers: Optional[int] = None) -> None:
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="build")
+        self.builds = {}
+        self.locks = {}
+        self.build_directories = []
+
+    @staticmethod
+    def get_key(project_path: str) -> str:
+        return path.normcase(path.abspath(project_path))
+
+    def request(self, project_path: str, cli_args: list[str] = []):
+        """
+        Start building given project in the background, if it isn't already
+        being built.
+        """
+        key = BuildRegistry.get_key(project_path)
+        if key in self.builds:
+            return
+
+        build_directory = TemporaryDirectory()
+        self.build_directories.append(build_directory)
+        self.locks[key] = Lock()
+        self.builds[key] = self.executor.submit(
+            dotnet.build_project, project_path, build_directory.name, cli_args
+        )
+
+    def get(self, project_path: str) -> Optional[str]:
+        """
+        Wait until given project is built and return the path to its executable.
+        Returns None if the build failed.
+        """
+        key = BuildRegistry.get_key(project_path)
+        assert key in self.builds, f"Build for project '{project_path}' was never requested"
+        return self.builds[key].result()
+
+    def get_all(self) -> dict[str, Optional[str]]:
+        """
+        Wait until all requested projects are built, and return their
+        executables keyed by `get_key` of the project
+        """
+        return {key: build.result() for key, build in self.builds.items()}
+
+    def lock(self, project_path: str) -> Lock:
+        """
+        Lock which must be held while running tests in the build directory of
+        given project, because sections sharing a build also share the
+        directory in which tests are run.
+        """
+        return self.locks[BuildRegistry.get_key(project_path)]
+
+    def cleanup(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        for build_directory in self.build_directories:
+            build_directory.cleanup()
+        self.build_directories = []
+        self.builds = {}
+        self.locks = {}
+
+class PrebuiltRegistry(BuildRegistry):
+    """
+    Registry of projects which were already built by another process, for
+    sections which are laid out in worker processes. Tests are run inside of
+    the build directory, so each build is copied into a directory of its own
+    when it's first requested.
+    """
+    executables: dict[str, Optional[str]]
+
+    def __init__(self, executables: dict[str, Optional[str]]) -> None:
+        super().__init__(max_workers=1)
+        self.executables = executables
+
+    def request(self, project_path: str, cli_args: list[str] = []):
+        key = BuildRegistry.get_key(project_path)
+        if key in self.builds:
+            return
+
+        assert key in self.executables, f"Project '{project_path}' was not built"
+        self.locks[key] = Lock()
+        self.builds[key] = self.executor.submit(self.copy_build, self.executables[key])
+
+    def copy_build(self, executable: Optional[str]) -> Optional[str]:
+        if executable is None:
+            return None
+
+        build_directory = TemporaryDirectory()
+        self.build_directories.append(build_directory)
+        shutil.copytree(path.dirname(executable), build_directory.name, dirs_exist_ok=True)
+        return path.join(build_directory.name, path.basename(executable))
@@ -0,0 +1,22 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional
+import os
+import zlib
+
+# Streams smaller than this (in total) are compressed in place, starting
+# threads would take longer
+PARALLEL_COMPRESS_SIZE = 256 * 1024
+
+def compress_streams(streams: list[bytes], level: int = zlib.Z_DEFAULT_COMPRESSION, max_workers: Optional[int] = None) -> list[bytes]:
+    """
+    Compress every stream with zlib, in parallel when it's worth it. zlib
+    releases the GIL, so threads are enough. The result is the same as
+    compressing them one by one.
+    """
+    compress = partial(zlib.compress, level=level)
+    workers = max_workers or os.cpu_count() or 1
+    if len(streams) <= 1 or workers <= 1 or sum(map(len, streams)) < PARALLEL_COMPRESS_SIZE:
+        return list(map(compress, streams))
+    with ThreadPoolExecutor(min(workers, len(streams))) as executor:
+        return list(executor.map(compress, streams))
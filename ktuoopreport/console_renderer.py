@@ -1,33 +1,98 @@
+from typing import Optional
 from PIL import Image, ImageFont, ImageDraw
+import math
+
+from .images import encode
+
+# Text in a console with its color
+ConsoleRun = tuple[str, str]
+
+# Space between lines, the same as Pillow puts into multiline text
+LINE_SPACING = 4
 
 def hex_to_rgb(value: str) -> tuple[int, int, int]:
     value = value.lstrip("#")
     r, g, b = tuple(int(value[i:i+2], 16) for i in (0, 2, 4))
     return (r, g, b)
 
-def render_console(
-        text: str,
+def strip_runs(runs: list[ConsoleRun]) -> list[ConsoleRun]:
+    """
+    Remove whitespace from the start and the end of the whole text, like
+    `str.strip` does, and drop runs which become empty
+    """
+    runs = list(runs)
+    while runs and not runs[0][0].lstrip():
+        runs.pop(0)
+    while runs and not runs[-1][0].rstrip():
+        runs.pop()
+    if runs:
+        runs[0] = (runs[0][0].lstrip(), runs[0][1])
+        runs[-1] = (runs[-1][0].rstrip(), runs[-1][1])
+    return runs
+
+def split_runs(runs: list[ConsoleRun]) -> list[list[ConsoleRun]]:
+    """
+    Split runs into lines, each line is a list of runs without newlines
+    """
+    lines: list[list[ConsoleRun]] = [[]]
+    for text, color in runs:
+        parts = text.split("\n")
+        for i, part in enumerate(parts):
+            if i > 0:
+                lines.append([])
+            if part:
+                lines[-1].append((part, color))
+    return lines
+
+def render_console_runs(
+        runs: list[ConsoleRun],
         font_file: str,
         font_size: int,
         background: str = "#000000",
-        foreground: str = "#FFFFFF",
         left_padding: int = 10,
         right_padding: int = 10,
         top_padding: int = 10,
         bottom_padding: int = 10,
+        max_aspect: Optional[float] = None,
     ):
-
+    """
+    Render text where each run has its own color, like input typed into a
+    console among the output of a program. Images which would be more than
+    `max_aspect` times taller than wide are widened, so that they would fit
+    on a page when they are scaled to its width.
+    """
     font = ImageFont.truetype(font_file, font_size)
-    text_width, text_height = font.getsize_multiline(text)
+    lines = split_runs(runs)
 
-    bg = hex_to_rgb(background)
-    fg = hex_to_rgb(foreground)
+    line_height = font.getbbox("A")[3] + LINE_SPACING
+    text_width = max(font.getbbox("".join(text for text, _ in line))[2] for line in lines)
+    text_height = len(lines) * line_height - LINE_SPACING
 
     width = text_width + left_padding + right_padding
     height = text_height + top_padding + bottom_padding
-    image = Image.new("RGB", (width, height), bg)
+    if max_aspect:
+        width = max(width, math.ceil(height / max_aspect))
+    image = Image.new("RGB", (width, height), hex_to_rgb(background))
 
     draw = ImageDraw.Draw(image)
-    draw.text((left_padding, top_padding), text, fill=fg, font=font)
+    for i, line in enumerate(lines):
+        x = left_padding
+        y = top_padding + i * line_height
+        for text, color in line:
+            draw.text((x, y), text, fill=hex_to_rgb(color), font=font)
+            x += font.getlength(text)
 
     return image
+
+def render_console_png(
+        runs: list[ConsoleRun],
+        font_file: str,
+        font_size: int,
+        background: str = "#000000",
+        max_aspect: Optional[float] = None
+    ) -> bytes:
+    """
+    Same as `render_console_runs`, encoded as PNG so it could be rendered in
+    another process
+    """
+    return encode(render_console_runs(runs, font_file, font_size, background, max_aspect=max_aspect), "PNG")
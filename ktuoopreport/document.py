@@ -0,0 +1,179 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Optional
+from PIL import Image as ImageUtils
+from PIL.Image import Image
+import hashlib
+import os.path as path
+
+from .render_pool import RenderedImage
+
+# Image given to a document: file path, decoded image, encoded image data or
+# an image which is still being rendered
+DocumentImage = str|Image|BytesIO|RenderedImage
+
+# A cell which spans all rows of its group, followed by the rows
+TableGroup = tuple[str, list[list[str]]]
+
+def encode_image(image: DocumentImage, formats: tuple[str, ...] = ("PNG", "JPEG")) -> tuple[bytes, str]:
+    """
+    Returns encoded image data and its format. Images which are not encoded
+    in one of `formats` are converted to PNG.
+    """
+    if isinstance(image, str):
+        with open(image, "rb") as f:
+            image = BytesIO(f.read())
+    elif isinstance(image, RenderedImage):
+        image = BytesIO(image.get_data())
+
+    if isinstance(image, BytesIO):
+        decoded = ImageUtils.open(image)
+        if decoded.format in formats:
+            return image.getvalue(), decoded.format # type: ignore
+        image = decoded
+
+    buffer = BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue(), "PNG"
+
+def write_if_changed(filename: str, data: bytes) -> bool:
+    """
+    Write data into a file, unless the file already has the same content, so
+    that its modification time only changes when the document does. Returns
+    whether the file was written.
+    """
+    if path.isfile(filename) and path.getsize(filename) == len(data):
+        digest = hashlib.sha256()
+        with open(filename, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        if digest.digest() == hashlib.sha256(data).digest():
+            return False
+
+    with open(filename, "wb") as f:
+        f.write(data)
+    return True
+
+@dataclass
+class TitlePage:
+    university_name: str
+    faculty_name: str
+    university_icon: str
+    title: str
+    sub_title: str
+    # Names of people with their roles
+    people: list[tuple[str, str]]
+    footer: str
+    seperator_color: tuple[int, int, int]
+
+class Document(ABC):
+    """
+    Output format independent interface, which section generators write into.
+    Documents only get told what should be shown (listings, figures, tables),
+    how it looks is decided by each document type.
+
+    Section and figure numbering is shared between all document types, so
+    that they would number things the same way.
+    """
+    section_levels: list[int]
+    numbering_index: int = 0
+
+    @abstractmethod
+    def add_title_page(self, title_page: TitlePage):
+        pass
+
+    @abstractmethod
+    def add_table_of_contents(self, title: str, section_count: int, subsection_count: int):
+        """
+        Counts of sections are only an estimate, for documents which need to
+        reserve space for the table of contents upfront
+        """
+        pass
+
+    @abstractmethod
+    def add_page(self):
+        pass
+
+    @abstractmethod
+    def start_section(self, name: str, level: int):
+        pass
+
+    @abstractmethod
+    def newline(self, height: Optional[float] = None):
+        pass
+
+    @abstractmethod
+    def add_markdown(self, text: str):
+        pass
+
+    @abstractmethod
+    def add_listing(self, text: str, language: Optional[str] = None, theme: str = "vs"):
+        """
+        Add text in a monospace font, syntax highlighted if `language` (a
+        language or a filename) is given
+        """
+        pass
+
+    @abstractmethod
+    def add_figure(
+            self,
+            image: DocumentImage,
+            numbering_label: str,
+            label: Optional[str] = None,
+            full_width: bool = False
+        ):
+        """
+        Add image followed by its numbering. The optional label is shown
+        above the image.
+        """
+        pass
+
+    def prepare_figures(self, figures: list[tuple[DocumentImage, bool]]):
+        """
+        Called with images (and whether they will be full width) before they
+        are added as figures, so that documents could process them together
+        """
+        pass
+
+    @abstractmethod
+    def add_table(self, headers: list[str], groups: list[TableGroup]):
+        pass
+
+    @abstractmethod
+    @contextmanager
+    def labeled_block(self, label: str):
+        """
+        Render label above block
+        """
+        yield
+
+    @abstractmethod
+    def save_to_file(self, filename: str) -> bool:
+        """
+        Returns false if the file already had the same content, and was left
+        as it was
+        """
+        pass
+
+    def push_section(self, label: Optional[str] = None, *args, **kvargs):
+        self.section_levels.append(1)
+        if label:
+            level = "".join(str(lvl)+"." for lvl in self.section_levels[:-1])
+            label = label.format(level = level, *args, **kvargs)
+        self.start_section(label or "", len(self.section_levels)-2)
+
+    def pop_section(self):
+        self.section_levels.pop()
+        self.section_levels[-1] += 1
+
+    @contextmanager
+    def section_block(self, label: Optional[str] = None, *args, **kvargs):
+        self.push_section(label, *args, **kvargs)
+        yield
+        self.pop_section()
+
+    def next_numbering(self, label: str) -> str:
+        self.numbering_index += 1
+        return label.format(index=self.numbering_index)
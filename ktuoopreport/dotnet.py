@@ -2,22 +2,21 @@ from typing import Optional
 import os.path as path
 from glob import glob
 import os
-import subprocess
-from subprocess import PIPE, CalledProcessError
 import stat
-from threading import Thread
-from queue import Queue,Empty
-import time
-from shutil import copytree, rmtree
-import contextlib
-import time
-
-@contextlib.contextmanager
-def pushd(new_dir):
-    previous_dir = os.getcwd()
-    os.chdir(new_dir)
-    yield
-    os.chdir(previous_dir)
+import logging
+
+from .execution import ExecutionLimits, ExecutionResult, default_execution_core, execute, run_command
+from .sandbox import TestSandbox
+
+# Warnings are shown even without handlers, through logging's last resort
+logger = logging.getLogger("ktuoopreport.dotnet")
+
+# Builds which take longer than this many seconds are stopped
+BUILD_TIMEOUT = 10 * 60
+
+# Seconds which programs are given to print their prompt before each line of
+# input in `complex_execute`
+PROMPT_DELAY = 0.2
 
 def is_project_root(project_root: str) -> bool:
     """
@@ -43,16 +42,20 @@ def find_executable(directory: str) -> Optional[str]:
         os.chmod(executable, stat.S_IEXEC | stat.S_IREAD | stat.S_IWRITE)
         return executable
 
-def build_project(project_root: str, output_directory: str, cli_args: list[str] = []) -> Optional[str]:
+async def build_project_async(project_root: str, output_directory: str, cli_args: list[str] = []) -> Optional[str]:
     """
-    Build C# project using dotnet cli and output it to given directory
+    Build C# project using dotnet cli and output it to given directory. Runs
+    on the loop of the execution core, like the rest of the `_async`
+    functions.
     """
     cmd = ["dotnet", "build", project_root, "-o", output_directory, *cli_args]
-    process = subprocess.run(cmd, shell=False)
+    returncode = await run_command(cmd, timeout=BUILD_TIMEOUT)
 
     # If failed to compile
-    if process.returncode != 0:
-        print(process.stderr)
+    if returncode is None:
+        logger.warning("Build of '%s' was stopped after %s s", project_root, BUILD_TIMEOUT)
+        return None
+    if returncode != 0:
         return None
 
     executable = find_executable(output_directory)
@@ -61,108 +64,74 @@ def build_project(project_root: str, output_directory: str, cli_args: list[str]
 
     return executable
 
-def simple_execute(executable: str, stdin_lines: list[str] = []):
+def build_project(project_root: str, output_directory: str, cli_args: list[str] = []) -> Optional[str]:
+    return default_execution_core.run(build_project_async(project_root, output_directory, cli_args))
+
+async def simple_execute_async(
+        executable: str,
+        stdin_lines: list[str] = [],
+        cwd: Optional[str] = None,
+        limits: ExecutionLimits = ExecutionLimits()
+    ) -> ExecutionResult:
     """
-        Execute using subprocess.check_output, this will get the output from the
-        process, but the output won't included anything that was provided through
-        stdin.
+        Execute while streaming output from the process, this will get the
+        output from the process, but the output won't included anything that
+        was provided through stdin. All of stdin is written at once, so it's
+        at the start of the transcript.
 
-        If you wan't to merge stdin and stdout, use `complex_execute`.
+        If you wan't to interleave stdin and stdout, use `complex_execute`.
+    """
+    return await execute(executable, ["\n".join(stdin_lines).encode("utf-8")], cwd, limits)
+
+def simple_execute(
+        executable: str,
+        stdin_lines: list[str] = [],
+        cwd: Optional[str] = None,
+        limits: ExecutionLimits = ExecutionLimits()
+    ) -> ExecutionResult:
+    return default_execution_core.run(simple_execute_async(executable, stdin_lines, cwd, limits))
+
+async def complex_execute_async(
+        executable: str,
+        stdin_lines: list[str] = [],
+        cwd: Optional[str] = None,
+        limits: ExecutionLimits = ExecutionLimits()
+    ) -> ExecutionResult:
+    """
+        Feed stdin to the process line by line, after giving it time to print
+        its prompt. Input ends up in the transcript between the output, the
+        same way as it would look in a console.
+    """
+    chunks = [(line + "\n").encode("utf-8") for line in stdin_lines]
+    return await execute(executable, chunks, cwd, limits, prompt_delay=PROMPT_DELAY)
+
+def complex_execute(
+        executable: str,
+        stdin_lines: list[str] = [],
+        cwd: Optional[str] = None,
+        limits: ExecutionLimits = ExecutionLimits()
+    ) -> ExecutionResult:
+    return default_execution_core.run(complex_execute_async(executable, stdin_lines, cwd, limits))
+
+def run_test(executable: str, sandbox: TestSandbox, limits: ExecutionLimits = ExecutionLimits()) -> ExecutionResult:
+    """
+    Run executable inside of a prepared test sandbox
     """
-    try:
-        stdout = subprocess.check_output(
-            ["./"+path.basename(executable)],
-            input = "\n".join(stdin_lines).encode("utf-8")
-        )
-
-        return 0, stdout.decode("utf-8")
-    except CalledProcessError as e:
-        return e.returncode, e.output.decode("utf-8")
-
-def read_bit(stdout, queue):
-    for c in iter(lambda:stdout.read(1),''):
-        queue.put(c)
-    stdout.close()
-
-def get_data(queue):
-    r = ''
-    while True:
-        try:
-            c = queue.get(False)
-        except Empty:
-            break
-        else:
-            r += c
-    return r
-
-def complex_execute(executable: str, stdin_lines: list[str] = []):
-    proc = subprocess.Popen(["./"+path.basename(executable)], shell=False, universal_newlines=True, stdin=PIPE, stdout=PIPE, stderr=PIPE)
-    assert proc.stdin
-
-    q = Queue()
-    t = Thread(target=read_bit,args=(proc.stdout,q))
-    t.daemon = True
-    t.start()
-
-    stdout = ""
-    while True:
-        time.sleep(0.2)
-        stdout += get_data(q)
-        if not t.is_alive or len(stdin_lines) == 0:
-            break
-        stdin = stdin_lines.pop()
-        proc.stdin.write(stdin)
-        proc.stdin.write('\n')
-        stdout += stdin + '\n'
-        proc.stdin.flush()
-
-    return proc.returncode, stdout
-
-def run_test(executable: str, test_folder: str):
     assert os.access(executable, os.X_OK), "Excpected to be able to run executable, insufficient permissions"
-    assert path.isdir(test_folder), "Failed to verify that given test folder is a folder"
-
-    working_directory = path.dirname(executable)
-
-    # Remove unneeded files, that might still be around from last test
-    for item in os.listdir(working_directory):
-        if not item.startswith(executable):
-            if path.isfile(item):
-                os.remove(item)
-            elif path.isdir(item):
-                rmtree(item)
-
-    # copy current test files
-    copytree(test_folder, working_directory, dirs_exist_ok=True)
-
-    # Run program
-    with pushd(working_directory):
-
-        # Check if stdin is given
-        stdin_lines = []
-        if path.isfile("stdin.txt"):
-            with open("stdin.txt", "r") as f:
-                stdin_lines = f.read().strip().splitlines()
-            os.remove("stdin.txt")
-
-        # The simple version is used, when you don't need to merge stdin
-        # and stdout into a single text blob
-        if len(stdin_lines) == 0:
-            return simple_execute(executable)
-        else:
-            return complex_execute(executable, stdin_lines)
-
-def list_test_files(executable: str) -> list[str]:
-    working_directory = path.dirname(executable)
-
-    test_files = []
-    for root, _, files in os.walk(working_directory, topdown=True):
-        for file in files:
-            fullpath = path.join(root, file)
-            if not fullpath.startswith(executable):
-                test_files.append(fullpath)
-
-    return test_files
+
+    working_directory = sandbox.working_directory
+
+    # Check if stdin is given
+    stdin_lines = sandbox.get_stdin_lines()
+
+    # Run program. The working directory is passed to the process instead of
+    # changing the current one, so tests could be run from other threads.
+    # The simple version is used, when you don't need to merge stdin
+    # and stdout into a single text blob
+    if len(stdin_lines) == 0:
+        return simple_execute(executable, cwd=working_directory, limits=limits)
+    else:
+        return complex_execute(executable, stdin_lines, cwd=working_directory, limits=limits)
 
 def is_web_project(project_path: str):
     return path.isdir(project_path) and path.exists(path.join(project_path, "Web.config"))
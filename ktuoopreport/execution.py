@@ -0,0 +1,632 @@
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from threading import Thread, Lock
+from typing import Any, Callable, Coroutine, Literal, Optional, TypeVar, Union
+import asyncio
+import codecs
+import os.path as path
+import os
+import signal
+import subprocess
+from subprocess import PIPE
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+READ_CHUNK_SIZE = 64 * 1024
+# Seconds to wait for the rest of the output, after a program exits
+READER_JOIN_TIMEOUT = 1
+# Seconds between reads of the peak memory of a running program, it can't be
+# read any more once the program has exited
+MEMORY_SAMPLE_INTERVAL = 0.05
+
+T = TypeVar("T")
+
+@dataclass
+class ExecutionLimits:
+    """
+    Limits applied to a program while it's being run. The program is killed
+    when its output goes past the byte or line limit, or when it exceeds its
+    wall-clock time. The line limit is kept low enough for the output to fit
+    on a page as a console image.
+
+    Other limits are only applied on POSIX systems. Setting any of them to
+    None leaves it unlimited. Keep in mind that the .NET runtime reserves a lot
+    of virtual memory and starts a bunch of threads, which count towards
+    `address_space` and `processes`.
+    """
+    max_output_bytes: int = 64 * 1024
+    max_output_lines: int = 60
+    timeout: float = 60
+    # Seconds of CPU time
+    cpu_time: Optional[int] = 30
+    # Bytes of virtual memory
+    address_space: Optional[int] = None
+    open_files: Optional[int] = 1024
+    processes: Optional[int] = None
+    # How much the priority of the program is lowered
+    nice: Optional[int] = 10
+    # Path to a writable cgroup (v2) folder, in which the program will be
+    # placed. Its peak memory is reported as the program's, so it should only
+    # hold one program at a time.
+    cgroup: Optional[str] = None
+
+@dataclass
+class ResourceUsage:
+    wall_time: float
+    user_time: float
+    system_time: float
+    # Peak resident memory of the program in bytes, None where it can't be
+    # measured. `ru_maxrss` can't be used for it, since it includes the
+    # memory of this process, which the program was forked from.
+    max_rss: Optional[int]
+
+# Stream of a program that a chunk of its transcript went through
+Stream = Literal["stdout", "stderr", "stdin"]
+
+# Data which went through a stream, with seconds since the program was started
+TranscriptChunk = tuple[Stream, bytes, float]
+
+@dataclass
+class ExecutionResult:
+    returncode: Optional[int]
+    stdout: str
+    stderr: str
+    stdout_truncated: bool = False
+    stderr_truncated: bool = False
+    timed_out: bool = False
+    usage: Optional[ResourceUsage] = None
+    # Input and output of the program, in the order it happened
+    transcript: list[TranscriptChunk] = field(default_factory=list)
+
+class Transcript:
+    """
+    Everything that was written to and read from a program, in the order it
+    happened. Consecutive chunks of the same stream are merged, keeping the
+    timestamp of the first one.
+    """
+    started_at: float
+    chunks: list[TranscriptChunk]
+
+    def __init__(self, started_at: float) -> None:
+        self.started_at = started_at
+        self.chunks = []
+        self.lock = Lock()
+
+    def add(self, stream: Stream, data: bytes):
+        if not data:
+            return
+        with self.lock:
+            if self.chunks and self.chunks[-1][0] == stream:
+                _, previous, timestamp = self.chunks[-1]
+                self.chunks[-1] = (stream, previous + data, timestamp)
+            else:
+                self.chunks.append((stream, data, time.monotonic() - self.started_at))
+
+    def getvalue(self) -> list[TranscriptChunk]:
+        with self.lock:
+            return list(self.chunks)
+
+def decode_transcript(transcript: list[TranscriptChunk], streams: tuple[Stream, ...]) -> list[tuple[Stream, str]]:
+    """
+    Text of chunks which went through given streams. Each stream is decoded
+    on its own, so characters which were split between chunks stay whole.
+    """
+    decoders = {stream: codecs.getincrementaldecoder("utf-8")(errors="replace") for stream in streams}
+    segments: list[tuple[Stream, str]] = []
+    for stream, data, _ in transcript:
+        if stream not in decoders:
+            continue
+        text = decoders[stream].decode(data)
+        if segments and segments[-1][0] == stream:
+            segments[-1] = (stream, segments[-1][1] + text)
+        elif text:
+            segments.append((stream, text))
+    return segments
+
+class OutputBuffer:
+    """
+    Collects output of a process until it reaches a limit of bytes or lines.
+    Everything after that is dropped. Kept output is also added to the
+    transcript, if one is given.
+    """
+    max_bytes: int
+    max_lines: int
+    transcript: Optional[Transcript]
+    stream: Stream
+
+    chunks: list[bytes]
+    size: int
+    lines: int
+    truncated: bool
+
+    def __init__(
+            self,
+            max_bytes: int,
+            max_lines: int,
+            transcript: Optional[Transcript] = None,
+            stream: Stream = "stdout"
+        ) -> None:
+        self.max_bytes = max_bytes
+        self.max_lines = max_lines
+        self.transcript = transcript
+        self.stream = stream
+        self.chunks = []
+        self.size = 0
+        self.lines = 0
+        self.truncated = False
+        self.lock = Lock()
+
+    def write(self, data: bytes):
+        with self.lock:
+            if self.truncated:
+                return
+
+            if self.size + len(data) > self.max_bytes:
+                data = data[:self.max_bytes - self.size]
+                self.truncated = True
+
+            newlines = data.count(b"\n")
+            if self.lines + newlines >= self.max_lines:
+                # Cut off everything after the last allowed line
+                cut = -1
+                for _ in range(self.max_lines - self.lines):
+                    cut = data.index(b"\n", cut + 1)
+                if cut + 1 < len(data):
+                    self.truncated = True
+                data = data[:cut + 1]
+                newlines = self.max_lines - self.lines
+
+            self.chunks.append(data)
+            self.size += len(data)
+            self.lines += newlines
+            if self.transcript is not None:
+                self.transcript.add(self.stream, data)
+
+    def getvalue(self) -> str:
+        with self.lock:
+            return b"".join(self.chunks).decode("utf-8", errors="replace")
+
+def get_limits_preexec(limits: ExecutionLimits) -> Optional[Callable[[], None]]:
+    """
+    Returns a function which applies the limits in the child process, before
+    the program is executed, so that nothing it starts escapes them. Only the
+    loop of the execution core starts programs, so there is a single thread
+    forking at a time. Everything the child does is prepared here, because
+    it may only make plain system calls between the fork and the exec.
+    """
+    if resource is None:
+        return None
+
+    rlimits = []
+    for rlimit, value in (
+            (resource.RLIMIT_CPU, limits.cpu_time),
+            (resource.RLIMIT_AS, limits.address_space),
+            (resource.RLIMIT_NOFILE, limits.open_files),
+            (resource.RLIMIT_NPROC, limits.processes),
+        ):
+        if value is None:
+            continue
+        # Hard limits can't be raised without privileges
+        _, hard = resource.getrlimit(rlimit)
+        if hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+        rlimits.append((rlimit, (value, value)))
+    nice = limits.nice
+    cgroup_procs = None if limits.cgroup is None else path.join(limits.cgroup, "cgroup.procs")
+    setrlimit = resource.setrlimit
+
+    def preexec():
+        for rlimit, value in rlimits:
+            setrlimit(rlimit, value)
+        if nice is not None:
+            os.nice(nice)
+        if cgroup_procs is not None:
+            try:
+                fd = os.open(cgroup_procs, os.O_WRONLY)
+                try:
+                    # Moves the process which writes it
+                    os.write(fd, b"0")
+                finally:
+                    os.close(fd)
+            except OSError:
+                # Cgroups are optional, the rlimits still apply
+                pass
+
+    return preexec
+
+class ExecutionCore:
+    """
+    Event loop in a background thread, on which all programs (builds and test
+    runs) are started and waited for. Any number of them can be in progress,
+    from any thread, but only `max_processes` run at the same time and the
+    rest wait for a free slot.
+
+    Coroutines which start programs must run on this loop, blocking code
+    runs them with `run`.
+    """
+    max_processes: Optional[int]
+    loop: Optional[asyncio.AbstractEventLoop]
+    slots: Optional[asyncio.Semaphore]
+    # Process which started the loop, forked processes start their own
+    pid: Optional[int]
+
+    def __init__(self, max_processes: Optional[int] = None) -> None:
+        self.max_processes = max_processes
+        self.loop = None
+        self.slots = None
+        self.pid = None
+        self.lock = Lock()
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        with self.lock:
+            if self.loop is None or self.pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                Thread(target=loop.run_forever, name="execution", daemon=True).start()
+                self.loop = loop
+                self.slots = asyncio.Semaphore(self.max_processes or os.cpu_count() or 1)
+                self.pid = os.getpid()
+            return self.loop
+
+    def submit(self, coroutine: Coroutine[Any, Any, T]) -> "Future[T]":
+        """
+        Start running a coroutine on the loop. Cancelling the returned future
+        cancels it, which kills the programs it started.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.get_loop())
+
+    def run(self, coroutine: Coroutine[Any, Any, T]) -> T:
+        """
+        Run a coroutine on the loop and wait for its result. It's cancelled if
+        waiting is interrupted (like with Ctrl+C).
+        """
+        future = self.submit(coroutine)
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Held while a program is running
+        """
+        assert self.slots is not None and asyncio.get_running_loop() is self.loop, "Not running on the loop of the execution core"
+        async with self.slots:
+            yield
+
+# Used by everything which runs programs
+default_execution_core = ExecutionCore()
+
+async def open_pipe_streams(
+        stdin, stdout, stderr
+    ) -> tuple[asyncio.StreamWriter, asyncio.StreamReader, asyncio.StreamReader]:
+    """
+    Connect pipes of a process started with `subprocess.Popen` to the loop,
+    the same way as `asyncio.create_subprocess_exec` does
+    """
+    loop = asyncio.get_running_loop()
+    readers = []
+    for pipe in (stdout, stderr):
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+        readers.append(reader)
+
+    transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, stdin) # type: ignore
+    writer = asyncio.StreamWriter(transport, protocol, None, loop)
+    return writer, readers[0], readers[1]
+
+def read_peak_rss(pid: int) -> Optional[int]:
+    """
+    High water mark of the resident memory of a running process in bytes,
+    read from /proc on Linux. None if it can't be read.
+    """
+    try:
+        with open(f"/proc/{pid}/status", "rb") as f:
+            for line in f:
+                if line.startswith(b"VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def read_cgroup_peak(cgroup: str) -> Optional[int]:
+    """
+    Peak memory of everything which was in a cgroup, None if the kernel
+    doesn't report it
+    """
+    try:
+        with open(path.join(cgroup, "memory.peak"), "rb") as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+async def wait4(pid: int) -> tuple[int, object]:
+    """
+    Wait until a child process exits and reap it, returning its exit status
+    and resource usage. Nothing else may reap it.
+    """
+    try:
+        pidfd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        pidfd = None
+
+    if pidfd is None:
+        # Without pidfds, a thread of the loop's executor is blocked instead
+        _, status, rusage = await asyncio.get_running_loop().run_in_executor(None, os.wait4, pid, 0)
+        return status, rusage
+
+    loop = asyncio.get_running_loop()
+    exited = loop.create_future()
+    loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+    try:
+        await exited
+    finally:
+        loop.remove_reader(pidfd)
+        os.close(pidfd)
+    # Process has already exited, so this doesn't block
+    _, status, rusage = os.wait4(pid, 0)
+    return status, rusage
+
+class RunningProcess:
+    """
+    Program started with limits applied to it, on the loop of the execution
+    core. Its output is streamed into bounded buffers. On POSIX it's reaped
+    with `os.wait4`, so that its resource usage could be collected.
+    """
+    limits: ExecutionLimits
+
+    started_at: float
+    deadline: float
+
+    stdout: OutputBuffer
+    stderr: OutputBuffer
+    transcript: Transcript
+
+    proc: Union[subprocess.Popen, asyncio.subprocess.Process]
+    stdin: asyncio.StreamWriter
+    readers: list[asyncio.Task]
+    # Finishes with the exit code, once the process exits and is reaped
+    exited: asyncio.Task
+    rusage: Optional[object]
+    # Highest VmHWM of the program that was read while it was running
+    peak_rss: Optional[int]
+    sampler: Optional[asyncio.Task]
+
+    def __init__(self, limits: ExecutionLimits) -> None:
+        self.limits = limits
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + limits.timeout
+        self.transcript = Transcript(self.started_at)
+        self.stdout = OutputBuffer(limits.max_output_bytes, limits.max_output_lines, self.transcript, "stdout")
+        self.stderr = OutputBuffer(limits.max_output_bytes, limits.max_output_lines, self.transcript, "stderr")
+        self.rusage = None
+        self.peak_rss = None
+        self.sampler = None
+
+    @staticmethod
+    async def start(executable: str, cwd: Optional[str], limits: ExecutionLimits) -> "RunningProcess":
+        process = RunningProcess(limits)
+        args = [path.abspath(executable)]
+        cwd = cwd or path.dirname(executable)
+
+        if os.name == "nt":
+            proc = await asyncio.create_subprocess_exec(*args, stdin=PIPE, stdout=PIPE, stderr=PIPE, cwd=cwd)
+            process.proc = proc
+            process.stdin, stdout, stderr = proc.stdin, proc.stdout, proc.stderr # type: ignore
+            process.exited = asyncio.create_task(proc.wait())
+        else:
+            # Started with Popen, because processes started by asyncio are
+            # reaped by asyncio, without their resource usage
+            process.proc = subprocess.Popen(
+                args,
+                shell=False,
+                stdin=PIPE,
+                stdout=PIPE,
+                stderr=PIPE,
+                cwd=cwd,
+                preexec_fn=get_limits_preexec(limits)
+            )
+            process.exited = asyncio.create_task(process.reap())
+            if sys.platform == "linux" and limits.cgroup is None:
+                process.sampler = asyncio.create_task(process.sample_memory())
+            process.stdin, stdout, stderr = await open_pipe_streams(
+                process.proc.stdin, process.proc.stdout, process.proc.stderr
+            )
+
+        process.readers = [
+            asyncio.create_task(process.read_output(stdout, process.stdout)),
+            asyncio.create_task(process.read_output(stderr, process.stderr)),
+        ]
+        return process
+
+    async def reap(self) -> int:
+        status, self.rusage = await wait4(self.proc.pid)
+        # Let Popen know that the process was already reaped
+        self.proc.returncode = os.waitstatus_to_exitcode(status)
+        return self.proc.returncode
+
+    async def sample_memory(self):
+        """
+        Keep reading the peak memory of the program until it exits. Popen
+        returns after the exec, so the memory of this process isn't counted.
+        Growth in the last interval before the program exits can be missed.
+        """
+        while not self.exited.done():
+            # Only read while the pid can't belong to anything else
+            peak_rss = read_peak_rss(self.proc.pid)
+            # It's 0 while the program is exiting
+            if peak_rss:
+                self.peak_rss = max(self.peak_rss or 0, peak_rss)
+            await asyncio.wait([self.exited], timeout=MEMORY_SAMPLE_INTERVAL)
+
+    async def read_output(self, stream: asyncio.StreamReader, buffer: OutputBuffer):
+        """
+        Stream output into a buffer. The program is killed as soon as the
+        buffer is full, since nothing else it prints would be shown.
+        """
+        await read_stream(stream, buffer)
+        if buffer.truncated:
+            self.kill()
+
+    def is_running(self) -> bool:
+        return not self.exited.done()
+
+    async def wait_exit(self, timeout: float) -> bool:
+        """
+        Wait for at most `timeout` seconds until the process exits. Returns
+        false if it's still running.
+        """
+        done, _ = await asyncio.wait([self.exited], timeout=max(0, timeout))
+        return bool(done)
+
+    async def write_stdin(self, data: bytes) -> bool:
+        """
+        Returns false if the program has closed its stdin. Data is added to
+        the transcript before it's written, so that output which the program
+        prints in response always comes after it.
+        """
+        if self.stdin.is_closing():
+            return False
+        self.transcript.add("stdin", data)
+        try:
+            self.stdin.write(data)
+            await self.stdin.drain()
+            return True
+        except (BrokenPipeError, ConnectionResetError):
+            return False
+
+    def close_stdin(self):
+        self.stdin.close()
+
+    def kill(self):
+        if self.exited.done():
+            return
+        if os.name == "nt":
+            self.proc.kill()
+            return
+        try:
+            # Popen.kill could reap the process. It's not reaped yet, so the
+            # pid can't belong to anything else.
+            os.kill(self.proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    async def finish(self) -> ExecutionResult:
+        """
+        Wait until process exits or kill it if it takes too long
+        """
+        self.close_stdin()
+
+        timed_out = not await self.wait_exit(self.deadline - time.monotonic())
+        if timed_out:
+            self.kill()
+        returncode = await asyncio.shield(self.exited)
+        wall_time = time.monotonic() - self.started_at
+
+        # Children of the program could still be holding its output open
+        _, pending = await asyncio.wait(self.readers, timeout=READER_JOIN_TIMEOUT)
+        for reader in pending:
+            reader.cancel()
+
+        return ExecutionResult(
+            returncode = returncode,
+            stdout = self.stdout.getvalue(),
+            stderr = self.stderr.getvalue(),
+            stdout_truncated = self.stdout.truncated,
+            stderr_truncated = self.stderr.truncated,
+            timed_out = timed_out,
+            usage = self.get_usage(wall_time),
+            transcript = self.transcript.getvalue()
+        )
+
+    async def cleanup(self):
+        """
+        Kill the program if it's still running, when it's not finished normally
+        """
+        self.kill()
+        self.stdin.close()
+        for reader in self.readers:
+            reader.cancel()
+        if self.sampler is not None:
+            self.sampler.cancel()
+        await asyncio.shield(self.exited)
+
+    def get_usage(self, wall_time: float) -> Optional[ResourceUsage]:
+        if self.rusage is None:
+            return None
+
+        max_rss = self.peak_rss
+        if self.limits.cgroup is not None:
+            max_rss = read_cgroup_peak(self.limits.cgroup)
+
+        return ResourceUsage(
+            wall_time = wall_time,
+            user_time = self.rusage.ru_utime, # type: ignore
+            system_time = self.rusage.ru_stime, # type: ignore
+            max_rss = max_rss
+        )
+
+async def read_stream(stream: asyncio.StreamReader, buffer: OutputBuffer):
+    """
+    Stream output of a process into a buffer, until the buffer is full or the
+    stream ends
+    """
+    while not buffer.truncated and (chunk := await stream.read(READ_CHUNK_SIZE)):
+        buffer.write(chunk)
+
+async def execute(
+        executable: str,
+        stdin_chunks: list[bytes],
+        cwd: Optional[str],
+        limits: ExecutionLimits,
+        prompt_delay: Optional[float] = None,
+        core: ExecutionCore = default_execution_core
+    ) -> ExecutionResult:
+    """
+    Run a program in a slot of the execution core, writing chunks of stdin to
+    it. With a `prompt_delay` the program is given that much time to print its
+    prompt before each chunk. The program is killed if this is cancelled.
+    """
+    async with core.slot():
+        process = await RunningProcess.start(executable, cwd, limits)
+        try:
+            for chunk in stdin_chunks:
+                if prompt_delay is not None:
+                    if time.monotonic() >= process.deadline:
+                        break
+                    if await process.wait_exit(prompt_delay):
+                        break
+                if not await process.write_stdin(chunk):
+                    break
+            return await process.finish()
+        finally:
+            await process.cleanup()
+
+async def run_command(
+        args: list[str],
+        cwd: Optional[str] = None,
+        timeout: Optional[float] = None,
+        core: ExecutionCore = default_execution_core
+    ) -> Optional[int]:
+    """
+    Run a command (like a build) which shares the console of this program, in
+    a slot of the execution core. Returns its exit code, or None if it was
+    killed after `timeout` seconds. The command is killed if this is cancelled.
+    """
+    async with core.slot():
+        proc = await asyncio.create_subprocess_exec(*args, cwd=cwd)
+        try:
+            return await asyncio.wait_for(proc.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
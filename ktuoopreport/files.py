@@ -0,0 +1,238 @@
+from collections import deque
+from dataclasses import dataclass, field
+from typing import BinaryIO, Iterable, Optional
+import codecs
+import math
+import mmap
+import os
+
+# Only this much of the start of a file is looked at to tell what it is
+SNIFF_SIZE = 8 * 1024
+
+# Big files are streamed in chunks of this size
+READ_SIZE = 1024 * 1024
+
+# Files at least this big are decoded straight from a memory map, instead of
+# being read into memory first
+MMAP_SIZE = 1024 * 1024
+
+# Checked in this order, because the UTF-32 LE mark starts with the UTF-16 one
+BOMS = [
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+# Text saved by older Windows programs (like Notepad) on Lithuanian systems
+# is in this code page instead of UTF-8
+FALLBACK_ENCODING = "cp1257"
+
+# Control characters which appear in text files
+TEXT_CONTROL_CHARACTERS = b"\t\n\r\f\b\x1b"
+
+# Text which isn't UTF-8 can't have more control characters than this
+MAX_CONTROL_RATIO = 0.1
+
+def detect_encoding(block: bytes) -> Optional[str]:
+    """
+    Guess the encoding of a file from the block at its start. Returns None
+    if the file doesn't look like text.
+    """
+    for bom, encoding in BOMS:
+        if block.startswith(bom):
+            return encoding
+    if b"\0" in block:
+        return None
+
+    try:
+        # The block could end in the middle of a character
+        codecs.getincrementaldecoder("utf-8")().decode(block, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+
+    control = sum(1 for byte in block if byte < 0x20 and byte not in TEXT_CONTROL_CHARACTERS)
+    if control > len(block) * MAX_CONTROL_RATIO:
+        return None
+    return FALLBACK_ENCODING
+
+def decode_text(data, encoding: str) -> str:
+    # Same newlines as files opened in text mode would have
+    text = codecs.decode(data, encoding, "replace")
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+def read_text_file(filename: str) -> Optional[str]:
+    """
+    Read a file as text in whichever encoding it's in, or return None without
+    reading the rest of it if it's binary
+    """
+    with open(filename, "rb") as f:
+        block = f.read(SNIFF_SIZE)
+        encoding = detect_encoding(block)
+        if encoding is None:
+            return None
+
+        size = os.fstat(f.fileno()).st_size
+        if size <= len(block):
+            return decode_text(block, encoding)
+        if size < MMAP_SIZE:
+            return decode_text(block + f.read(), encoding)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return decode_text(data, encoding)
+
+def format_size(size: int) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024 or unit == "MiB":
+            break
+        size /= 1024 # type: ignore
+    return f"{size} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+
+@dataclass
+class ExcerptLimits:
+    # Limits of kept lines and of their size in bytes (as UTF-8), None for no limit
+    max_lines: Optional[int] = None
+    max_bytes: Optional[int] = None
+
+@dataclass
+class TextExcerpt:
+    """
+    Start and end of a text file, with the count of lines which were left
+    out between them
+    """
+    head: list[str]
+    tail: list[str] = field(default_factory=list)
+    omitted_lines: int = 0
+
+    def get_text(self, omitted_label: str) -> str:
+        """
+        Join the excerpt back into text, `omitted_label` is put in place of
+        the left out lines. It's formatted with their count as "lines".
+        """
+        if not self.omitted_lines:
+            return "\n".join(self.head + self.tail)
+        return "\n".join(self.head + [omitted_label.format(lines=self.omitted_lines)] + self.tail)
+
+def split_limit(limit: Optional[int]) -> tuple[float, float]:
+    if limit is None:
+        return math.inf, math.inf
+    return limit - limit // 2, limit // 2
+
+def take_excerpt(lines: Iterable[str], limits: ExcerptLimits) -> TextExcerpt:
+    """
+    Keep the first and the last lines which fit into half of the limits
+    each. Lines are consumed one by one, only the kept ones are in memory.
+    """
+    head_lines, tail_lines = split_limit(limits.max_lines)
+    head_bytes, tail_bytes = split_limit(limits.max_bytes)
+
+    head: list[str] = []
+    tail: deque[tuple[str, int]] = deque()
+    size = 0
+    total = 0
+    lines = iter(lines)
+    for line in lines:
+        line_size = len(line.encode("utf-8")) + 1
+        total += 1
+        if len(head) < head_lines and size + line_size <= head_bytes:
+            head.append(line)
+            size += line_size
+            continue
+        tail.append((line, line_size))
+        break
+
+    size = sum(line_size for _, line_size in tail)
+    for line in lines:
+        line_size = len(line.encode("utf-8")) + 1
+        total += 1
+        tail.append((line, line_size))
+        size += line_size
+        # Drop the oldest lines, which don't fit in any more
+        while tail and (len(tail) > tail_lines or size > tail_bytes):
+            size -= tail.popleft()[1]
+    if tail and (len(tail) > tail_lines or size > tail_bytes):
+        tail.clear()
+
+    kept_tail = [line for line, _ in tail]
+    return TextExcerpt(head, kept_tail, total - len(head) - len(kept_tail))
+
+def excerpt_stream(f: BinaryIO, encoding: str, limits: ExcerptLimits) -> TextExcerpt:
+    """
+    `take_excerpt` for encodings in which newlines are single bytes. Lines
+    after the start are only counted, without decoding them, and just enough
+    of the end of the file to fill the tail is kept.
+    """
+    head_lines, tail_lines = split_limit(limits.max_lines)
+    head_bytes, tail_bytes = split_limit(limits.max_bytes)
+
+    head: list[bytes] = []
+    size = 0
+    line = b""
+    while len(head) < head_lines:
+        # Only as much as could still fit, so a huge line isn't read whole
+        line = f.readline(int(head_bytes - size) + 1)
+        if not line or size + len(line) > head_bytes:
+            break
+        head.append(line)
+        size += len(line)
+        line = b""
+
+    chunks: deque[bytes] = deque([line])
+    kept_size, kept_lines = len(line), line.count(b"\n")
+    total = len(head)
+    ends_with_newline = not line or line.endswith(b"\n")
+    while chunk := f.read(READ_SIZE):
+        chunks.append(chunk)
+        kept_size += len(chunk)
+        kept_lines += chunk.count(b"\n")
+        ends_with_newline = chunk.endswith(b"\n")
+        # Chunks at the front are dropped while the rest is enough for the tail
+        while len(chunks) > 1 and (kept_size - len(chunks[0]) > tail_bytes or kept_lines - chunks[0].count(b"\n") > tail_lines):
+            first = chunks.popleft()
+            kept_size -= len(first)
+            kept_lines -= first.count(b"\n")
+            total += first.count(b"\n")
+
+    data = b"".join(chunks)
+    lines = data.split(b"\n")
+    if ends_with_newline:
+        lines.pop()
+    total += len(lines)
+
+    tail: deque[bytes] = deque()
+    size = 0
+    for line in reversed(lines):
+        if len(tail) + 1 > tail_lines or size + len(line) + 1 > tail_bytes:
+            break
+        tail.appendleft(line)
+        size += len(line) + 1
+
+    def decode(line: bytes) -> str:
+        return codecs.decode(line, encoding, "replace").rstrip("\n").rstrip("\r")
+
+    return TextExcerpt(list(map(decode, head)), list(map(decode, tail)), total - len(head) - len(tail))
+
+def read_text_excerpt(filename: str, limits: ExcerptLimits) -> Optional[TextExcerpt]:
+    """
+    Like `read_text_file`, but only the start and the end of files which are
+    over the limits are kept. Big files are streamed, never read whole.
+    """
+    with open(filename, "rb") as f:
+        encoding = detect_encoding(f.read(SNIFF_SIZE))
+        if encoding is None:
+            return None
+        size = os.fstat(f.fileno()).st_size
+        if limits.max_bytes is not None and size > limits.max_bytes and encoding not in ("utf-16", "utf-32"):
+            f.seek(0)
+            return excerpt_stream(f, encoding, limits)
+
+    # Without a byte limit the file could be of any size, only lines are kept
+    if limits.max_bytes is not None and size <= limits.max_bytes:
+        text = read_text_file(filename)
+        if text.endswith("\n"): # type: ignore
+            text = text[:-1] # type: ignore
+        return take_excerpt(text.split("\n"), limits) # type: ignore
+
+    with open(filename, "r", encoding=encoding, errors="replace") as f:
+        return take_excerpt((line.rstrip("\n") for line in f), limits)
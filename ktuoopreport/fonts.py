@@ -0,0 +1,100 @@
+from typing import Optional
+from fpdf.ttfonts import TTFontFile
+import hashlib
+import pickle
+import os.path as path
+import os
+
+from .layout import fingerprint_path
+
+# Characters which are put into every font subset in the shared subset mode:
+# ascii, latin-1, Lithuanian letters and common punctuation and symbols
+SHARED_CHARACTERS = (
+    "".join(map(chr, range(0x20, 0x7F)))
+    + "".join(map(chr, range(0xA0, 0x100)))
+    + "ĄČĘĖĮŠŲŪŽąčęėįšųūž"
+    + "–—‘’‚“”„†‡•…‰‹›€™№←↑→↓−∞≈≠≤≥"
+)
+
+# Everything that fpdf uses from a TTFontFile after `makeSubset`: the subset
+# font file, its mapping of characters to glyphs and the highest character
+SubsetEntry = tuple[bytes, dict[int, int], int]
+
+class FontSubsetCache:
+    """
+    Subsets of fonts which were embedded into pdfs, keyed by the font file and
+    the characters (with their codes) in the subset. They are kept in memory,
+    and in `directory` if it's given, so they could be shared between runs.
+
+    Every report uses a slightly different set of characters. With
+    `shared_subset` fonts get all of SHARED_CHARACTERS upfront, so most
+    reports end up with the same subsets and none of them have to be made.
+    """
+    directory: Optional[str]
+    shared_subset: bool
+    entries: dict[str, SubsetEntry]
+
+    def __init__(self, directory: Optional[str] = None, shared_subset: bool = False) -> None:
+        self.directory = directory
+        self.shared_subset = shared_subset
+        self.entries = {}
+
+    def __deepcopy__(self, memo):
+        # Shared by copies of the pdf which `unbreakable` makes
+        return self
+
+    def get_key(self, filename: str, subset: dict[int, int]) -> str:
+        digest = hashlib.sha1()
+        fingerprint_path(path.abspath(filename), digest)
+        digest.update(repr(sorted(subset.items())).encode())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[SubsetEntry]:
+        entry = self.entries.get(key)
+        if entry is not None or self.directory is None:
+            return entry
+
+        filename = path.join(self.directory, f"{key}.pkl")
+        if not path.isfile(filename):
+            return None
+        try:
+            with open(filename, "rb") as f:
+                entry = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            # Broken entries are treated as missing
+            return None
+        self.entries[key] = entry # type: ignore
+        return entry
+
+    def put(self, key: str, entry: SubsetEntry):
+        self.entries[key] = entry
+        if self.directory is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with open(path.join(self.directory, f"{key}.pkl"), "wb") as f:
+            pickle.dump(entry, f)
+
+class CachedTTFontFile(TTFontFile):
+    """
+    A font which looks up its subset in `cache` instead of making it from the
+    font file, PatchedFPDF embeds fonts with these.
+    """
+    def __init__(self, cache: FontSubsetCache) -> None:
+        super().__init__()
+        self.cache = cache
+
+    def makeSubset(self, file, subset):
+        key = self.cache.get_key(file, subset)
+        entry = self.cache.get(key)
+        if entry is None:
+            font_stream = super().makeSubset(file, subset)
+            entry = (font_stream, self.codeToGlyph, self.maxUni)
+            self.cache.put(key, entry)
+
+        font_stream, code_to_glyph, self.maxUni = entry
+        self.codeToGlyph = dict(code_to_glyph)
+        return font_stream
+
+# Used by pdfs which were not given a cache, so that generating many reports
+# in one process would still share subsets
+default_subset_cache = FontSubsetCache()
@@ -0,0 +1,204 @@
+from base64 import b64encode
+from contextlib import contextmanager
+from html import escape
+from typing import Optional
+from pygments import highlight
+from pygments.formatters import HtmlFormatter
+
+from .document import Document, DocumentImage, TableGroup, TitlePage, encode_image, write_if_changed
+from .markdown import Span, parse_markdown
+from .utils import get_lexer
+
+class HtmlDocument(Document):
+    """
+    A single self contained html page, meant for quickly previewing a report.
+    Nothing gets laid out into pages, and images are embedded into the page
+    as they are.
+    """
+    stylesheet: str = """
+body { font-family: "Times New Roman", serif; font-size: 12pt; max-width: 50em; margin: 2em auto; }
+h1, h2, h3, h4 { font-family: Arial, sans-serif; }
+.title-page { text-align: center; margin-bottom: 4em; }
+.title-page .people { text-align: left; margin-left: 50%; padding: 1em 0; }
+.page-break { break-before: page; }
+.blank-line { height: 1.15em; }
+pre { font-family: "Courier New", monospace; font-size: 10pt; white-space: pre-wrap; }
+figure { margin: 1em 0; }
+figure img { max-width: 100%; }
+figure.full-width img { width: 100%; }
+figcaption { font-style: italic; margin-left: 1.27cm; }
+table { border-collapse: collapse; width: 100%; }
+th, td { border: 1px solid black; padding: 0.2em 0.4em; vertical-align: top; }
+nav li.level-0 { font-weight: bold; }
+"""
+    image_formats: tuple[str, ...] = ("PNG", "JPEG", "GIF")
+
+    title: str
+    parts: list[str]
+    # Where the table of contents should be placed, and its title
+    toc: Optional[tuple[int, str]]
+    # Level, name and id of each section
+    headings: list[tuple[int, str, str]]
+    # Stylesheets for syntax highlighting, keyed by theme
+    code_styles: dict[str, str]
+
+    def __init__(self) -> None:
+        self.section_levels = [1]
+        self.title = ""
+        self.parts = []
+        self.toc = None
+        self.headings = []
+        self.code_styles = {}
+
+    def add_title_page(self, title_page: TitlePage):
+        self.title = title_page.title
+        people = "".join(
+            f"<p><strong>{escape(name)}</strong><br>{escape(role)}</p>"
+            for name, role in title_page.people
+        )
+        self.parts.append(
+            '<header class="title-page">'
+            f'<img src="{get_image_url(title_page.university_icon, self.image_formats)}" height="77">'
+            f"<p><strong>{escape(title_page.university_name)}</strong><br>{escape(title_page.faculty_name)}</p>"
+            f"<h1>{escape(title_page.title)}</h1>"
+            f"<p>{escape(title_page.sub_title)}</p>"
+            f'<div class="people">{people}</div>'
+            f"<p><strong>{escape(title_page.footer)}</strong></p>"
+            "</header>"
+        )
+
+    def add_table_of_contents(self, title: str, section_count: int, subsection_count: int):
+        # Filled in when saving, after all sections are known
+        self.toc = (len(self.parts), title)
+        self.parts.append("")
+
+    def add_page(self):
+        self.parts.append('<div class="page-break"></div>')
+
+    def start_section(self, name: str, level: int):
+        if not name:
+            return
+        section_id = f"section-{len(self.headings) + 1}"
+        self.headings.append((level, name, section_id))
+        tag = f"h{min(level + 2, 6)}"
+        self.parts.append(f'<{tag} id="{section_id}">{escape(name)}</{tag}>')
+
+    def newline(self, height: Optional[float] = None):
+        self.parts.append('<div class="blank-line"></div>')
+
+    def add_markdown(self, text: str):
+        # Tags of lists which are currently open, one per nesting level
+        open_lists: list[str] = []
+
+        def close_lists(level: int):
+            while len(open_lists) > level:
+                self.parts.append(f"</{open_lists.pop()}>")
+
+        for block in parse_markdown(text):
+            if block.kind == "bullet" or block.kind == "numbered":
+                tag = "ul" if block.kind == "bullet" else "ol"
+                close_lists(block.level + 1)
+                if len(open_lists) == block.level + 1 and open_lists[-1] != tag:
+                    close_lists(block.level)
+                while len(open_lists) < block.level + 1:
+                    open_lists.append(tag)
+                    self.parts.append(f"<{tag}>")
+                value = f' value="{block.number}"' if block.kind == "numbered" else ""
+                self.parts.append(f"<li{value}>{render_spans(block.spans)}</li>")
+                continue
+
+            close_lists(0)
+            if block.kind == "code":
+                self.add_listing(block.text, block.language)
+            elif block.kind == "heading":
+                tag = f"h{min(block.level + 3, 6)}"
+                self.parts.append(f"<{tag}>{render_spans(block.spans)}</{tag}>")
+            else:
+                self.parts.append(f"<p>{render_spans(block.spans)}</p>")
+        close_lists(0)
+
+    def add_listing(self, text: str, language: Optional[str] = None, theme: str = "vs"):
+        if not language:
+            self.parts.append(f"<pre>{escape(text)}</pre>")
+            return
+
+        css_class = f"highlight-{theme}"
+        formatter = HtmlFormatter(style=theme, cssclass=css_class)
+        if theme not in self.code_styles:
+            self.code_styles[theme] = formatter.get_style_defs(f".{css_class}")
+        self.parts.append(highlight(text, get_lexer(language), formatter))
+
+    def add_figure(
+            self,
+            image: DocumentImage,
+            numbering_label: str,
+            label: Optional[str] = None,
+            full_width: bool = False
+        ):
+        css_class = ' class="full-width"' if full_width else ""
+        caption = escape(self.next_numbering(numbering_label))
+        label_html = f"<p>{escape(label)}</p>" if label else ""
+        self.parts.append(
+            f"<figure{css_class}>{label_html}"
+            f'<img src="{get_image_url(image, self.image_formats)}">'
+            f"<figcaption>{caption}</figcaption></figure>"
+        )
+
+    def add_table(self, headers: list[str], groups: list[TableGroup]):
+        rows = ["<tr>" + "".join(f"<th>{escape(header)}</th>" for header in headers) + "</tr>"]
+        for group_name, group_rows in groups:
+            for i, row in enumerate(group_rows):
+                cells = "".join(f"<td>{escape(value)}</td>" for value in row)
+                if i == 0:
+                    cells = f'<td rowspan="{len(group_rows)}">{escape(group_name)}</td>' + cells
+                rows.append(f"<tr>{cells}</tr>")
+        self.parts.append("<table>" + "".join(rows) + "</table>")
+
+    @contextmanager
+    def labeled_block(self, label: str):
+        self.parts.append(f"<p>{escape(label)}</p>")
+        yield
+
+    def render_toc(self, title: str) -> str:
+        # Same depth as in pdfs
+        items = "".join(
+            f'<li class="level-{level}"><a href="#{section_id}">{escape(name)}</a></li>'
+            for level, name, section_id in self.headings
+            if level <= 1
+        )
+        return f'<nav><h2>{escape(title)}</h2><ul style="list-style: none">{items}</ul></nav>'
+
+    def save_to_file(self, filename: str) -> bool:
+        parts = list(self.parts)
+        if self.toc:
+            index, title = self.toc
+            parts[index] = self.render_toc(title)
+
+        styles = self.stylesheet + "".join(self.code_styles.values())
+        html = (
+            "<!DOCTYPE html>\n<html>\n<head>\n"
+            '<meta charset="utf-8">\n'
+            f"<title>{escape(self.title)}</title>\n"
+            f"<style>{styles}</style>\n"
+            "</head>\n<body>\n"
+            + "\n".join(parts)
+            + "\n</body>\n</html>\n"
+        )
+        return write_if_changed(filename, html.encode("utf-8"))
+
+def get_image_url(image: DocumentImage, formats: tuple[str, ...]) -> str:
+    data, image_format = encode_image(image, formats)
+    return f"data:image/{image_format.lower()};base64,{b64encode(data).decode()}"
+
+def render_spans(spans: list[Span]) -> str:
+    html = []
+    for span in spans:
+        text = escape(span.text)
+        if span.code:
+            text = f"<code>{text}</code>"
+        if span.italic:
+            text = f"<em>{text}</em>"
+        if span.bold:
+            text = f"<strong>{text}</strong>"
+        html.append(text)
+    return "".join(html)
@@ -0,0 +1,198 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Optional, Union
+from PIL import Image as ImageUtils
+from PIL.Image import Image
+import hashlib
+
+from .document import DocumentImage
+from .render_pool import RenderedImage
+
+# Decoded image or encoded image data
+ImageData = Union[Image, bytes]
+
+# Encoded image data and its format ("PNG" or "JPEG")
+EncodedImage = tuple[bytes, str]
+
+# Images with at most this many colors (drawings, most screenshots) are
+# always kept lossless
+PALETTE_COLORS = 256
+
+JPEG_QUALITY = 85
+
+# JPEG blurs text, so it's only picked when it's this much smaller than PNG
+JPEG_SIZE_RATIO = 0.25
+
+def load_image_data(image: DocumentImage) -> ImageData:
+    if isinstance(image, str):
+        with open(image, "rb") as f:
+            return f.read()
+    if isinstance(image, BytesIO):
+        return image.getvalue()
+    if isinstance(image, RenderedImage):
+        return image.get_data()
+    return image
+
+def get_image_size(data: ImageData) -> tuple[int, int]:
+    if isinstance(data, Image):
+        return data.size
+    # Only the header is read
+    return ImageUtils.open(BytesIO(data)).size
+
+def get_image_key(data: ImageData, size: tuple[int, int]) -> str:
+    if isinstance(data, Image):
+        digest = hashlib.sha1(f"{data.mode} {data.size}".encode())
+        digest.update(data.tobytes())
+    else:
+        digest = hashlib.sha1(data)
+    digest.update(repr(size).encode())
+    return digest.hexdigest()
+
+def encode(image: Image, image_format: str, **options) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+def resample_image(data: ImageData, size: tuple[int, int]) -> EncodedImage:
+    """
+    Scale image down to fit into `size` and encode it again, without any of
+    its metadata. Images are never scaled up.
+    """
+    image = data if isinstance(data, Image) else ImageUtils.open(BytesIO(data))
+    source_format = None if isinstance(data, Image) else image.format
+
+    if image.mode not in ("L", "LA", "RGB", "RGBA"):
+        has_alpha = "transparency" in image.info or image.mode.endswith("A")
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    if image.mode in ("LA", "RGBA") and image.getchannel("A").getextrema() == (255, 255):
+        image = image.convert(image.mode[:-1])
+
+    resized = size[0] < image.width or size[1] < image.height
+    if resized:
+        image = image.resize((min(size[0], image.width), min(size[1], image.height)), ImageUtils.LANCZOS)
+
+    if source_format == "JPEG":
+        # Quantization tables of unchanged JPEGs are kept, so they don't lose any quality
+        quality = "keep" if image.format == "JPEG" else JPEG_QUALITY
+        return encode(image, "JPEG", quality=quality), "JPEG" # type: ignore
+
+    png = encode(image, "PNG")
+    if image.mode in ("LA", "RGBA") or image.getcolors(PALETTE_COLORS) is not None:
+        return png, "PNG"
+
+    jpeg = encode(image, "JPEG", quality=JPEG_QUALITY)
+    if len(jpeg) <= len(png) * JPEG_SIZE_RATIO:
+        return jpeg, "JPEG"
+    return png, "PNG"
+
+def get_jpeg_info(data: bytes) -> Optional[dict]:
+    """
+    fpdf decodes JPEGs and compresses them again. This returns fpdf's image
+    info, which embeds the JPEG data as it is, or None if it can't be.
+    """
+    if not data.startswith(b"\xff\xd8"):
+        return None
+    image = ImageUtils.open(BytesIO(data))
+    if image.format != "JPEG" or image.mode not in ("L", "RGB"):
+        return None
+    return {
+        "data": data,
+        "w": image.width,
+        "h": image.height,
+        "cs": "DeviceGray" if image.mode == "L" else "DeviceRGB",
+        "bpc": 8,
+        "f": "DCTDecode",
+        "pal": "",
+        "trns": "",
+    }
+
+def add_row_filters(data: bytes, row_size: int) -> bytes:
+    """
+    Put the PNG filter type "None" in front of every row, which fpdf's
+    /Predictor 15 expects
+    """
+    return b"".join(b"\0" + data[i:i+row_size] for i in range(0, len(data), row_size))
+
+def get_flate_info(data: ImageData) -> Optional[dict]:
+    """
+    Same image info as fpdf makes for images which it compresses with zlib,
+    but the pixel data is left uncompressed and marked with "uncompressed",
+    so all images could be compressed at once when the pdf is written out.
+    Returns None for JPEGs and anything that can't be decoded.
+    """
+    try:
+        image = data if isinstance(data, Image) else ImageUtils.open(BytesIO(data))
+    except (OSError, ValueError):
+        return None
+    if image.format == "JPEG":
+        return None
+    if image.mode not in ("L", "LA", "RGB", "RGBA"):
+        image = image.convert("RGBA")
+
+    channels = 1 if image.mode in ("L", "LA") else 3
+    info = {}
+    if image.mode in ("LA", "RGBA"):
+        alpha = image.getchannel("A")
+        if alpha.getextrema() != (255, 255):
+            info["smask"] = add_row_filters(alpha.tobytes(), image.width)
+        image = image.convert(image.mode[:-1])
+    info.update({
+        "data": add_row_filters(image.tobytes(), image.width * channels),
+        "uncompressed": True,
+        "w": image.width,
+        "h": image.height,
+        "cs": "DeviceGray" if channels == 1 else "DeviceRGB",
+        "bpc": 8,
+        "f": "FlateDecode",
+        "dp": f"/Predictor 15 /Colors {channels} /BitsPerComponent 8 /Columns {image.width}",
+        "pal": "",
+        "trns": "",
+    })
+    return info
+
+class ImageCache:
+    """
+    Images resampled for embedding, keyed by their content and the size in
+    pixels they were resampled to
+    """
+    max_workers: Optional[int]
+    entries: dict[str, EncodedImage]
+
+    def __init__(self, max_workers: Optional[int] = None) -> None:
+        self.max_workers = max_workers
+        self.entries = {}
+
+    def __deepcopy__(self, memo):
+        # Shared by copies of the pdf which `unbreakable` makes
+        return self
+
+    def get(self, data: ImageData, size: tuple[int, int]) -> EncodedImage:
+        key = get_image_key(data, size)
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = resample_image(data, size)
+            self.entries[key] = entry
+        return entry
+
+    def prepare(self, images: list[tuple[ImageData, tuple[int, int]]]):
+        """
+        Resample images which are not in the cache yet, in parallel. Pillow
+        releases the GIL while resizing and encoding, so threads are enough.
+        """
+        missing = {}
+        for data, size in images:
+            key = get_image_key(data, size)
+            if key not in self.entries:
+                missing[key] = (data, size)
+        if len(missing) <= 1:
+            for key, (data, size) in missing.items():
+                self.entries[key] = resample_image(data, size)
+            return
+
+        with ThreadPoolExecutor(self.max_workers) as executor:
+            results = executor.map(lambda item: resample_image(*item), missing.values())
+            for key, entry in zip(missing, results):
+                self.entries[key] = entry
+
+# Used by pdfs which were not given a cache
+default_image_cache = ImageCache()
@@ -0,0 +1,229 @@
+from contextlib import contextmanager
+from typing import Optional
+from pygments import highlight
+from pygments.formatters import LatexFormatter
+import os.path as path
+import os
+
+from .document import Document, DocumentImage, TableGroup, TitlePage, encode_image, write_if_changed
+from .markdown import Span, parse_markdown
+from .utils import get_lexer
+
+LATEX_ESCAPES = str.maketrans({
+    "\\": r"\textbackslash{}",
+    "{": r"\{",
+    "}": r"\}",
+    "$": r"\$",
+    "&": r"\&",
+    "#": r"\#",
+    "^": r"\^{}",
+    "_": r"\_",
+    "%": r"\%",
+    "~": r"\textasciitilde{}",
+})
+
+def escape_latex(text: str) -> str:
+    return text.translate(LATEX_ESCAPES)
+
+class LatexDocument(Document):
+    """
+    LaTeX source of the report (for pdflatex), for when it needs to be
+    typeset properly or changed by hand. Images are written as separate files
+    into `image_directory`, which must be placed next to the .tex file.
+    """
+    preamble: str = r"""\documentclass[12pt,a4paper]{article}
+\usepackage[utf8]{inputenc}
+\usepackage[T1]{fontenc}
+\usepackage{lmodern}
+\usepackage[left=2.5cm,right=1cm,top=1cm,bottom=1.5cm,includefoot]{geometry}
+\usepackage{graphicx}
+\usepackage{xcolor}
+\usepackage{fancyvrb}
+\usepackage{multirow}
+\usepackage{array}
+\setcounter{tocdepth}{2}
+\setlength{\parindent}{0pt}
+% Image at its own size, unless it's wider than the text
+\newsavebox{\imagebox}
+\newcommand{\fittedimage}[1]{\sbox{\imagebox}{\includegraphics{#1}}%
+  \ifdim\wd\imagebox>\linewidth\includegraphics[width=\linewidth]{#1}\else\usebox{\imagebox}\fi}
+"""
+    section_commands: tuple[str, ...] = ("section", "subsection", "subsubsection", "paragraph")
+    image_formats: tuple[str, ...] = ("PNG", "JPEG")
+
+    image_directory: str
+    image_count: int
+    parts: list[str]
+    # Highlighting commands for each used theme
+    code_styles: dict[str, str]
+
+    def __init__(self, image_directory: str) -> None:
+        self.section_levels = [1]
+        self.image_directory = image_directory
+        self.image_count = 0
+        self.parts = []
+        self.code_styles = {}
+
+    def save_image(self, image: DocumentImage) -> str:
+        """
+        Write image into the image directory and return its path relative to
+        the .tex file
+        """
+        data, image_format = encode_image(image, self.image_formats)
+        self.image_count += 1
+        extension = "jpg" if image_format == "JPEG" else "png"
+        name = f"image-{self.image_count}.{extension}"
+
+        os.makedirs(self.image_directory, exist_ok=True)
+        with open(path.join(self.image_directory, name), "wb") as f:
+            f.write(data)
+        return f"{path.basename(self.image_directory)}/{name}"
+
+    def add_title_page(self, title_page: TitlePage):
+        r, g, b = title_page.seperator_color
+        seperator = rf"\textcolor[RGB]{{{r},{g},{b}}}{{\rule{{\linewidth}}{{0.4pt}}}}"
+        people = r"\par\bigskip ".join(
+            rf"\textbf{{{escape_latex(name)}}}\\{escape_latex(role)}"
+            for name, role in title_page.people
+        )
+        icon = self.save_image(title_page.university_icon)
+        self.parts.append(
+            "\\begin{titlepage}\n\\centering\n"
+            f"\\includegraphics[width=1.78cm]{{{icon}}}\\par\\medskip\n"
+            f"\\textbf{{{escape_latex(title_page.university_name)}}}\\par\n"
+            f"{escape_latex(title_page.faculty_name)}\\par\n"
+            "\\vfill\n"
+            f"{{\\Large\\bfseries {escape_latex(title_page.title)}\\par}}\n"
+            f"{{\\large {escape_latex(title_page.sub_title)}\\par}}\n"
+            "\\vfill\n"
+            "\\hfill\\begin{minipage}{0.45\\linewidth}\n"
+            f"{seperator}\\par\\bigskip\n{people}\\par\\bigskip\n{seperator}\n"
+            "\\end{minipage}\n"
+            "\\vfill\n"
+            f"\\textbf{{{escape_latex(title_page.footer)}}}\n"
+            "\\end{titlepage}"
+        )
+
+    def add_table_of_contents(self, title: str, section_count: int, subsection_count: int):
+        self.parts.append(
+            f"\\renewcommand{{\\contentsname}}{{{escape_latex(title)}}}\n"
+            "\\tableofcontents"
+        )
+
+    def add_page(self):
+        self.parts.append("\\clearpage")
+
+    def start_section(self, name: str, level: int):
+        if not name:
+            return
+        # Numbers are already part of section names
+        command = self.section_commands[min(level, len(self.section_commands) - 1)]
+        name = escape_latex(name)
+        self.parts.append(f"\\{command}*{{{name}}}\n\\addcontentsline{{toc}}{{{command}}}{{{name}}}")
+
+    def newline(self, height: Optional[float] = None):
+        self.parts.append("\\par\\vspace{\\baselineskip}")
+
+    def add_markdown(self, text: str):
+        # Environments of lists which are currently open, one per nesting level
+        open_lists: list[str] = []
+
+        def close_lists(level: int):
+            while len(open_lists) > level:
+                self.parts.append(f"\\end{{{open_lists.pop()}}}")
+
+        for block in parse_markdown(text):
+            if block.kind == "bullet" or block.kind == "numbered":
+                environment = "itemize" if block.kind == "bullet" else "enumerate"
+                close_lists(block.level + 1)
+                if len(open_lists) == block.level + 1 and open_lists[-1] != environment:
+                    close_lists(block.level)
+                while len(open_lists) < block.level + 1:
+                    open_lists.append(environment)
+                    self.parts.append(f"\\begin{{{environment}}}")
+                marker = f"[{block.number}.]" if block.kind == "numbered" else ""
+                self.parts.append(f"\\item{marker} {render_spans(block.spans)}")
+                continue
+
+            close_lists(0)
+            if block.kind == "code":
+                self.add_listing(block.text, block.language)
+            elif block.kind == "heading":
+                self.parts.append(f"{{\\large\\bfseries {render_spans(block.spans)}\\par}}")
+            else:
+                self.parts.append(render_spans(block.spans) + "\\par")
+        close_lists(0)
+
+    def add_listing(self, text: str, language: Optional[str] = None, theme: str = "vs"):
+        if not language:
+            self.parts.append(f"\\begin{{Verbatim}}[fontsize=\\small]\n{text}\n\\end{{Verbatim}}")
+            return
+
+        # Each theme needs its own command names
+        prefix = "PY" + "".join(c for c in theme.title() if c.isalpha())
+        formatter = LatexFormatter(style=theme, commandprefix=prefix, verboptions="fontsize=\\small")
+        if theme not in self.code_styles:
+            self.code_styles[theme] = formatter.get_style_defs()
+        self.parts.append(highlight(text, get_lexer(language), formatter).rstrip())
+
+    def add_figure(
+            self,
+            image: DocumentImage,
+            numbering_label: str,
+            label: Optional[str] = None,
+            full_width: bool = False
+        ):
+        filename = self.save_image(image)
+        caption = escape_latex(self.next_numbering(numbering_label))
+        command = "\\includegraphics[width=\\linewidth]" if full_width else "\\fittedimage"
+        label_tex = f"{escape_latex(label)}\\par\\medskip\n" if label else ""
+        self.parts.append(
+            "\\begin{minipage}{\\linewidth}\n"
+            f"{label_tex}{command}{{{filename}}}\\par\n"
+            f"\\hspace*{{1.27cm}}\\textit{{{caption}}}\n"
+            "\\end{minipage}\\par"
+        )
+
+    def add_table(self, headers: list[str], groups: list[TableGroup]):
+        column_width = f"\\dimexpr\\linewidth/{len(headers)}-2\\tabcolsep\\relax"
+        columns = "|" + "|".join(f"p{{{column_width}}}" for _ in headers) + "|"
+
+        lines = [f"\\begin{{tabular}}{{{columns}}}", "\\hline"]
+        lines.append(" & ".join(f"\\centering\\arraybackslash\\textbf{{{escape_latex(header)}}}" for header in headers) + " \\\\ \\hline")
+        for group_name, rows in groups:
+            for i, row in enumerate(rows):
+                first = f"\\multirow{{{len(rows)}}}{{=}}{{{escape_latex(group_name)}}}" if i == 0 else ""
+                cells = " & ".join([first] + [escape_latex(value) for value in row])
+                is_last = i + 1 == len(rows)
+                rule = "\\hline" if is_last else f"\\cline{{2-{len(headers)}}}"
+                lines.append(f"{cells} \\\\ {rule}")
+        lines.append("\\end{tabular}")
+        self.parts.append("\n".join(lines))
+
+    @contextmanager
+    def labeled_block(self, label: str):
+        self.parts.append(escape_latex(label) + "\\par\\medskip")
+        yield
+
+    def save_to_file(self, filename: str) -> bool:
+        tex = (
+            self.preamble
+            + "".join(styles + "\n" for styles in self.code_styles.values())
+            + "\\begin{document}\n"
+            + "\n\n".join(self.parts)
+            + "\n\\end{document}\n"
+        )
+        return write_if_changed(filename, tex.encode("utf-8"))
+
+def render_spans(spans: list[Span]) -> str:
+    tex = []
+    for span in spans:
+        text = escape_latex(span.text)
+        if span.code:
+            text = f"\\texttt{{{text}}}"
+        if span.italic:
+            text = f"\\textit{{{text}}}"
+        if span.bold:
+            text = f"\\textbf{{{text}}}"
+        tex.append(text)
+    return "".join(tex)
@@ -0,0 +1,286 @@
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import Any, Optional, Union
+from PIL import Image as ImageUtils
+from PIL.Image import Image
+import hashlib
+import json
+import os.path as path
+import os
+
+from .spool import default_image_spool
+
+# Bump when the format of elements changes, so old cached sections are ignored
+LAYOUT_VERSION = 1
+
+# A single drawn thing on a page. Elements are plain dicts, so that they could
+# be edited by hand after saving. Every element has a "type":
+#   text    - {x, y, w, h, text, font: [family, style, size], color?, align?,
+#              border?, draw?, line_width?, fill?, numbering?: [label, index]}
+#   image   - {x, y, w, h, image: id of image in `Layout.images`}
+#   line    - {x1, y1, x2, y2, draw?, line_width}
+#   rects   - {rects: [[x, y, w, h], ...], draw?, line_width}
+#   outline - {name, level, y}
+# Positions are absolute and in the unit of the layout. Colors are RGB lists,
+# black is left out.
+Element = dict[str, Any]
+
+# File path, decoded image, or encoded image bytes
+ImageSource = Union[str, Image, bytes]
+
+# Directory names which don't affect how a section looks
+IGNORED_DIRECTORIES = ("bin", "obj", ".git", ".vs")
+
+@dataclass
+class Page:
+    elements: list[Element] = field(default_factory=list)
+    # Drawn by the footer function. Kept apart from the rest, so that cached
+    # sections could be placed into a document, which draws its own footers.
+    footer: list[Element] = field(default_factory=list)
+
+class Layout:
+    """
+    Everything which was drawn into a pdf, page by page. It's recorded while
+    the report is being generated, and can be saved, edited and turned back
+    into a pdf without building or running anything.
+
+    A layout can also be a slice of a bigger document (a single section), in
+    which case `start` and `end` hold the numbering state of the document
+    around it.
+    """
+    unit: str
+    page_size: tuple[float, float]
+    # (family, style, filename, unicode)
+    fonts: list[tuple[str, str, str, bool]]
+    images: dict[str, ImageSource]
+    pages: list[Page]
+
+    start: dict[str, Any]
+    end: dict[str, Any]
+
+    last_element: Optional[Element]
+
+    def __init__(self, unit: str, page_size: tuple[float, float]) -> None:
+        self.unit = unit
+        self.page_size = page_size
+        self.fonts = []
+        self.images = {}
+        self.pages = []
+        self.start = {}
+        self.end = {}
+        self.last_element = None
+
+    def __deepcopy__(self, memo):
+        # fpdf deep copies the whole document when `unbreakable` starts. The
+        # layout is shared instead, and rewound with `mark` and `truncate`.
+        return self
+
+    def get_page(self, number: int) -> Page:
+        while len(self.pages) < number:
+            self.pages.append(Page())
+        return self.pages[number-1]
+
+    def add(self, page_number: int, element: Element, in_footer: bool = False):
+        page = self.get_page(page_number)
+        if in_footer:
+            page.footer.append(element)
+        else:
+            page.elements.append(element)
+        self.last_element = element
+
+    def add_image(self, source: ImageSource) -> str:
+        """
+        Store image source and return its id
+        """
+        spooled_digest = default_image_spool.get_digest(source) if isinstance(source, str) else None
+        if spooled_digest is not None:
+            # Spooled files are named by the md5 of their data, so they get
+            # the same id as the data would in memory
+            image_id = spooled_digest
+        elif isinstance(source, str):
+            source = path.abspath(source)
+            image_id = hashlib.md5(source.encode()).hexdigest()
+        elif isinstance(source, Image):
+            digest = hashlib.md5(f"{source.mode}{source.size}".encode())
+            digest.update(source.tobytes())
+            image_id = digest.hexdigest()
+        else:
+            image_id = hashlib.md5(source).hexdigest()
+
+        self.images.setdefault(image_id, source)
+        return image_id
+
+    def mark(self) -> tuple[int, int, int]:
+        if not self.pages:
+            return 0, 0, 0
+        return len(self.pages), len(self.pages[-1].elements), len(self.pages[-1].footer)
+
+    def truncate(self, mark: tuple[int, int, int]):
+        """
+        Forget everything that was added after `mark` was taken
+        """
+        page_count, element_count, footer_count = mark
+        del self.pages[page_count:]
+        if self.pages:
+            del self.pages[-1].elements[element_count:]
+            del self.pages[-1].footer[footer_count:]
+        self.last_element = None
+
+    def slice(self, first_page: int, last_page: int, start: dict[str, Any], end: dict[str, Any]) -> "Layout":
+        """
+        Copy pages from first to last (inclusive) without their footers
+        """
+        layout = Layout(self.unit, self.page_size)
+        layout.fonts = list(self.fonts)
+        layout.start = start
+        layout.end = end
+        for page in self.pages[first_page-1:last_page]:
+            layout.pages.append(Page(list(page.elements)))
+            for element in page.elements:
+                if element["type"] == "image":
+                    layout.images[element["image"]] = self.images[element["image"]]
+        return layout
+
+    def save(self, filename: str, image_directory: Optional[str] = None):
+        """
+        Write layout as JSON, with one element per line. Images which only
+        exist in memory or in the image spool are written into
+        `image_directory` (by default next to the layout file) and referenced
+        relative to the layout file.
+        """
+        if image_directory is None:
+            image_directory = path.splitext(filename)[0] + "-images"
+        base_directory = path.dirname(path.abspath(filename))
+
+        image_files = {}
+        for image_id, source in self.images.items():
+            if isinstance(source, str) and default_image_spool.get_digest(source) is not None:
+                with open(source, "rb") as f:
+                    source = f.read()
+            if not isinstance(source, str):
+                source = save_image(source, image_id, image_directory)
+            image_files[image_id] = path.relpath(source, base_directory)
+
+        header = {
+            "version": LAYOUT_VERSION,
+            "unit": self.unit,
+            "page_size": self.page_size,
+            "fonts": self.fonts,
+            "images": image_files,
+            "start": self.start,
+            "end": self.end,
+        }
+
+        def dump(value) -> str:
+            return json.dumps(value, ensure_ascii=False)
+
+        with open(filename, "w", encoding="utf-8") as f:
+            f.write("{\n")
+            for key, value in header.items():
+                f.write(f"{dump(key)}: {dump(value)},\n")
+            f.write('"pages": [\n')
+            for i, page in enumerate(self.pages):
+                f.write("{\n")
+                for key in ("elements", "footer"):
+                    elements = getattr(page, key)
+                    f.write(f"{dump(key)}: [\n")
+                    f.write(",\n".join(dump(element) for element in elements))
+                    f.write("\n]" + (",\n" if key == "elements" else "\n"))
+                f.write("}" + (",\n" if i + 1 < len(self.pages) else "\n"))
+            f.write("]\n}\n")
+
+    @staticmethod
+    def load(filename: str) -> "Layout":
+        with open(filename, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        assert data.get("version") == LAYOUT_VERSION, f"Unsupported layout version in '{filename}'"
+
+        base_directory = path.dirname(path.abspath(filename))
+        layout = Layout(data["unit"], tuple(data["page_size"]))
+        layout.fonts = [tuple(font) for font in data["fonts"]] # type: ignore
+        layout.images = {
+            image_id: path.join(base_directory, image_file)
+            for image_id, image_file in data["images"].items()
+        }
+        layout.pages = [Page(page["elements"], page["footer"]) for page in data["pages"]]
+        layout.start = data["start"]
+        layout.end = data["end"]
+        return layout
+
+def save_image(source: Image|bytes, image_id: str, directory: str) -> str:
+    """
+    Images are content addressed, so an existing file is never rewritten
+    """
+    if isinstance(source, Image):
+        extension = "png"
+    else:
+        image_format = ImageUtils.open(BytesIO(source)).format
+        extension = (image_format or "img").lower()
+
+    filename = path.join(directory, f"{image_id}.{extension}")
+    if path.exists(filename):
+        return filename
+
+    os.makedirs(directory, exist_ok=True)
+    if isinstance(source, Image):
+        source.save(filename, "PNG")
+    else:
+        with open(filename, "wb") as f:
+            f.write(source)
+    return filename
+
+def fingerprint_path(filename: str, digest):
+    """
+    Add sizes and modification times of a file, or of all files in a folder,
+    into digest
+    """
+    if path.isfile(filename):
+        info = os.stat(filename)
+        digest.update(f"{filename}:{info.st_size}:{info.st_mtime_ns}\n".encode())
+    elif path.isdir(filename):
+        for root, dirs, files in os.walk(filename):
+            dirs[:] = sorted(d for d in dirs if d not in IGNORED_DIRECTORIES)
+            for name in sorted(files):
+                fingerprint_path(path.join(root, name), digest)
+
+class LayoutCache:
+    """
+    Stores layouts of sections keyed by everything they were made from: the
+    section fields and the files in the folders they point to. A cached
+    section can only be reused, if it starts on the same page and with the
+    same numbering as when it was cached. This is checked by the caller.
+    """
+    directory: str
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    @property
+    def image_directory(self) -> str:
+        return path.join(self.directory, "images")
+
+    def get_key(self, *parts: Any) -> str:
+        digest = hashlib.sha1(str(LAYOUT_VERSION).encode())
+        for part in parts:
+            digest.update(json.dumps(part, sort_keys=True, default=str).encode())
+
+            values = part.values() if isinstance(part, dict) else [part]
+            for value in values:
+                for item in (value if isinstance(value, list) else [value]):
+                    if isinstance(item, str) and path.exists(item):
+                        fingerprint_path(item, digest)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Layout]:
+        filename = path.join(self.directory, f"{key}.json")
+        if not path.isfile(filename):
+            return None
+        try:
+            return Layout.load(filename)
+        except (OSError, ValueError, KeyError, AssertionError):
+            # Broken or outdated entries are treated as missing
+            return None
+
+    def put(self, key: str, layout: Layout):
+        os.makedirs(self.directory, exist_ok=True)
+        layout.save(path.join(self.directory, f"{key}.json"), self.image_directory)
@@ -0,0 +1,299 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+# A small markdown parser, which only supports what is needed in reports:
+# paragraphs, headings, bullet and numbered lists, fenced code blocks and
+# bold/italic/code inline runs. Both block and inline parsing is done in a
+# single pass over the text (no regex), so it runs in linear time.
+# Emphasis is matched only against the nearest opener, which is simpler than
+# what CommonMark specifies, but is enough for task descriptions.
+
+@dataclass
+class Span:
+    text: str
+    bold: bool = False
+    italic: bool = False
+    code: bool = False
+
+@dataclass
+class Block:
+    # One of: "paragraph", "heading", "bullet", "numbered", "code"
+    kind: str
+    spans: list[Span] = field(default_factory=list)
+    # Heading level or list nesting level
+    level: int = 0
+    # Number of a numbered list item
+    number: int = 0
+    # Contents and language of a fenced code block
+    text: str = ""
+    language: Optional[str] = None
+
+PUNCTUATION = "!\"#$%&'()*+,-./:;<=>?@[\\]^_`{|}~"
+
+@dataclass
+class Delimiter:
+    char: str
+    count: int
+    can_open: bool
+    can_close: bool
+    # Filled in while matching delimiters
+    opens: list[str] = field(default_factory=list)
+    closes: list[str] = field(default_factory=list)
+
+SPECIAL_CHARACTERS = frozenset("\\`*_")
+
+def find_special_characters(text: str) -> list[int]:
+    return [i for i, c in enumerate(text) if c in SPECIAL_CHARACTERS]
+
+def find_backtick_runs(text: str, specials: list[int]) -> dict[int, list[int]]:
+    """
+    Returns starting positions of backtick runs grouped by run length
+    """
+    runs: dict[int, list[int]] = {}
+    n = len(text)
+    skip_until = -1
+    for i in specials:
+        if i < skip_until:
+            continue
+        c = text[i]
+        if c == "\\":
+            skip_until = i + 2
+        elif c == "`":
+            end = i
+            while end < n and text[end] == "`":
+                end += 1
+            runs.setdefault(end - i, []).append(i)
+            skip_until = end
+    return runs
+
+def tokenize_inline(text: str) -> list[str|Delimiter|Span]:
+    """
+    Split text into literal text, code spans and emphasis delimiters. Only
+    positions of special characters are visited, everything between them is
+    sliced out as literal text.
+    """
+    tokens: list[str|Delimiter|Span] = []
+    literal: list[str] = []
+
+    specials = find_special_characters(text)
+    backtick_runs = find_backtick_runs(text, specials)
+    # Index of the next unused run, for each run length. Runs are consumed
+    # from left to right, so each list is walked only once.
+    next_run = {length: 0 for length in backtick_runs}
+
+    def flush_literal():
+        if literal:
+            tokens.append("".join(literal))
+            literal.clear()
+
+    i = 0
+    n = len(text)
+    for special in specials:
+        if special < i:
+            continue
+        literal.append(text[i:special])
+        i = special
+
+        c = text[i]
+        if c == "\\":
+            if i + 1 < n and text[i+1] in PUNCTUATION:
+                literal.append(text[i+1])
+                i += 2
+            else:
+                literal.append(c)
+                i += 1
+        elif c == "`":
+            start = i
+            while i < n and text[i] == "`":
+                i += 1
+            length = i - start
+
+            # Find closing run of the same length
+            runs = backtick_runs[length]
+            while next_run[length] < len(runs) and runs[next_run[length]] <= start:
+                next_run[length] += 1
+            if next_run[length] < len(runs):
+                end = runs[next_run[length]]
+                next_run[length] += 1
+                flush_literal()
+                tokens.append(Span(text[i:end].strip(" "), code=True))
+                i = end + length
+            else:
+                literal.append(text[start:i])
+        else:
+            start = i
+            while i < n and text[i] == c:
+                i += 1
+            before = text[start-1] if start > 0 else " "
+            after = text[i] if i < n else " "
+            can_open = not after.isspace()
+            can_close = not before.isspace()
+            if c == "_" and before.isalnum() and after.isalnum():
+                # Underscores inside of words, like in snake_case
+                can_open = can_close = False
+            flush_literal()
+            tokens.append(Delimiter(c, i - start, can_open, can_close))
+
+    literal.append(text[i:])
+    flush_literal()
+    return tokens
+
+def match_delimiters(tokens: list[str|Delimiter|Span]):
+    """
+    Pair up opening and closing emphasis delimiters. Each kind of delimiter
+    character has its own stack, so only the nearest opener is checked.
+    """
+    openers: dict[str, list[Delimiter]] = {"*": [], "_": []}
+    for token in tokens:
+        if not isinstance(token, Delimiter):
+            continue
+
+        stack = openers[token.char]
+        if token.can_close:
+            while token.count > 0 and stack:
+                opener = stack[-1]
+                style = "bold" if opener.count >= 2 and token.count >= 2 else "italic"
+                width = 2 if style == "bold" else 1
+                opener.count -= width
+                token.count -= width
+                # Opener's characters are consumed from its end, so later
+                # matches wrap around the earlier ones
+                opener.opens.insert(0, style)
+                token.closes.append(style)
+                if opener.count == 0:
+                    stack.pop()
+
+        if token.can_open and token.count > 0:
+            stack.append(token)
+
+def parse_inline(text: str) -> list[Span]:
+    tokens = tokenize_inline(text)
+    match_delimiters(tokens)
+
+    spans: list[Span] = []
+    # Pieces of text of each span, joined at the end so that merging many
+    # pieces stays linear (None for code spans)
+    pieces: list[Optional[list[str]]] = []
+    bold = 0
+    italic = 0
+
+    def add_text(value: str):
+        if not value:
+            return
+        is_bold, is_italic = bold > 0, italic > 0
+        last_pieces = pieces[-1] if pieces else None
+        if last_pieces is not None and spans[-1].bold == is_bold and spans[-1].italic == is_italic:
+            last_pieces.append(value)
+        else:
+            spans.append(Span("", is_bold, is_italic))
+            pieces.append([value])
+
+    for token in tokens:
+        if isinstance(token, str):
+            add_text(token)
+        elif isinstance(token, Span):
+            token.bold, token.italic = bold > 0, italic > 0
+            spans.append(token)
+            pieces.append(None)
+        else:
+            for style in token.closes:
+                if style == "bold": bold -= 1
+                else: italic -= 1
+            # Unmatched delimiter characters are kept as text
+            leftover = token.char * token.count
+            if token.closes:
+                add_text(leftover)
+            for style in token.opens:
+                if style == "bold": bold += 1
+                else: italic += 1
+            if not token.closes:
+                add_text(leftover)
+
+    for span, span_pieces in zip(spans, pieces):
+        if span_pieces is not None:
+            span.text = "".join(span_pieces)
+    return spans
+
+def get_list_marker(line: str) -> Optional[tuple[str, int, int]]:
+    """
+    Returns kind, number and length of list item marker at the start of line
+    """
+    if len(line) >= 2 and line[0] in "*-+" and line[1] == " ":
+        return "bullet", 0, 2
+
+    i = 0
+    while i < len(line) and i < 9 and line[i].isdigit():
+        i += 1
+    if 0 < i and i + 1 < len(line) and line[i] in ".)" and line[i+1] == " ":
+        return "numbered", int(line[:i]), i + 2
+
+    return None
+
+def get_heading_level(line: str) -> int:
+    level = 0
+    while level < len(line) and line[level] == "#":
+        level += 1
+    if 1 <= level <= 6 and (level == len(line) or line[level] == " "):
+        return level
+    return 0
+
+def parse_markdown(text: str) -> list[Block]:
+    blocks: list[Block] = []
+    lines = text.replace("\r\n", "\n").replace("\t", "    ").split("\n")
+
+    # Text of the paragraph or list item which is still being collected
+    current: Optional[Block] = None
+    current_lines: list[str] = []
+
+    def flush():
+        nonlocal current
+        if current is not None:
+            current.spans = parse_inline(" ".join(current_lines))
+            blocks.append(current)
+        current = None
+        current_lines.clear()
+
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        stripped = line.lstrip(" ")
+        indent = len(line) - len(stripped)
+        i += 1
+
+        if stripped == "":
+            flush()
+            continue
+
+        # Fenced code block
+        if stripped.startswith("```") or stripped.startswith("~~~"):
+            flush()
+            fence = stripped[:3]
+            language = stripped[3:].strip() or None
+            code_lines = []
+            while i < len(lines) and not lines[i].lstrip(" ").startswith(fence):
+                code_lines.append(lines[i])
+                i += 1
+            i += 1 # Skip closing fence
+            blocks.append(Block("code", text="\n".join(code_lines), language=language))
+            continue
+
+        heading_level = get_heading_level(stripped)
+        if heading_level > 0:
+            flush()
+            blocks.append(Block("heading", parse_inline(stripped[heading_level:].strip(" #")), level=heading_level))
+            continue
+
+        marker = get_list_marker(stripped)
+        if marker:
+            flush()
+            kind, number, length = marker
+            current = Block(kind, level=indent // 2, number=number)
+            current_lines.append(stripped[length:])
+            continue
+
+        if current is None:
+            current = Block("paragraph")
+        current_lines.append(stripped)
+
+    flush()
+    return blocks
@@ -1,17 +1,37 @@
 from contextlib import contextmanager
 from copy import deepcopy
-from pygments.token import Token
 from PIL import Image
 from fpdf import FPDF, FPDFException
 from fpdf.recorder import FPDFRecorder
 from fpdf.fpdf import ToCPlaceholder, DocumentState, FPDFRecorder
+from fpdf.outline import OutlineSection
+from fpdf.syntax import DestinationXYZ
+from fpdf.util import escape_parens
 from pygments.styles import get_style_by_name
-from pygments.lexers import get_lexer_by_name, get_lexer_for_filename
-from pygments.util import ClassNotFound
 from typing import Literal, Optional
+from io import BytesIO
+from math import ceil, floor
+from array import array
+from datetime import datetime
+from functools import partial
+from types import FunctionType
 import contextlib
+import fpdf.fpdf as fpdf_module
+import hashlib
+import os.path as path
+import zlib
 from dataclasses import dataclass, field
 
+from .markdown import Span, parse_markdown
+from .utils import get_lexer
+from .layout import Element, ImageSource, Layout
+from .fonts import CachedTTFontFile, FontSubsetCache, SHARED_CHARACTERS, default_subset_cache
+from .images import ImageCache, default_image_cache, get_image_size, get_flate_info, get_jpeg_info, load_image_data
+from .compression import compress_streams
+from .document import Document, DocumentImage, TableGroup, TitlePage, write_if_changed
+from .render_pool import RenderedImage
+from .spool import ImageSpool, default_image_spool
+
 # BUG: `.unbreakable` breaks when it's nested inside of other context managers.
 # Doesn't matter if the nested context managers use unbreakable or not inside
 # of themselves. By broke I mean that text dosen't get placed correctly into
@@ -36,12 +56,435 @@ class FontStyle:
 
     unicode: bool = field(default = False)
 
+BLACK = [0, 0, 0]
+
+# Pixels of about this many bytes are compressed at once when writing images
+IMAGE_BATCH_SIZE = 64 * 1024 * 1024
+
+def parse_color(operator: str) -> list[int]:
+    """
+    fpdf keeps colors as pdf operators, like "0.831 0.686 0.216 RG" or "0.000 g"
+    """
+    rgb = [round(float(value) * 255) for value in operator.split()[:-1]]
+    if len(rgb) == 1:
+        return rgb * 3
+    return rgb
+
+def round_position(value: float) -> float:
+    return round(value, 4)
+
+class GlyphWidths:
+    """
+    Advance widths of a unicode font, indexed by codepoint and in 1/1000 of
+    the font size. Same values that fpdf uses, but kept in a flat array, so
+    that strings could be measured without going through fpdf character by
+    character.
+    """
+    widths: array
+    missing_width: float
+    # Width of every printable ascii character, if they are all the same
+    monospace_advance: Optional[float]
+
+    def __init__(self, font: dict) -> None:
+        # 65535 is how fpdf marks glyphs with no width
+        self.widths = array("d", (0 if width == 65535 else width for width in font["cw"]))
+        self.missing_width = font["desc"].get("MissingWidth") or 500
+        ascii_widths = set(self.widths[32:127])
+        self.monospace_advance = ascii_widths.pop() if len(ascii_widths) == 1 else None
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def measure(self, text: str) -> float:
+        if self.monospace_advance is not None and text.isascii() and text.isprintable():
+            return len(text) * self.monospace_advance
+
+        try:
+            return sum(map(self.widths.__getitem__, map(ord, text)))
+        except IndexError:
+            size = len(self.widths)
+            return sum(
+                self.widths[code] if code < size else self.missing_width
+                for code in map(ord, text)
+            )
+
+# Part of a line of code: text, font style ("", "B", "I" or "BI") and color
+TextRun = tuple[str, str, tuple[int, int, int]]
+
+# Glyph widths of loaded fonts, by font file
+GLYPH_WIDTHS: dict[str, GlyphWidths] = {}
+
+def get_glyph_widths(font: dict) -> GlyphWidths:
+    widths = GLYPH_WIDTHS.get(font["ttffile"])
+    if widths is None:
+        widths = GlyphWidths(font)
+        GLYPH_WIDTHS[font["ttffile"]] = widths
+    return widths
+
 class PatchedFPDF(FPDF):
+    # Everything that is drawn is also recorded here, unless it's None
+    layout: Optional[Layout]
+    subset_cache: FontSubsetCache
+    # Fonts which already have the shared characters in their subsets
+    shared_subset_fonts: set[str]
+    # zlib level of page contents and images, which are compressed in
+    # `compression_workers` threads when the pdf is written out
+    compression_level: int = zlib.Z_DEFAULT_COMPRESSION
+    compression_workers: Optional[int] = None
+    # Set while FPDF._putpages writes out page contents compressed upfront
+    precompressed_pages: bool = False
+    image_spool: ImageSpool
+
     def __init__(
-            self, original, orientation="portrait", unit="mm", format="A4", font_cache_dir=True
+            self, original, orientation="portrait", unit="mm", format="A4", font_cache_dir=True, record=True,
+            subset_cache: Optional[FontSubsetCache] = None, image_spool: Optional[ImageSpool] = None
     ):
         super().__init__(orientation, unit, format, font_cache_dir)
         self.original = original
+        self.layout = Layout(unit, (self.w, self.h)) if record else None
+        self.subset_cache = subset_cache or default_subset_cache
+        self.image_spool = image_spool or default_image_spool
+        self.shared_subset_fonts = set()
+
+    def record(self, element: Element):
+        if self.layout is not None:
+            self.layout.add(self.page, element, bool(self.in_footer))
+
+    def get_text_style(self) -> Element:
+        style: Element = {"font": [self.font_family, self.font_style, self.font_size_pt]}
+        color = parse_color(self.text_color)
+        if color != BLACK:
+            style["color"] = color
+        return style
+
+    def get_draw_style(self) -> Element:
+        style: Element = {"line_width": round_position(self.line_width)}
+        color = parse_color(self.draw_color)
+        if color != BLACK:
+            style["draw"] = color
+        return style
+
+    def add_font(self, family, style="", fname=None, uni=False):
+        super().add_font(family, style, fname, uni)
+        if self.layout is not None:
+            self.layout.fonts.append((family, style, fname, uni))
+
+    def set_font(self, family=None, style="", size=0):
+        super().set_font(family, style, size)
+        self.prepare_subset(self.current_font)
+
+    def prepare_subset(self, font: dict):
+        """
+        In the shared subset mode, the shared characters are put into the
+        subset of a font before it's first used. They are picked in the same
+        order every time, so that the subset would be the same in every report.
+        Fonts which are never used are left empty.
+        """
+        if not self.subset_cache.shared_subset or font.get("type") != "TTF":
+            return
+        if font["fontkey"] in self.shared_subset_fonts:
+            return
+        self.shared_subset_fonts.add(font["fontkey"])
+        for char in SHARED_CHARACTERS:
+            font["subset"].pick(ord(char))
+
+    def _putfonts(self):
+        # fpdf creates a TTFontFile for each font it embeds and parses the
+        # whole font file again to make its subset. FPDF._putfonts is run
+        # with its own copy of fpdf's globals, where fonts look up their
+        # subsets in the cache of this pdf instead.
+        putfonts = FunctionType(
+            FPDF._putfonts.__code__, dict(vars(fpdf_module), TTFontFile=partial(CachedTTFontFile, self.subset_cache))
+        )
+        putfonts(self)
+
+    def _putpages(self):
+        if not self.compress:
+            return super()._putpages()
+
+        # FPDF._putpages finishes the contents of pages before compressing
+        # them, so that is done here first and skipped there
+        if self.str_alias_nb_pages:
+            self._substitute_page_number()
+        if self._toc_placeholder:
+            self._insert_table_of_contents()
+        alias, toc_placeholder = self.str_alias_nb_pages, self._toc_placeholder
+        self.str_alias_nb_pages, self._toc_placeholder = "", None
+
+        # The contents are compressed upfront and written out as they are,
+        # `_out` adds the filter which fpdf leaves out without compression
+        pages = range(1, self.pages_count + 1)
+        contents = [self.pages[n]["content"] for n in pages]
+        for n, compressed in zip(pages, compress_streams(contents, self.compression_level, self.compression_workers)):
+            self.pages[n]["content"] = compressed
+        self.compress, self.precompressed_pages = False, True
+        try:
+            super()._putpages()
+        finally:
+            self.compress, self.precompressed_pages = True, False
+            for n, content in zip(pages, contents):
+                self.pages[n]["content"] = content
+            self.str_alias_nb_pages, self._toc_placeholder = alias, toc_placeholder
+
+    def _out(self, s):
+        # The only stream FPDF._putpages writes is the content of each page
+        if self.precompressed_pages and isinstance(s, str) and s.startswith("<</Length "):
+            s = "<</Filter /FlateDecode " + s[2:]
+        super()._out(s)
+
+    def _putimages(self):
+        # Images from `image` are compressed here, a batch at a time, so that
+        # the pixels of spooled images are never all in memory at once
+        streams: list[tuple[dict, str]] = []
+        size = 0
+        for info in self.images.values():
+            if info["usages"] == 0 or not info.pop("uncompressed", False):
+                continue
+            spooled = info.pop("spooled", None)
+            if spooled is not None:
+                with open(spooled, "rb") as f:
+                    info.update(get_flate_info(f.read())) # type: ignore
+                del info["uncompressed"]
+
+            streams.append((info, "data"))
+            if "smask" in info:
+                streams.append((info, "smask"))
+            size += len(info["data"]) + len(info.get("smask", b""))
+            if size >= IMAGE_BATCH_SIZE:
+                self.compress_images(streams)
+                streams, size = [], 0
+        self.compress_images(streams)
+        super()._putimages()
+
+    def compress_images(self, streams: list[tuple[dict, str]]):
+        compressed = compress_streams([info[key] for info, key in streams], self.compression_level, self.compression_workers)
+        for (info, key), data in zip(streams, compressed):
+            info[key] = data
+
+    def get_string_width(self, s, normalized=False, markdown=False):
+        # fpdf also calls this for every single character while wrapping text
+        if markdown or not self.unifontsubset:
+            return super().get_string_width(s, normalized, markdown)
+
+        w = get_glyph_widths(self.current_font).measure(s)
+        if self.font_stretching != 100:
+            w *= self.font_stretching / 100
+        return w * self.font_size / 1000
+
+    def monospace_lines(self, lines: list[list[TextRun]], h: float, advance: float):
+        """
+        Write lines of text in the current monospace font family straight into
+        the page, from the current position downwards. Every character is
+        `advance` wide, lines must already fit into the page.
+        """
+        k = self.k
+        x = self.x
+        # Text state is kept between lines, and reset for fpdf afterwards by "Q"
+        ops = ["q"]
+        current_font, current_color = None, None
+        for runs in lines:
+            baseline = (self.h - self.y - 0.5 * h - 0.3 * self.font_size) * k
+            ops.append(f"BT {(x + self.c_margin) * k:.2f} {baseline:.2f} Td")
+            column = 0
+            for text, style, color in runs:
+                font = self.fonts[self.font_family + style]
+                if font is not current_font:
+                    self.prepare_subset(font)
+                    ops.append(f"/F{font['i']} {self.font_size_pt:.2f} Tf")
+                    current_font = font
+                if color != current_color:
+                    r, g, b = color
+                    ops.append(f"{r / 255:.3f} {g / 255:.3f} {b / 255:.3f} rg")
+                    current_color = color
+
+                mapped = "".join(map(chr, map(font["subset"].pick, map(ord, text))))
+                ops.append(f"({escape_parens(mapped.encode('UTF-16BE').decode('latin-1'))}) Tj")
+
+                if self.layout is not None:
+                    element: Element = {"type": "text", "text": text, "font": [self.font_family, style, self.font_size_pt]}
+                    if list(color) != BLACK:
+                        element["color"] = list(color)
+                    element["x"] = round_position(x + column * advance)
+                    element["y"] = round_position(self.y)
+                    element["w"] = round_position(len(text) * advance)
+                    element["h"] = round_position(h)
+                    self.record(element)
+                column += len(text)
+            ops.append("ET")
+            self.y += h
+        ops.append("Q")
+
+        self._out(" ".join(ops))
+        self.lasth = h
+
+    def add_page(self, *args, **kwargs):
+        super().add_page(*args, **kwargs)
+        if self.layout is not None:
+            self.layout.get_page(self.page)
+
+    def cell(
+        self, w=None, h=None, txt="", border=0, ln=0, align="", fill=False, link="", center=False, markdown=False
+    ):
+        if self.layout is None or not self.font_family or not (txt or border or fill):
+            return super().cell(w, h, txt, border, ln, align, fill, link, center, markdown)
+
+        # Resolve the same geometry as `FPDF.cell`, so that the text is
+        # recorded where it actually ends up after a possible page break
+        x = self.x
+        if w == 0:
+            w = self.w - self.r_margin - self.x
+        elif w is None and txt:
+            w = self.get_string_width(self.normalize_text(txt), True, markdown) + 2
+        if h is None:
+            h = self.font_size
+        if center:
+            x = self.l_margin + (self.epw - w) / 2
+
+        element: Element = {"type": "text", "text": txt}
+        element.update(self.get_text_style())
+        if align:
+            element["align"] = align
+        if border:
+            element["border"] = border
+            element.update(self.get_draw_style())
+        if fill:
+            element["fill"] = parse_color(self.fill_color)
+
+        page_break_triggered = super().cell(w, h, txt, border, ln, align, fill, link, center, markdown)
+
+        element["x"] = round_position(self.x - w if ln == 0 else x)
+        element["y"] = round_position(self.y - h if ln > 0 else self.y)
+        element["w"] = round_position(w)
+        element["h"] = round_position(h)
+        self.record(element)
+        return page_break_triggered
+
+    def image(self, name, x=None, y=None, w=0, h=0, type="", link="", title=None, alt_text=None):
+        # Same keys as fpdf uses, so it would find the image info. JPEGs are
+        # embedded as they are, and other images are compressed later.
+        key = None
+        if isinstance(name, BytesIO):
+            key = hashlib.md5(name.getvalue()).hexdigest()
+        elif isinstance(name, str) and path.isfile(name):
+            key = name
+        if key is not None and key not in self.images and self.image_filter == "AUTO":
+            if isinstance(name, BytesIO):
+                data = name.getvalue()
+            else:
+                with open(name, "rb") as f:
+                    data = f.read()
+            info = get_jpeg_info(data) or get_flate_info(data)
+            if info is not None and "uncompressed" in info and key == name and self.image_spool.get_digest(name) is not None:
+                # Pixels of spooled images are read again when the pdf is written out
+                del info["data"]
+                info.pop("smask", None)
+                info["spooled"] = name
+            if info is not None:
+                info["i"] = len(self.images) + 1
+                info["usages"] = 0
+                self.images[key] = info
+
+        info = super().image(name, x, y, w, h, type, link, title, alt_text)
+        if self.layout is None:
+            return info
+
+        if w == 0 and h == 0:
+            w, h = info["w"] / self.k, info["h"] / self.k
+        elif w == 0:
+            w = h * info["w"] / info["h"]
+        elif h == 0:
+            h = w * info["h"] / info["w"]
+        if y is None:
+            y = self.y - h
+        if x is None:
+            x = self.x
+
+        source = name.getvalue() if isinstance(name, BytesIO) else name
+        self.record({
+            "type": "image",
+            "x": round_position(x), "y": round_position(y),
+            "w": round_position(w), "h": round_position(h),
+            "image": self.layout.add_image(source),
+        })
+        return info
+
+    def line(self, x1, y1, x2, y2):
+        element: Element = {
+            "type": "line",
+            "x1": round_position(x1), "y1": round_position(y1),
+            "x2": round_position(x2), "y2": round_position(y2),
+        }
+        element.update(self.get_draw_style())
+        self.record(element)
+        super().line(x1, y1, x2, y2)
+
+    def rectangles(self, rects: list[tuple[float, float, float, float]]):
+        """
+        Draw outlines of many rectangles as a single path
+        """
+        if not rects:
+            return
+        k = self.k
+        self._out(" ".join(
+            f"{x * k:.2f} {(self.h - y) * k:.2f} {w * k:.2f} {-h * k:.2f} re"
+            for x, y, w, h in rects
+        ) + " S")
+
+        element: Element = {"type": "rects", "rects": [[round_position(v) for v in rect] for rect in rects]}
+        element.update(self.get_draw_style())
+        self.record(element)
+
+    def start_section(self, name, level=0):
+        self.record({"type": "outline", "name": name, "level": level, "y": round_position(self.y)})
+        super().start_section(name, level)
+
+    def add_outline_section(self, name: str, level: int, y: float):
+        """
+        Add an entry to the outline without rendering its title
+        """
+        self.record({"type": "outline", "name": name, "level": level, "y": y})
+        self._outline.append(OutlineSection(name, level, self.page, DestinationXYZ(self.page, y=y)))
+
+    def draw_elements(self, elements: list[Element], images: dict[str, ImageSource]):
+        """
+        Draw recorded elements onto the current page
+        """
+        for element in elements:
+            kind = element["type"]
+            if kind == "text":
+                border = element.get("border", 0)
+                fill = element.get("fill")
+                self.set_font(*element["font"])
+                self.set_text_color(*element.get("color", BLACK))
+                if border:
+                    self.set_draw_color(*element.get("draw", BLACK))
+                    self.set_line_width(element["line_width"])
+                if fill:
+                    self.set_fill_color(*fill)
+                self.set_xy(element["x"], element["y"])
+                self.cell(
+                    element["w"], element["h"], element["text"],
+                    border=border, align=element.get("align", ""), fill=fill is not None
+                )
+                if "numbering" in element and self.layout is not None:
+                    self.layout.last_element["numbering"] = element["numbering"] # type: ignore
+            elif kind == "image":
+                source = images[element["image"]]
+                if isinstance(source, bytes):
+                    source = BytesIO(source)
+                self.image(source, element["x"], element["y"], element["w"], element["h"])
+            elif kind == "line":
+                self.set_draw_color(*element.get("draw", BLACK))
+                self.set_line_width(element["line_width"])
+                self.line(element["x1"], element["y1"], element["x2"], element["y2"])
+            elif kind == "rects":
+                self.set_draw_color(*element.get("draw", BLACK))
+                self.set_line_width(element["line_width"])
+                self.rectangles([tuple(rect) for rect in element["rects"]])
+            elif kind == "outline":
+                self.add_outline_section(element["name"], element["level"], element["y"])
+            else:
+                raise ValueError(f"Unknown layout element type '{kind}'")
 
     def _insert_table_of_contents(self):
         prev_state = self.state
@@ -59,7 +502,7 @@ class PatchedFPDF(FPDF):
             raise FPDFException(error_msg)
         self.state = prev_state
 
-class PDF:
+class PDF(Document):
     """
         Acts as a standard interface to the fpdf2 library.
         This has been because I didn't like the design decisions in the library
@@ -73,22 +516,50 @@ class PDF:
     section_levels: list[int]
     font_stles: dict[str, FontStyle]
 
-    numbering_index: int = 0
+    body_font_family: str = "times-new-roman"
+    body_font_size: int = 12
+    code_font_family: str = "courier-new"
+    code_font_size: int = 10
+    # Minimal height of a table row, in font heights
+    table_row_height: float = 1.8
+    # Figures are resampled to this resolution for the size they are shown
+    # at, if they have more pixels. 0 keeps images as they are.
+    image_dpi: int = 200
+    # Show figures which are wider than the page at page width, like html and
+    # LaTeX documents do. Off by default, since it changes how existing
+    # reports look, fpdf places them at their natural size.
+    fit_wide_figures: bool = False
+
+    toc_section_spacing_above = 0.21
+    toc_section_spacing_below = 0.35
 
     numbering_font_family: str = "times-new-roman"
     numbering_font_style: str = "I"
     numbering_font_size: int = 12
 
+    markdown_code_font_family: str = "courier-new"
+    markdown_code_font_size: int = 10
+    markdown_code_theme: str = "vs"
+    markdown_bullet: str = "•"
+    markdown_list_indent: float = 0.75
+    # How many points bigger is a heading of given level
+    markdown_heading_sizes: dict[int, int] = {1: 4, 2: 2}
+
     def __init__(
             self,
             orientation: str ="portrait",
             format: str ="A4",
-            font_cache_dir: bool =True
+            font_cache_dir: bool =True,
+            subset_cache: Optional[FontSubsetCache] = None,
+            image_cache: Optional[ImageCache] = None,
+            image_spool: Optional[ImageSpool] = None
         ):
-        self.fpdf = PatchedFPDF(self, orientation, "cm", format, font_cache_dir)
+        self.fpdf = PatchedFPDF(self, orientation, "cm", format, font_cache_dir, subset_cache=subset_cache, image_spool=image_spool)
         # self.fpdf = FPDF(orientation, "cm", format, font_cache_dir)
         self.section_levels = [1]
         self.font_styles = {}
+        self.image_cache = image_cache or default_image_cache
+        self.image_spool = self.fpdf.image_spool
 
     def add_font(self, style: FontStyle):
         assert style.name not in self.font_styles, "Style with this name already exists"
@@ -148,34 +619,130 @@ class PDF:
         else:
             self.fpdf.cell(w=w, h=h, txt=text, align=align, border=border, ln=newlines)
 
-    # TODO: Create a more feature complete markdown writer
-    # TODO: Feature: Only double \n\n create a \n
     def write_markdown(self, text: str):
-        lexer = get_lexer_by_name("markdown")
+        """
+        Render markdown text with the current font as the base font
+        """
+        family = self.fpdf.font_family
+        size = self.fpdf.font_size_pt
+        h = self.fpdf.font_size * self.line_spacing # type: ignore
+
+        for block in parse_markdown(text):
+            self.fpdf.set_x(self.fpdf.l_margin)
+            if block.kind == "code":
+                self.set_font(self.markdown_code_font_family, self.markdown_code_font_size)
+                self.write_code(block.text, self.markdown_code_theme, block.language or "text")
+            elif block.kind == "heading":
+                heading_size = size + self.markdown_heading_sizes.get(block.level, 0)
+                heading_h = self.get_font_height(heading_size) * self.line_spacing
+                self.write_markdown_spans(block.spans, family, heading_size, heading_h, bold=True)
+                self.fpdf.ln(heading_h)
+                continue
+            elif block.kind == "bullet" or block.kind == "numbered":
+                marker = self.markdown_bullet if block.kind == "bullet" else f"{block.number}."
+                indent = block.level * self.markdown_list_indent
+
+                l_margin = self.fpdf.l_margin
+                self.fpdf.set_x(l_margin + indent)
+                self.set_available_font(family, "", size)
+                self.fpdf.cell(w=self.markdown_list_indent, h=h, txt=marker)
+                self.fpdf.set_left_margin(l_margin + indent + self.markdown_list_indent)
+                self.write_markdown_spans(block.spans, family, size, h)
+                self.fpdf.set_left_margin(l_margin)
+            else:
+                self.write_markdown_spans(block.spans, family, size, h)
+            self.fpdf.ln(h)
 
-        paragraph: list[str] = []
-        prev_value = ""
-        for ttype, value in lexer.get_tokens(text):
-            # if ttype == Token.Generic.Strong:
-                # pass
-                # self.multi_cell(0, txt="".join(paragraph))
-                # paragraph = []
-                # self.set_font(style="B")
-                # self.write(txt=value)
-                # self.set_font(style="")
-                # self.multi_cell(0, txt="".join(paragraph))
-            if ttype == Token.Keyword and value == "*" and (prev_value == "\n" or prev_value == ""):
-                paragraph.append("\n•")
-            elif value == "\n" and prev_value == "\n":
-                paragraph.append("\n")
-            elif value != '\n':
-                paragraph.append(value)
-            prev_value = value
-
-        self.fpdf.multi_cell(0, txt="".join(paragraph))
-
-    def save_to_file(self, filename: str):
-        self.fpdf.output(filename)
+        self.set_available_font(family, "", size)
+
+    def write_markdown_spans(self, spans: list[Span], family: str, size: float, h: float, bold: bool = False):
+        for span in spans:
+            style = ""
+            if span.bold or bold:
+                style += "B"
+            if span.italic:
+                style += "I"
+
+            if span.code:
+                self.set_available_font(self.markdown_code_font_family, style, size)
+            else:
+                self.set_available_font(family, style, size)
+            self.fpdf.write(h, span.text)
+
+    def set_available_font(self, family: str, style: str, size: float):
+        """
+        Set font, but drop styles which were not loaded for this font family
+        """
+        fonts = self.fpdf.fonts
+        if family + style not in fonts:
+            if family + style.replace("I", "") in fonts:
+                style = style.replace("I", "")
+            else:
+                style = ""
+        self.fpdf.set_font(family, style, size)
+
+    def save_to_file(self, filename: str) -> bool:
+        return write_if_changed(filename, bytes(self.fpdf.output()))
+
+    def set_creation_date(self, date: Optional[datetime] = None):
+        """
+        Date stored in the metadata of the pdf, the current time by default
+        """
+        self.fpdf.set_creation_date(date)
+
+    def set_compression_level(self, level: int):
+        """
+        zlib level (0-9) of page contents and images, which doesn't change how
+        the pdf looks
+        """
+        self.fpdf.compression_level = level
+
+    @property
+    def layout(self) -> Layout:
+        assert self.fpdf.layout is not None, "Layout is not being recorded"
+        return self.fpdf.layout
+
+    def get_layout_state(self) -> dict:
+        """
+        Numbering state which the content of the current page depends on
+        """
+        return {
+            "page": self.fpdf.page,
+            "numbering_index": self.numbering_index,
+            "section_levels": list(self.section_levels),
+        }
+
+    def get_section_layout(self, first_page: int, start: dict) -> Layout:
+        """
+        Slice out everything drawn since `first_page`, so it could be replayed
+        with `replay_section`
+        """
+        end = self.get_layout_state()
+        end.update(self.fpdf.get_text_style())
+        return self.layout.slice(first_page, self.fpdf.page, start, end)
+
+    def replay_section(self, section: Layout, numbering_offset: int = 0):
+        """
+        Draw a section layout starting from the current page, and continue
+        numbering from where it ended. Figures are renumbered by
+        `numbering_offset`, for sections which were laid out with a different
+        numbering than they end up with.
+        """
+        auto_page_break, margin = self.fpdf.auto_page_break, self.fpdf.b_margin
+        self.fpdf.set_auto_page_break(False, margin)
+        for i, page in enumerate(section.pages):
+            if i > 0:
+                self.fpdf.add_page()
+            elements = page.elements
+            if numbering_offset:
+                elements = renumber_elements(elements, numbering_offset)
+            self.fpdf.draw_elements(elements, section.images)
+        self.fpdf.set_auto_page_break(auto_page_break, margin)
+
+        self.numbering_index = section.end["numbering_index"] + numbering_offset
+        self.section_levels = list(section.end["section_levels"])
+        self.fpdf.set_font(*section.end["font"])
+        self.fpdf.set_text_color(*section.end.get("color", BLACK))
 
     def set_margins(self, left: float, top: float, right: float = -1):
         self.fpdf.set_margins(left, top, right)
@@ -247,11 +814,13 @@ class PDF:
 
     def image(
         self,
-        image: Image.Image|str,
+        image: DocumentImage,
         w: float = 0,
         h: float = 0,
         centered: bool = False
     ):
+        if isinstance(image, RenderedImage):
+            image = image.get_path()
         x = None
         if centered:
             if w == 0:
@@ -269,13 +838,17 @@ class PDF:
             self.add_numbering(label)
 
     def add_numbering(self, label: str):
-        self.numbering_index += 1
+        text = self.next_numbering(label)
         self.fpdf.set_x(self.get_x() + 1.27) # type: ignore
         self.fpdf.set_font(self.numbering_font_family, self.numbering_font_style, self.numbering_font_size) # type: ignore
         self.fpdf.cell(  # type: ignore
-            txt=label.format(index=self.numbering_index),
+            txt=text,
             ln=True
         )
+        layout = self.fpdf.layout
+        if layout is not None and layout.last_element is not None:
+            # Kept so that figures could be renumbered without laying them out again
+            layout.last_element["numbering"] = [label, self.numbering_index]
 
     def newline(self, height: float = None):
         self.fpdf.ln(height)
@@ -338,22 +911,8 @@ class PDF:
     def get_string_width(self, text: str) -> float:
         return self.fpdf.get_string_width(text, True)
 
-    def push_section(self, label: Optional[str] = None, *args, **kvargs):
-        self.section_levels.append(1)
-        if label:
-            level = "".join(str(lvl)+"." for lvl in self.section_levels[:-1])
-            label = label.format(level = level, *args, **kvargs)
-        self.fpdf.start_section(label or "", len(self.section_levels)-2)
-
-    def pop_section(self):
-        self.section_levels.pop()
-        self.section_levels[-1] += 1
-
-    @contextmanager
-    def section_block(self, label: Optional[str] = None, *args, **kvargs):
-        self.push_section(label, *args, **kvargs)
-        yield
-        self.pop_section()
+    def start_section(self, name: str, level: int):
+        self.fpdf.start_section(name, level)
 
     def page_no(self) -> int:
         return self.fpdf.page_no()
@@ -364,11 +923,372 @@ class PDF:
         Render label above block
         """
         # with self.unbreakable() as self: # type: ignore
+        self.set_font(self.body_font_family, self.body_font_size)
         self.print(label)
         self.newline()
         yield
         self.newline()
 
+    def add_markdown(self, text: str):
+        self.set_font(self.body_font_family, self.body_font_size)
+        self.write_markdown(text)
+        self.newline()
+
+    def add_listing(self, text: str, language: Optional[str] = None, theme: str = "vs"):
+        self.set_font(self.code_font_family, self.code_font_size)
+        if language:
+            self.write_code(text, theme, language)
+        else:
+            self.write_code(text, h=self.fpdf.font_size * self.line_spacing) # type: ignore
+            self.fpdf.ln()
+
+    def add_figure(
+            self,
+            image: DocumentImage,
+            numbering_label: str,
+            label: Optional[str] = None,
+            full_width: bool = False
+        ):
+        data, w, h, size = self.get_figure_image(image, full_width)
+        if size is not None:
+            # Resampled images are spooled too, their pixels don't stay in memory
+            data = self.image_spool.put(self.image_cache.get(data, size)[0])
+        elif isinstance(image, RenderedImage):
+            data = image.get_path()
+        elif isinstance(data, bytes):
+            data = BytesIO(data)
+
+        self.set_font(self.body_font_family, self.body_font_size)
+        with self.unbreakable() as pdf: # type: ignore
+            if label:
+                pdf.print(label)
+                pdf.newline()
+            pdf.image(data, w=w, h=h)
+            pdf.add_numbering(numbering_label)
+            pdf.newline()
+
+    def get_figure_image(
+            self,
+            image: DocumentImage,
+            full_width: bool
+        ) -> tuple[Image.Image|bytes, float, float, Optional[tuple[int, int]]]:
+        """
+        Returns image data, the size at which the figure is shown and the size
+        in pixels it should be resampled to (None if it's small enough).
+        Figures are shown at 72 dpi like in fpdf, full width ones (and wide
+        ones with `fit_wide_figures`) at the width of the page.
+        """
+        data = load_image_data(image)
+        width, height = get_image_size(data)
+        k = self.fpdf.k
+        w, h = width / k, height / k
+        if full_width or (self.fit_wide_figures and w > self.epw):
+            w, h = self.epw, self.epw * height / width
+
+        if not self.image_dpi:
+            return data, w, h, None
+        size = (max(1, round(w * k / 72 * self.image_dpi)), max(1, round(h * k / 72 * self.image_dpi)))
+        if size[0] >= width and size[1] >= height and (isinstance(data, Image.Image) or isinstance(image, RenderedImage)):
+            # Rendered images don't have any metadata to strip
+            return data, w, h, None
+        return data, w, h, size
+
+    def prepare_figures(self, figures: list[tuple[DocumentImage, bool]]):
+        images = []
+        for image, full_width in figures:
+            data, _, _, size = self.get_figure_image(image, full_width)
+            if size is not None:
+                images.append((data, size))
+        self.image_cache.prepare(images)
+
+    def add_table(self, headers: list[str], groups: list[TableGroup]):
+        """
+        Render table, where the first cell of each group spans all of the
+        group's rows. All cells are wrapped and measured upfront, pages are
+        only broken between rows and the header is repeated on every page.
+        """
+        fpdf = self.fpdf
+        self.set_font(self.body_font_family, self.body_font_size, bold=True)
+        line_height = self.font_size
+        min_row_height = line_height * self.table_row_height
+        col_width = self.epw / len(headers)
+        text_width = col_width - 2 * fpdf.c_margin
+        x = fpdf.l_margin
+
+        header_lines = [self.wrap_text(header, text_width) for header in headers]
+        header_height = max(min_row_height, max(map(len, header_lines)) * line_height)
+
+        # Lines of each group's name, lines of each cell and height of each row
+        self.set_font(self.body_font_family, self.body_font_size)
+        measured_groups: list[tuple[list[str], list[list[list[str]]], list[float]]] = []
+        for group_name, rows in groups:
+            if not rows:
+                continue
+            name_lines = self.wrap_text(group_name, text_width)
+            row_lines = [[self.wrap_text(value, text_width) for value in row] for row in rows]
+            heights = [
+                max(min_row_height, max(map(len, cells), default=0) * line_height)
+                for cells in row_lines
+            ]
+            # A long name makes the last row of its group taller
+            heights[-1] += max(0, len(name_lines) * line_height - sum(heights))
+            measured_groups.append((name_lines, row_lines, heights))
+
+        # Borders of the current page, drawn all at once
+        borders: list[tuple[float, float, float, float]] = []
+
+        def draw_header():
+            self.set_font(self.body_font_family, self.body_font_size, bold=True)
+            y = fpdf.y
+            for i, lines in enumerate(header_lines):
+                cell_x = x + i * col_width
+                self.draw_cell_text(lines, cell_x, y, col_width, header_height, "C")
+                borders.append((cell_x, y, col_width, header_height))
+            fpdf.set_xy(x, y + header_height)
+            self.set_font(self.body_font_family, self.body_font_size)
+
+        def break_page_if_needed(height: float) -> bool:
+            if not fpdf.will_page_break(height):
+                return False
+            fpdf.rectangles(borders)
+            borders.clear()
+            fpdf._perform_page_break()
+            draw_header()
+            return True
+
+        def close_group_cell(lines: list[str], top: float, bottom: float):
+            # Name is repeated on each page the group is on, if it fits
+            height = bottom - top
+            if len(lines) * line_height <= height + 1e-9:
+                self.draw_cell_text(lines, x, top, col_width, height, "L")
+            borders.append((x, top, col_width, height))
+            fpdf.set_xy(x, bottom)
+
+        self.set_draw_color((0, 0, 0))
+        fpdf.set_x(x)
+        draw_header()
+        for name_lines, row_lines, heights in measured_groups:
+            # Start the group on a page, where at least its name fits
+            needed_height = 0
+            for height in heights:
+                needed_height += height
+                if needed_height >= len(name_lines) * line_height:
+                    break
+            break_page_if_needed(needed_height)
+
+            group_y = y = fpdf.y
+            for cells, height in zip(row_lines, heights):
+                if y > group_y and fpdf.will_page_break(height):
+                    close_group_cell(name_lines, group_y, y)
+                    break_page_if_needed(height)
+                    group_y = y = fpdf.y
+
+                for i, lines in enumerate(cells, 1):
+                    cell_x = x + i * col_width
+                    self.draw_cell_text(lines, cell_x, y, col_width, height, "L")
+                    borders.append((cell_x, y, col_width, height))
+                y += height
+                fpdf.set_xy(x, y)
+            close_group_cell(name_lines, group_y, y)
+
+        fpdf.rectangles(borders)
+        fpdf.set_x(fpdf.l_margin)
+        self.newline(min_row_height)
+
+    def draw_cell_text(self, lines: list[str], x: float, y: float, w: float, h: float, align: str):
+        """
+        Draw lines of text vertically centered inside of a cell, without
+        breaking the page
+        """
+        fpdf = self.fpdf
+        line_height = self.font_size
+        y += (h - len(lines) * line_height) / 2
+
+        auto_page_break, margin = fpdf.auto_page_break, fpdf.b_margin
+        fpdf.set_auto_page_break(False, margin)
+        for line in lines:
+            fpdf.set_xy(x, y)
+            fpdf.cell(w, line_height, line, align=align)
+            y += line_height
+        fpdf.set_auto_page_break(auto_page_break, margin)
+
+    def wrap_text(self, text: str, width: float) -> list[str]:
+        """
+        Split text into lines which fit into `width` with the current font.
+        Lines are broken between words, or inside of words which are too long.
+        """
+        lines = []
+        for paragraph in text.replace("\r", "").split("\n"):
+            line = ""
+            for word in paragraph.split(" "):
+                candidate = f"{line} {word}" if line else word
+                if self.get_string_width(candidate) <= width or not candidate:
+                    line = candidate
+                    continue
+                if line:
+                    lines.append(line)
+                line = word
+                # Word doesn't fit on its own
+                while len(line) > 1 and self.get_string_width(line) > width:
+                    split = len(line) - 1
+                    while split > 1 and self.get_string_width(line[:split]) > width:
+                        split -= 1
+                    lines.append(line[:split])
+                    line = line[split:]
+            lines.append(line)
+        return lines
+
+    def add_title_page(self, title_page: TitlePage):
+        self.add_page()
+
+        font_size_pt = 12
+        font_height = self.get_font_height(font_size_pt)
+
+        self.fpdf.set_y(self.fpdf.t_margin + 0.5 + 12/self.fpdf.k)
+        self.image(title_page.university_icon, 1.78, 2.04, centered=True)
+
+        self.set_font("times-new-roman", font_size_pt, bold = True)
+        self.print(title_page.university_name, w=0, h=font_height*1.5, align="C")
+
+        self.set_font("times-new-roman", font_size_pt)
+        self.print(title_page.faculty_name, w=0, align="C")
+
+        # Middle part (title)
+        self.newline(font_height*15)
+
+        self.set_font("times-new-roman", 18, bold = True)
+        self.print(title_page.title, w=0, align="C")
+
+        self.set_font("times-new-roman", 14)
+        self.print(title_page.sub_title, w=0, align="C")
+
+        # Student name and professort name section
+        font_height = self.get_font_height()
+        self.newline(font_height*4)
+
+        width = self.get_page_width()
+
+        # Seperator
+        y = self.get_y()
+        self.set_draw_color(title_page.seperator_color)
+        self.line(width/2+font_height, y, width-self.right_margin, y)
+        self.newline(font_height*2)
+
+        for name, role in title_page.people:
+            self.set_font("times-new-roman", 12, bold = True)
+            self.set_cursor(x=width/2 + font_height)
+            self.print(name, w=width/2, align="L")
+            self.newline()
+
+            self.set_font("times-new-roman", 12)
+            self.set_cursor(x=width/2 + font_height)
+            self.print(role, w=width/2, align="L")
+            self.newline()
+            self.newline()
+            self.newline()
+
+        # Seperator
+        y = self.get_y()
+        self.set_draw_color(title_page.seperator_color)
+        self.line(width/2+font_height, y, width-self.right_margin, y)
+        self.newline(font_height*2)
+
+        # Footer
+        self.set_font("times-new-roman", 12, bold = True)
+        self.set_cursor(y=-font_height*2-self.bottom_margin)
+        self.write(title_page.footer, w=0, align="C")
+
+    def add_table_of_contents(self, title: str, section_count: int, subsection_count: int):
+        """
+        Add table of contents to page
+        """
+        toc_height = self.get_effective_toc_height(section_count, subsection_count)
+        # Adjust for title that is at the top of the page
+        eph = self.eph - (0.5 + self.get_font_height(12))
+        toc_height += self.get_font_height(12)
+
+        def render_toc(pdf: PDF, outline: list[OutlineSection]):
+            pdf.render_toc(title, outline)
+
+        pages = max(1, ceil(toc_height / eph))
+        self.insert_toc_placeholder(render_toc, pages)
+
+    # Used for determining how many pages should be inserted in placeholder
+    def get_effective_toc_height(self, section_count: int, subsection_count: int) -> float:
+        """
+        Estimate how much space the table of contents is gonna take up
+        """
+        section_text_height = self.get_font_height(14)
+        subsection_text_height = self.get_font_height(12)
+        margins = self.toc_section_spacing_above + self.toc_section_spacing_below
+
+        height = section_count * (section_text_height + margins)
+        height += subsection_count * (subsection_text_height + margins)
+        return height
+
+    def render_toc(self, title: str, outline: list[OutlineSection]) -> None:
+        """
+        Render table of contents
+        """
+        page_top_y = self.top_margin + 0.5 + self.get_font_height(12)
+        self.set_cursor(y=page_top_y)
+        self.set_font("times-new-roman", 12)
+        self.print(title, w=0, align="C")
+        self.newline()
+
+        for i in range(len(outline)):
+            outlineSection = outline[i]
+            level = int(outlineSection.level)
+
+            # Only render up to 1 level deep
+            if level > 1: continue
+
+            # Update font
+            if level == 0:
+                self.set_font("times-new-roman", 14, bold = True)
+            else:
+                self.set_font("times-new-roman", 12)
+
+            # Ensure that text will not be places outside of a page
+            h = self.toc_section_spacing_above + self.get_font_height()
+            self.perform_page_break_if_need_be(h)
+
+            # Move cursor where the section label will be placed
+            self.set_cursor(x=self.left_margin)
+            self.move_cursor(dy=self.toc_section_spacing_above)
+
+            # Indent outline section
+            if level > 0:
+                self.move_cursor(dx=1)
+
+            self.render_toc_section(outlineSection)
+
+            self.move_cursor(dy=self.get_font_height())
+            self.move_cursor(dy=self.toc_section_spacing_below)
+
+    def render_toc_section(self, outline: OutlineSection):
+        """
+        Render a single section from the table of contents
+        """
+        x = self.get_x()
+
+        self.write(outline.name)
+
+        text_width = self.get_string_width(outline.name)
+        page_width = self.get_page_width()
+        left_over_space = page_width - self.right_margin - (x + text_width)
+
+        page_number_width = self.get_string_width(str(outline.page_number))
+        dot_width = self.get_string_width('.')
+        needed_dots = round((left_over_space - page_number_width)/dot_width - 0.1)
+
+        page_number_txt = "." * needed_dots + str(outline.page_number)
+
+        self.set_cursor(
+            x=-self.get_string_width(page_number_txt)-self.right_margin
+        )
+        self.write(page_number_txt)
+
     @staticmethod
     def hex_to_rgb(value: str) -> tuple[int, int, int]:
         value = value.lstrip("#")
@@ -384,11 +1304,7 @@ class PDF:
             style_name: str,
             language: str
         ):
-        lexer = None
-        try:
-            lexer = get_lexer_by_name(language)
-        except ClassNotFound:
-            lexer = get_lexer_for_filename(language)
+        lexer = get_lexer(language)
 
         DEFAULT_COLOR = (0, 0, 0)
 
@@ -411,14 +1327,112 @@ class PDF:
 
         self.fpdf.set_text_color(*DEFAULT_COLOR)
 
+    def write_code(
+            self,
+            text: str,
+            style_name: str = "vs",
+            language: Optional[str] = None,
+            h: Optional[float] = None
+        ):
+        """
+        Write text with the current font from the left margin, syntax
+        highlighted if `language` is given. With a monospace font lines are
+        wrapped by counting characters and written a page at a time, which is
+        a lot faster than going through `write`.
+        """
+        fpdf = self.fpdf
+        if h is None:
+            h = fpdf.font_size
+        fpdf.set_x(fpdf.l_margin)
+
+        advance = self.get_monospace_advance()
+        if advance is None:
+            if language:
+                self.write_syntax_highlighted(text, style_name, language)
+            else:
+                self.write(text, h=h, multiline=True)
+                fpdf.set_x(fpdf.l_margin)
+            return
+
+        if language:
+            lines = self.get_highlighted_lines(text, style_name, language)
+        else:
+            lines = [[(line, "", (0, 0, 0))] if line else [] for line in split_lines(text)]
+
+        columns = max(1, floor((self.epw - 2 * fpdf.c_margin) / advance + 1e-9))
+        wrapped = [part for runs in lines for part in wrap_runs(runs, columns)]
+
+        i = 0
+        while i < len(wrapped):
+            self.perform_page_break_if_need_be(h)
+            fitting_lines = max(1, floor((self.page_break_trigger - fpdf.y) / h + 1e-9))
+            fpdf.monospace_lines(wrapped[i:i+fitting_lines], h, advance)
+            i += fitting_lines
+        fpdf.set_x(fpdf.l_margin)
+
+    def get_monospace_advance(self) -> Optional[float]:
+        """
+        Width of a character in the current font, if all loaded styles of
+        its family are monospace fonts of the same width
+        """
+        fpdf = self.fpdf
+        if not fpdf.unifontsubset:
+            return None
+
+        advances = set()
+        for style in ("", "B", "I", "BI"):
+            font = fpdf.fonts.get(fpdf.font_family + style)
+            if font is not None:
+                advances.add(get_glyph_widths(font).monospace_advance)
+        if len(advances) != 1 or None in advances:
+            return None
+        return advances.pop() * fpdf.font_size / 1000
+
+    def get_highlighted_lines(self, text: str, style_name: str, language: str) -> list[list[TextRun]]:
+        style = get_style_by_name(style_name)
+        fonts = self.fpdf.fonts
+        family = self.fpdf.font_family
+
+        lines: list[list[TextRun]] = [[]]
+        for ttype, value in get_lexer(language).get_tokens(text):
+            s = style.style_for_token(ttype)
+            font_style = ""
+            if s["bold"]:
+                font_style += "B"
+            if s["italic"]:
+                font_style += "I"
+            if family + font_style not in fonts:
+                font_style = ""
+            color = self.hex_to_rgb(s["color"]) if s["color"] else (0, 0, 0)
+
+            for i, part in enumerate(value.split("\n")):
+                if i > 0:
+                    lines.append([])
+                if not part:
+                    continue
+                runs = lines[-1]
+                # Neighbouring tokens which look the same are written together
+                if runs and runs[-1][1:] == (font_style, color):
+                    runs[-1] = (runs[-1][0] + part, font_style, color)
+                else:
+                    runs.append((part, font_style, color))
+
+        # Lexers end text with a newline
+        if len(lines) > 1 and not lines[-1]:
+            lines.pop()
+        return lines
+
     @contextmanager
     def unbreakable(self):
         prev_page, prev_y = self.fpdf.page, self.fpdf.y
+        layout_mark = self.fpdf.layout.mark() if self.fpdf.layout else None
         recorder = FPDFRecorder(self, accept_page_break=False)
         yield recorder
         y_scroll = recorder.fpdf.y - prev_y + (recorder.fpdf.page - prev_page) * self.eph # type: ignore
         if prev_y + y_scroll > self.page_break_trigger or recorder.fpdf.page > prev_page: # type: ignore
             recorder.rewind()
+            if layout_mark is not None:
+                recorder.pdf.fpdf.layout.truncate(layout_mark)
             # pylint: disable=protected-access
             # Performing this call through .pdf so that it does not get recorded & replayed:
             recorder.pdf.fpdf._perform_page_break()
@@ -437,3 +1451,85 @@ class PDF:
             _copy.fpdf.__dict__ = deepcopy(self.fpdf.__dict__, memo)
             memo[id_self] = _copy
         return _copy
+
+def renumber_elements(elements: list[Element], offset: int) -> list[Element]:
+    """
+    Copy elements with the numbering of figures moved by `offset`
+    """
+    renumbered = []
+    for element in elements:
+        if "numbering" in element:
+            label, index = element["numbering"]
+            element = dict(element, text=label.format(index=index + offset), numbering=[label, index + offset])
+        renumbered.append(element)
+    return renumbered
+
+def split_lines(text: str) -> list[str]:
+    """
+    Lines of text the same way `multi_cell` sees them
+    """
+    lines = text.replace("\r", "").split("\n")
+    if len(lines) > 1 and not lines[-1]:
+        lines.pop()
+    return lines
+
+def wrap_runs(runs: list[TextRun], columns: int) -> list[list[TextRun]]:
+    """
+    Wrap line of monospace text so that every part has at most `columns`
+    characters. Lines are broken at the last space that fits, like fpdf does,
+    or anywhere if there is none. The space at a break is dropped.
+    """
+    line = "".join(text for text, _, _ in runs)
+    if len(line) <= columns:
+        return [runs]
+
+    spans = []
+    start = 0
+    while len(line) - start > columns:
+        end = start + columns
+        space = line.rfind(" ", start + 1, end + 1)
+        if space == -1:
+            spans.append((start, end))
+            start = end
+        else:
+            spans.append((start, space))
+            start = space + 1
+    spans.append((start, len(line)))
+
+    wrapped = []
+    for start, end in spans:
+        parts = []
+        run_start = 0
+        for text, style, color in runs:
+            run_end = run_start + len(text)
+            if run_start < end and run_end > start:
+                parts.append((text[max(start - run_start, 0):end - run_start], style, color))
+            run_start = run_end
+        wrapped.append(parts)
+    return wrapped
+
+def render_layout(
+        layout: Layout,
+        filename: str,
+        subset_cache: Optional[FontSubsetCache] = None,
+        creation_date: Optional[datetime] = None,
+        compression_level: Optional[int] = None
+    ) -> bool:
+    """
+    Turn a recorded layout back into a pdf. Returns false if the pdf already
+    existed with the same content.
+    """
+    fpdf = PatchedFPDF(None, "portrait", layout.unit, layout.page_size, record=False, subset_cache=subset_cache)
+    fpdf.set_creation_date(creation_date)
+    if compression_level is not None:
+        fpdf.compression_level = compression_level
+    for family, style, fname, uni in layout.fonts:
+        fpdf.add_font(family, style, fname, uni)
+    fpdf.set_auto_page_break(False)
+
+    for page in layout.pages:
+        fpdf.add_page()
+        fpdf.draw_elements(page.elements, layout.images)
+        fpdf.draw_elements(page.footer, layout.images)
+
+    return write_if_changed(filename, bytes(fpdf.output()))
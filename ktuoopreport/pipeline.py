@@ -0,0 +1,44 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+class Pipeline:
+    """
+    Runs jobs in background workers, while their results are consumed one by
+    one in the same order as the jobs were given. At most `lookahead` jobs are
+    being run or waiting to be consumed at any time, so finished results don't
+    pile up in memory while the consumer is busy.
+    """
+    max_workers: Optional[int]
+    lookahead: int
+
+    def __init__(self, max_workers: Optional[int] = None, lookahead: int = 8) -> None:
+        assert lookahead > 0, "Pipeline lookahead must be positive"
+        self.max_workers = max_workers
+        self.lookahead = lookahead
+
+    def run(self, jobs: Iterable[Callable[[], T]]) -> Iterator[T]:
+        jobs = iter(jobs)
+        pending: deque[Future] = deque()
+
+        with ThreadPoolExecutor(self.max_workers, thread_name_prefix="prefetch") as executor:
+            try:
+                for job in jobs:
+                    pending.append(executor.submit(job))
+                    if len(pending) >= self.lookahead:
+                        break
+
+                while len(pending) > 0:
+                    future = pending.popleft()
+
+                    # Keep the workers busy, while the consumer is processing
+                    job = next(jobs, None)
+                    if job is not None:
+                        pending.append(executor.submit(job))
+
+                    yield future.result()
+            finally:
+                for future in pending:
+                    future.cancel()
@@ -0,0 +1,41 @@
+from contextlib import contextmanager
+import logging
+import time
+
+from .execution import ResourceUsage
+
+# Profiling output is only shown when this logger is enabled, for example
+# with the `--profile` flag in main.py
+logger = logging.getLogger("ktuoopreport.profiling")
+
+def enable():
+    """
+    Show profiling output on stderr
+    """
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("[profile] %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+def is_enabled() -> bool:
+    return logger.isEnabledFor(logging.INFO)
+
+@contextmanager
+def timed(label: str):
+    """
+    Log how long the block took to run
+    """
+    started_at = time.perf_counter()
+    yield
+    logger.info("%s: %.3fs", label, time.perf_counter() - started_at)
+
+def log_usage(label: str, usage: ResourceUsage):
+    max_rss = "n/a" if usage.max_rss is None else f"{usage.max_rss / (1024 * 1024):.1f} MiB"
+    logger.info(
+        "%s: wall %.3fs, user %.3fs, sys %.3fs, max rss %s",
+        label,
+        usage.wall_time,
+        usage.user_time,
+        usage.system_time,
+        max_rss
+    )
@@ -0,0 +1,82 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing.context import BaseContext
+from typing import Callable, Optional
+import multiprocessing
+import os
+
+from .spool import ImageSpool, default_image_spool, write_spooled
+
+class RenderedImage:
+    """
+    Image which is being rendered in the background into a file of the image
+    spool. Documents take these like any other image, and only wait for them
+    when they get to the figure.
+    """
+    future: "Future[str]"
+
+    def __init__(self, future: "Future[str]") -> None:
+        self.future = future
+
+    def get_path(self) -> str:
+        return self.future.result()
+
+    def get_data(self) -> bytes:
+        with open(self.get_path(), "rb") as f:
+            return f.read()
+
+def render_into(directory: str, function: Callable[..., bytes], *args) -> str:
+    return write_spooled(directory, function(*args))
+
+def get_process_context() -> BaseContext:
+    """
+    Context for process pools. They are started while other threads are
+    running (compressing, waiting for programs), so their workers are not
+    forked from this process but started fresh.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+class RenderPool:
+    """
+    Processes for rendering images with Pillow, which holds the GIL and would
+    slow down layout if it was done in threads. Functions which are submitted
+    must return encoded image data, which is written into the spool, so only
+    its path is sent back. They are run in place when there is only one CPU.
+    """
+    max_workers: Optional[int]
+    spool: ImageSpool
+    executor: Optional[ProcessPoolExecutor]
+    # Process which created the executor, forked processes make their own
+    pid: Optional[int]
+
+    def __init__(self, max_workers: Optional[int] = None, spool: Optional[ImageSpool] = None) -> None:
+        self.max_workers = max_workers
+        self.spool = spool or default_image_spool
+        self.executor = None
+        self.pid = None
+
+    def submit(self, function: Callable[..., bytes], *args) -> RenderedImage:
+        directory = self.spool.open()
+        workers = self.max_workers or os.cpu_count() or 1
+        if workers <= 1:
+            future: "Future[str]" = Future()
+            try:
+                future.set_result(render_into(directory, function, *args))
+            except Exception as e:
+                future.set_exception(e)
+            return RenderedImage(future)
+
+        if self.executor is None or self.pid != os.getpid():
+            self.executor = ProcessPoolExecutor(workers, mp_context=get_process_context())
+            self.pid = os.getpid()
+        return RenderedImage(self.executor.submit(render_into, directory, function, *args))
+
+    def shutdown(self):
+        if self.executor is not None and self.pid == os.getpid():
+            self.executor.shutdown()
+        self.executor = None
+        self.pid = None
+
+# Used by sections which were not given a pool
+default_render_pool = RenderPool()
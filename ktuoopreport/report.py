@@ -2,6 +2,8 @@ from dataclasses import dataclass, field
 from typing import Union
 from enum import Enum
 
+from .schema import Section
+
 class Gender(str, Enum):
     MALE = "male"
     FEMALE = "female"
@@ -18,7 +20,9 @@ class Report:
     student: Union[Person, list[Person]]
     lecturer: Person
 
-    sections: list[dict] = field(default_factory=list)
+    # Sections can also be given as dicts, which are checked against the
+    # schema of the generator when the report is generated
+    sections: list[Section] = field(default_factory=list)
 
     def __str__(self) -> str:
         return f"Report[{self.title}]"
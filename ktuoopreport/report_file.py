@@ -0,0 +1,51 @@
+from typing import Any
+
+try:
+    import tomllib
+    TomlDecodeError = tomllib.TOMLDecodeError
+except ImportError: # Python < 3.11
+    import toml
+    tomllib = None
+    TomlDecodeError = toml.TomlDecodeError
+
+from .report import Report, Person, Gender
+from .schema import SectionSchema, SchemaError
+
+def read_toml(filename: str) -> dict[str, Any]:
+    if tomllib is None:
+        return toml.load(filename)
+    with open(filename, "rb") as f:
+        return tomllib.load(f)
+
+def parse_person(data: Any, where: str) -> Person:
+    if not isinstance(data, dict) or not isinstance(data.get("name"), str):
+        raise SchemaError(f"Expected '{where}' to be a table with a 'name'")
+    try:
+        gender = Gender(data.get("gender"))
+    except ValueError:
+        options = ", ".join(f"'{gender.value}'" for gender in Gender)
+        raise SchemaError(f"Expected 'gender' of '{where}' to be one of: {options}")
+    return Person(data["name"], gender)
+
+def parse_report(data: dict[str, Any], schema: SectionSchema, base_directory: str = "") -> Report:
+    """
+    Check that a parsed report file has everything a report needs, with
+    sections of the given schema. Paths in sections are resolved relative to
+    `base_directory`.
+    """
+    title = data.get("title")
+    if not isinstance(title, str):
+        raise SchemaError("Missing 'title' field")
+
+    student = data.get("student")
+    if isinstance(student, list):
+        students = [parse_person(person, "student") for person in student]
+    else:
+        students = parse_person(student, "student")
+
+    return Report(
+        title = title,
+        student = students,
+        lecturer = parse_person(data.get("lecturer"), "lecturer"),
+        sections = schema.parse_sections(data.get("sections", []), base_directory)
+    )
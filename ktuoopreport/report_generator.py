@@ -1,13 +1,12 @@
-from dataclasses import dataclass
-from math import ceil
-from PIL import Image as ImageUtils
-from PIL.Image import Image
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from dataclasses import dataclass, replace
+from functools import partial
+from typing import Any, Callable, Iterator, Optional
 from fpdf.fpdf import TitleStyle
-from fpdf.outline import OutlineSection
 import os.path as path
-import sys
-from datetime import date
-from ktuoopreport.dotnet import pushd
+import os
+from datetime import date, datetime, timezone
 from ktuoopreport.sections.class_diagram import ClassDiagramSection
 from ktuoopreport.sections.interface_scheme import InterfaceSchemeSection
 
@@ -17,13 +16,42 @@ from ktuoopreport.sections.project_tests import ProjectTestsSection
 from ktuoopreport.sections.updated_interface_properties import UpdatedInterfacePropertiesSection
 
 from .sections import SectionGenerator
+from .schema import Section, SectionSchema
+from .build_registry import BuildRegistry, PrebuiltRegistry
+from .pipeline import Pipeline
+from .layout import Layout, LayoutCache
+from .fonts import FontSubsetCache
+from .render_pool import default_render_pool, get_process_context
+from .spool import default_image_spool
+from . import profiling
 
 from .report import Report, Gender
+from .document import Document, TitlePage
 from .pdf import PDF, FontStyle
-
-current_year = date.today().year
-
-ON_POSIX = 'posix' in sys.builtin_module_names
+from .html_document import HtmlDocument
+from .latex_document import LatexDocument
+
+def get_source_date() -> Optional[datetime]:
+    """
+    Date given by SOURCE_DATE_EPOCH, which reproducible builds use instead of
+    the current time
+    """
+    epoch = os.environ.get("SOURCE_DATE_EPOCH")
+    if not epoch:
+        return None
+    return datetime.fromtimestamp(int(epoch), timezone.utc)
+
+current_year = (get_source_date() or date.today()).year
+
+def get_creation_date(reproducible: bool = False) -> Optional[datetime]:
+    """
+    Date put into documents, None for the current time. Reproducible
+    documents get the start of the year which is on their title page.
+    """
+    source_date = get_source_date()
+    if source_date is None and reproducible:
+        return datetime(current_year, 1, 1, tzinfo=timezone.utc)
+    return source_date
 
 @dataclass
 class SectionEntry:
@@ -32,6 +60,7 @@ class SectionEntry:
 
 class ReportGenerator:
     sections: list[SectionEntry]
+    schema: SectionSchema
     report: Report
 
     toc_title: str = "TURINYS"
@@ -43,26 +72,213 @@ class ReportGenerator:
     title_page_footer: str = f"Kaunas {current_year}"
     title_page_seperator_color: tuple[int, int, int] = (212, 175, 55)
 
-    toc_section_spacing_above = 0.21
-    toc_section_spacing_below = 0.35
+    prefetch_workers: Optional[int] = None
+    prefetch_lookahead: int = 8
+    # Resolution of figures in pdfs, the pdf's default is used if it's None
+    image_dpi: Optional[int] = None
+    # zlib level of pdfs, zlib's default is used if it's None
+    compression_level: Optional[int] = None
+    # Sections of pdfs are laid out in this many processes, 0 is one per CPU
+    layout_processes: int = 1
+    # Don't put the current time into documents, so that generating the same
+    # report again gives exactly the same file
+    reproducible: bool = False
+    # Numbers (from 1) of the only sections to generate, for quick previews.
+    # Previews have no title page or table of contents, but sections keep
+    # the numbers they have in the full report.
+    selected_sections: Optional[set[int]] = None
+    # Leave out the parts of sections which run tests, only their titles are kept
+    skip_tests: bool = False
 
     def __init__(self, sections: list[SectionEntry]) -> None:
         self.sections = sections
+        self.schema = SectionSchema(
+            field for entry in sections for field in entry.generator.get_fields()
+        )
 
         self.total_sections = 0
 
-    def generate(self, report: Report, output: str):
-        pdf = self._create_base_pdf()
-
-        self.add_title_page(pdf, report)
-        self.add_toc_page(pdf, report)
-        for section in report.sections:
-            self.add_section(pdf, section, report)
-
-        pdf.save_to_file(output)
-
-    def _create_base_pdf(self) -> PDF:
-        pdf = PDF("portrait", "A4")
+    def generate(
+            self,
+            report: Report,
+            output: str,
+            layout_file: Optional[str] = None,
+            layout_cache: Optional[LayoutCache] = None,
+            font_cache: Optional[FontSubsetCache] = None
+        ) -> bool:
+        """
+        Generate report into `output`, the type of document is picked from
+        its extension. For pdfs the recorded layout can be saved to
+        `layout_file`, the layouts of unchanged sections are taken from
+        `layout_cache` instead of generating them again, and embedded font
+        subsets are taken from `font_cache`.
+
+        Returns false if `output` already had exactly the same content, in
+        which case it's not written again.
+        """
+        # Sections given as dicts are checked here, instead of when loading
+        report = replace(report, sections=self.schema.parse_sections(report.sections))
+        selected = self.get_selected_indices(report)
+
+        document = self.create_document(output, font_cache)
+        pdf = document if isinstance(document, PDF) else None
+        if pdf is None:
+            # Only pdfs have a layout
+            layout_file = layout_cache = None
+
+        cache_keys: list[Optional[str]] = [None] * len(report.sections)
+        cached: list[Optional[Layout]] = [None] * len(report.sections)
+        if layout_cache:
+            for i, section in enumerate(report.sections):
+                cache_keys[i] = self.get_cache_key(layout_cache, section, report)
+                cached[i] = layout_cache.get(cache_keys[i]) # type: ignore
+
+        # Figures of sections left out of a preview are counted from their
+        # cached layouts, so the rest are numbered like in the full report
+        skipped_layouts = cached
+        if self.selected_sections is not None:
+            # Previewed sections start on other pages than in the full
+            # report, so they are always laid out again and never cached
+            cached = [None] * len(report.sections)
+            layout_cache = None
+
+        processes = self.layout_processes or os.cpu_count() or 1
+        parallel = pdf is not None and processes > 1
+        if parallel:
+            # Figures of cached sections can be renumbered, but the numbers
+            # of sections are part of their titles
+            for i, cached_layout in enumerate(cached):
+                if cached_layout is not None and cached_layout.start["section_levels"] != [i + 1]:
+                    cached[i] = None
+
+        try:
+            builds = BuildRegistry()
+            try:
+                # Validate all sections and start needed builds before layout.
+                # Cached sections don't need any builds.
+                for i in selected:
+                    self.prepare_section(report.sections[i], report, builds, request_builds=cached[i] is None)
+
+                if self.selected_sections is None:
+                    self.add_title_page(document, report)
+                    self.add_toc_page(document, report)
+
+                if parallel:
+                    self.add_sections_in_parallel(pdf, report, builds, processes, selected, cache_keys, cached, skipped_layouts, layout_cache) # type: ignore
+                else:
+                    self.add_sections(document, report, builds, selected, cache_keys, cached, skipped_layouts, layout_cache)
+            finally:
+                builds.cleanup()
+
+            with profiling.timed("Saving document"):
+                changed = document.save_to_file(output)
+
+            if pdf and layout_file:
+                with profiling.timed("Saving layout"):
+                    pdf.layout.save(layout_file)
+        finally:
+            # Spooled images and the workers which render them were only
+            # needed by this document
+            default_render_pool.shutdown()
+            default_image_spool.cleanup()
+        return changed
+
+    def add_sections(
+            self,
+            document: Document,
+            report: Report,
+            builds: BuildRegistry,
+            selected: list[int],
+            cache_keys: list[Optional[str]],
+            cached: list[Optional[Layout]],
+            skipped_layouts: list[Optional[Layout]],
+            layout_cache: Optional[LayoutCache]
+        ):
+        """
+        Lay out selected sections one after another, while their inputs are
+        prepared in the background
+        """
+        pdf = document if isinstance(document, PDF) else None
+        # Heavy inputs of later sections are prepared in the background,
+        # while earlier sections are being laid out
+        uncached_sections = [report.sections[i] for i in selected if cached[i] is None]
+        pipeline = Pipeline(self.prefetch_workers, self.prefetch_lookahead)
+        with closing(pipeline.run(self.get_prefetch_jobs(uncached_sections, report, builds))) as prefetched:
+            for i in selected:
+                section, cache_key, cached_layout = report.sections[i], cache_keys[i], cached[i]
+                with profiling.timed(f"Section '{section.title}'"):
+                    document.add_page()
+                    self.skip_to_section(document, i, skipped_layouts)
+                    if pdf is None or layout_cache is None:
+                        self.add_section(document, section, report, prefetched)
+                        continue
+
+                    start = pdf.get_layout_state()
+                    if cached_layout is not None:
+                        if cached_layout.start == start:
+                            pdf.replay_section(cached_layout)
+                            continue
+                        # Section was cached at a different place in the
+                        # report, so its numbering would be wrong
+                        self.prepare_section(section, report, builds)
+                        section_data = self.prefetch_section(section, report, builds)
+                    else:
+                        section_data = prefetched
+
+                    first_page = pdf.page
+                    self.add_section(pdf, section, report, section_data)
+                    layout_cache.put(cache_key, pdf.get_section_layout(first_page, start)) # type: ignore
+
+    def add_sections_in_parallel(
+            self,
+            pdf: PDF,
+            report: Report,
+            builds: BuildRegistry,
+            processes: int,
+            selected: list[int],
+            cache_keys: list[Optional[str]],
+            cached: list[Optional[Layout]],
+            skipped_layouts: list[Optional[Layout]],
+            layout_cache: Optional[LayoutCache]
+        ):
+        """
+        Lay out each section which isn't cached in a worker process, and merge
+        them into the pdf in order. Sections are laid out from the numbering
+        of sections they will have, so only their figures are renumbered when
+        merging. Page numbers, the outline and the table of contents are made
+        by the pdf they are merged into.
+        """
+        # Workers get their own copies of the builds, once all are done
+        executables = builds.get_all()
+        # Workers spool images into the same folder, which is removed here
+        spool_directory = default_image_spool.open()
+        # Workers don't inherit the logging set up in this process
+        initializer = profiling.enable if profiling.is_enabled() else None
+        with ProcessPoolExecutor(processes, mp_context=get_process_context(), initializer=initializer) as executor:
+            fragments = {
+                i: executor.submit(layout_section_fragment, self, report, i, executables, spool_directory)
+                for i in selected
+                if cached[i] is None
+            }
+            for i in selected:
+                section = report.sections[i]
+                with profiling.timed(f"Section '{section.title}'"):
+                    pdf.add_page()
+                    self.skip_to_section(pdf, i, skipped_layouts)
+                    start = pdf.get_layout_state()
+                    first_page = pdf.page
+                    fragment = cached[i] or fragments[i].result()
+                    pdf.replay_section(fragment, pdf.numbering_index - fragment.start["numbering_index"])
+                    if layout_cache is not None and cached[i] is None:
+                        layout_cache.put(cache_keys[i], pdf.get_section_layout(first_page, start)) # type: ignore
+
+    def _create_base_pdf(self, font_cache: Optional[FontSubsetCache] = None) -> PDF:
+        pdf = PDF("portrait", "A4", subset_cache=font_cache)
+        pdf.set_creation_date(get_creation_date(self.reproducible))
+        if self.image_dpi is not None:
+            pdf.image_dpi = self.image_dpi
+        if self.compression_level is not None:
+            pdf.set_compression_level(self.compression_level)
 
         pdf.add_font(FontStyle(
             name = "times-new-roman",
@@ -118,99 +334,23 @@ class ReportGenerator:
 
         return pdf
 
-    def add_toc_page(self, pdf: PDF, report: Report):
-        """
-        Add table of contents to page
+    def create_document(self, output: str, font_cache: Optional[FontSubsetCache] = None) -> Document:
         """
-        toc_height = self.get_effective_toc_height(pdf, report.sections)
-        # Adjust for title that is at the top of the page
-        eph = pdf.eph - (0.5 + pdf.get_font_height(12))
-        toc_height += pdf.get_font_height(12)
-
-        def render_toc(*vargs):
-            self.render_toc(*vargs)
-
-        pages = max(1, ceil(toc_height / eph))
-        pdf.insert_toc_placeholder(render_toc, pages)
-
-    # Used for determining how many pages should be inserted in placeholder
-    def get_effective_toc_height(self, pdf: PDF, sections: list[dict]) -> float:
+        Pick the type of document from the extension of the output file
         """
-        Estimate how much space the table of contents is gonna take up
+        extension = path.splitext(output)[1].lower()
+        if extension in (".html", ".htm"):
+            return HtmlDocument()
+        if extension == ".tex":
+            return LatexDocument(path.splitext(output)[0] + "-images")
+        return self._create_base_pdf(font_cache)
+
+    def add_toc_page(self, document: Document, report: Report):
         """
-        section_text_height = pdf.get_font_height(14)
-        subsection_text_height = pdf.get_font_height(12)
-        margins = self.toc_section_spacing_above + self.toc_section_spacing_below
-        height = 0
-
-        for _ in sections:
-            height += section_text_height + margins
-            height += len(self.sections) * (subsection_text_height + margins)
-
-        return height
-
-    def render_toc(self, pdf: PDF, outline: list[OutlineSection]) -> None:
-        """
-        Render table of contents
-        """
-        page_top_y = pdf.top_margin + 0.5 + pdf.get_font_height(12)
-        pdf.set_cursor(y=page_top_y)
-        pdf.set_font("times-new-roman", 12)
-        pdf.print(self.toc_title, w=0, align="C")
-        pdf.newline()
-
-        for i in range(len(outline)):
-            outlineSection = outline[i]
-            level = int(outlineSection.level)
-
-            # Only render up to 1 level deep
-            if level > 1: continue
-
-            # Update font
-            if level == 0:
-                pdf.set_font("times-new-roman", 14, bold = True)
-            else:
-                pdf.set_font("times-new-roman", 12)
-
-            # Ensure that text will not be places outside of a page
-            h = self.toc_section_spacing_above + pdf.get_font_height()
-            pdf.perform_page_break_if_need_be(h)
-
-            # Move cursor where the section label will be placed
-            pdf.set_cursor(x=pdf.left_margin)
-            pdf.move_cursor(dy=self.toc_section_spacing_above)
-
-            # Indent outline section
-            if level > 0:
-                pdf.move_cursor(dx=1)
-
-            self.render_toc_section(pdf, outlineSection)
-
-            pdf.move_cursor(dy=pdf.get_font_height())
-            pdf.move_cursor(dy=self.toc_section_spacing_below)
-
-    def render_toc_section(self, pdf: PDF, outline: OutlineSection):
-        """
-        Render a single section from the table of contents
+        Add table of contents to page
         """
-        x = pdf.get_x()
-
-        pdf.write(outline.name)
-
-        text_width = pdf.get_string_width(outline.name)
-        page_width = pdf.get_page_width()
-        left_over_space = page_width - pdf.right_margin - (x + text_width)
-
-        page_number_width = pdf.get_string_width(str(outline.page_number))
-        dot_width = pdf.get_string_width('.')
-        needed_dots = round((left_over_space - page_number_width)/dot_width - 0.1)
-
-        page_number_txt = "." * needed_dots + str(outline.page_number)
-
-        pdf.set_cursor(
-            x=-pdf.get_string_width(page_number_txt)-pdf.right_margin
-        )
-        pdf.write(page_number_txt)
+        section_count = len(report.sections)
+        document.add_table_of_contents(self.toc_title, section_count, section_count * len(self.sections))
 
     @staticmethod
     def _get_people_from_report(report: Report) -> list[tuple[str, str]]:
@@ -231,93 +371,127 @@ class ReportGenerator:
             people.append((report.lecturer.name, "Dėstytoja"))
         return people
 
-    def add_title_page(self, pdf: PDF, report: Report) -> None:
+    def add_title_page(self, document: Document, report: Report) -> None:
         """
         Add title page by getting needed information from a report
         """
-        pdf.add_page()
-
-        font_size_pt = 12
-        font_height = pdf.get_font_height(font_size_pt)
-
-        pdf.fpdf.set_y(pdf.fpdf.t_margin + 0.5 + 12/pdf.fpdf.k)
-        pdf.image(self.university_icon, 1.78, 2.04, centered=True)
-
-        pdf.set_font("times-new-roman", font_size_pt, bold = True)
-        pdf.print(self.university_name, w=0, h=font_height*1.5, align="C")
-
-        pdf.set_font("times-new-roman", font_size_pt)
-        pdf.print(self.faculty_name, w=0, align="C")
-
-        # Middle part (title)
-        pdf.newline(font_height*15)
-
-        pdf.set_font("times-new-roman", 18, bold = True)
-        pdf.print(report.title, w=0, align="C")
-
-        pdf.set_font("times-new-roman", 14)
-        pdf.print(self.sub_title, w=0, align="C")
-
-        # Student name and professort name section
-        font_height = pdf.get_font_height()
-        pdf.newline(font_height*4)
-
-        width = pdf.get_page_width()
-
-        # Seperator
-        y = pdf.get_y()
-        pdf.set_draw_color(self.title_page_seperator_color)
-        pdf.line(width/2+font_height, y, width-pdf.right_margin, y)
-        pdf.newline(font_height*2)
-
-        people = self._get_people_from_report(report)
-        for i in range(len(people)):
-            name, lecturer = people[i]
-
-            pdf.set_font("times-new-roman", 12, bold = True)
-            pdf.set_cursor(x=width/2 + font_height)
-            pdf.print(name, w=width/2, align="L")
-            pdf.newline()
-
-            pdf.set_font("times-new-roman", 12)
-            pdf.set_cursor(x=width/2 + font_height)
-            pdf.print(lecturer, w=width/2, align="L")
-            pdf.newline()
-            pdf.newline()
-            pdf.newline()
-
-        # Seperator
-        y = pdf.get_y()
-        pdf.set_draw_color(self.title_page_seperator_color)
-        pdf.line(width/2+font_height, y, width-pdf.right_margin, y)
-        pdf.newline(font_height*2)
-
-        # Footer
-        pdf.set_font("times-new-roman", 12, bold = True)
-        pdf.set_cursor(y=-font_height*2-pdf.bottom_margin)
-        pdf.write(self.title_page_footer, w=0, align="C")
-
-    def add_section(self, pdf: PDF, section: dict, report: Report) -> None:
-        title = section["title"]
-        assert type(title) == str, "Missing 'title' field in section"
+        document.add_title_page(TitlePage(
+            university_name = self.university_name,
+            faculty_name = self.faculty_name,
+            university_icon = self.university_icon,
+            title = report.title,
+            sub_title = self.sub_title,
+            people = self._get_people_from_report(report),
+            footer = self.title_page_footer,
+            seperator_color = self.title_page_seperator_color,
+        ))
 
+    def get_selected_indices(self, report: Report) -> list[int]:
+        """
+        Indexes of sections which will be generated, in order. Raises
+        ValueError if the report doesn't have a selected section.
+        """
+        if self.selected_sections is None:
+            return list(range(len(report.sections)))
+        for number in sorted(self.selected_sections):
+            if not 1 <= number <= len(report.sections):
+                raise ValueError(f"Report has no section {number}, it has {len(report.sections)} sections")
+        return sorted(number - 1 for number in self.selected_sections)
+
+    def skip_to_section(self, document: Document, index: int, skipped_layouts: list[Optional[Layout]]):
+        """
+        Continue numbering as if the sections before `index` which were left
+        out of a preview were there. Only figures of sections with a cached
+        layout can be counted.
+        """
+        for skipped in range(document.section_levels[-1] - 1, index):
+            layout = skipped_layouts[skipped]
+            if layout is not None:
+                document.numbering_index += layout.end["numbering_index"] - layout.start["numbering_index"]
+        document.section_levels[-1] = index + 1
+
+    def is_generated(self, entry: SectionEntry, section: Section, report: Report) -> bool:
+        if self.skip_tests and entry.generator.runs_tests:
+            return False
+        return entry.generator.has_required_fields(section, report)
+
+    def prepare_section(self, section: Section, report: Report, builds: BuildRegistry, request_builds: bool = True) -> None:
         for entry in self.sections:
-            if entry.generator.has_required_fields(section, report):
+            if self.is_generated(entry, section, report):
                 entry.generator.assert_fields(section, report)
+                if request_builds:
+                    entry.generator.request_builds(section, report, builds)
+
+    def get_prefetch_jobs(self, sections: list[Section], report: Report, builds: BuildRegistry) -> Iterator[Callable[[], Any]]:
+        """
+        List prefetch jobs in the same order as `add_section` will consume them
+        """
+        for section in sections:
+            for entry in self.sections:
+                if self.is_generated(entry, section, report):
+                    yield partial(entry.generator.prefetch, section, report, builds)
 
-        pdf.add_page()
+    def prefetch_section(self, section: Section, report: Report, builds: BuildRegistry) -> Iterator[Any]:
+        """
+        Prefetch inputs of a single section in place, when it was not done in
+        the background
+        """
+        for entry in self.sections:
+            if self.is_generated(entry, section, report):
+                yield entry.generator.prefetch(section, report, builds)
+
+    def get_cache_key(self, cache: LayoutCache, section: Section, report: Report) -> str:
+        return cache.get_key(
+            type(self).__name__,
+            [entry.title for entry in self.sections],
+            report.title,
+            self.image_dpi,
+            self.skip_tests,
+            section.to_dict()
+        )
 
-        pdf.push_section("{level} {title}", title=title)
+    def add_section(self, document: Document, section: Section, report: Report, prefetched: Iterator[Any]) -> None:
+        document.push_section("{level} {title}", title=section.title)
         for entry in self.sections:
-            pdf.push_section("{level} {title}", title=entry.title)
-            if entry.generator.has_required_fields(section, report):
-                entry.generator.generate(pdf, section, report)
+            document.push_section("{level} {title}", title=entry.title)
+            if self.is_generated(entry, section, report):
+                entry.generator.generate(document, section, report, next(prefetched))
             else:
-                pdf.newline()
-                pdf.newline()
-                pdf.newline()
-            pdf.pop_section()
-        pdf.pop_section()
+                document.newline()
+                document.newline()
+                document.newline()
+            document.pop_section()
+        document.pop_section()
+
+def layout_section_fragment(
+        generator: ReportGenerator,
+        report: Report,
+        index: int,
+        executables: dict[str, Optional[str]],
+        spool_directory: str
+    ) -> Layout:
+    """
+    Lay out a single section into a pdf of its own, as if it was the only
+    section after the table of contents. This is run in worker processes.
+    """
+    # Sections are already laid out in parallel, images are rendered in place
+    default_render_pool.max_workers = 1
+    default_image_spool.use(spool_directory)
+
+    section = report.sections[index]
+    pdf = generator._create_base_pdf()
+    pdf.section_levels = [index + 1]
+    pdf.add_page()
+    pdf.set_font(pdf.body_font_family, pdf.body_font_size)
+    start = pdf.get_layout_state()
+
+    builds = PrebuiltRegistry(executables)
+    try:
+        generator.prepare_section(section, report, builds)
+        generator.add_section(pdf, section, report, generator.prefetch_section(section, report, builds))
+    finally:
+        builds.cleanup()
+    return pdf.get_section_layout(1, start)
 
 class ReportGenerator1(ReportGenerator):
     def __init__(self) -> None:
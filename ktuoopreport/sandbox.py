@@ -0,0 +1,219 @@
+from typing import Optional
+import os.path as path
+import os
+import shutil
+import tempfile
+import errno
+
+# ioctl request for cloning a file on copy-on-write filesystems (btrfs, xfs)
+FICLONE = 0x40049409
+
+# Names of files in the test folder, which are not given to the program
+SPECIAL_TEST_FILES = ("stdin.txt",)
+
+# File identity used for detecting if the program created or changed a file
+FileSignature = tuple[int, int, int]
+
+def get_signature(filename: str) -> FileSignature:
+    info = os.stat(filename, follow_symlinks=False)
+    return info.st_ino, info.st_size, info.st_mtime_ns
+
+def list_directories(directory: str) -> set[str]:
+    """
+    Returns relative paths of all sub folders in directory
+    """
+    directories = set()
+    for root, dirs, _ in os.walk(directory):
+        for name in dirs:
+            directories.add(path.relpath(path.join(root, name), directory))
+    return directories
+
+def snapshot_directory(directory: str) -> dict[str, FileSignature]:
+    """
+    Returns signatures of all files in directory, keyed by their relative path
+    """
+    snapshot = {}
+    for root, _, files in os.walk(directory):
+        for name in files:
+            filename = path.join(root, name)
+            snapshot[path.relpath(filename, directory)] = get_signature(filename)
+    return snapshot
+
+def reflink_file(source: str, destination: str):
+    import fcntl
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(destination)
+            raise
+
+class TestSandbox:
+    """
+    Places the files of a test case next to the executable, without copying
+    the whole test folder. Input files are cloned in with a reflink where the
+    filesystem supports it, and copied otherwise, so the program can never
+    change the original test data. After the program has run, only the
+    inputs and files which the program created are removed. So the cost of
+    setting up a test depends on how many files change and not on how large
+    the test data is, on filesystems with reflinks.
+
+    Inputs replace build files with the same name (like data files which the
+    project copies to its output directory) while the test runs. The build
+    files are moved aside and put back afterwards.
+    """
+    copy_methods: tuple[str, ...] = ("reflink", "copy")
+
+    working_directory: str
+    test_folder: str
+
+    base_files: dict[str, FileSignature]
+    base_directories: set[str]
+    input_files: dict[str, FileSignature]
+    # Folder into which build files, which are replaced by inputs, are moved
+    shadow_directory: Optional[str]
+    shadowed_files: list[str]
+    copy_method: Optional[str]
+
+    def __init__(self, working_directory: str, test_folder: str) -> None:
+        assert path.isdir(working_directory), "Failed to verify that given working directory is a folder"
+        assert path.isdir(test_folder), "Failed to verify that given test folder is a folder"
+
+        self.working_directory = working_directory
+        self.test_folder = test_folder
+        self.base_files = {}
+        self.base_directories = set()
+        self.input_files = {}
+        self.shadow_directory = None
+        self.shadowed_files = []
+        self.copy_method = None
+
+    def __enter__(self) -> "TestSandbox":
+        self.setup()
+        return self
+
+    def __exit__(self, *args):
+        self.cleanup()
+
+    def setup(self):
+        self.base_files = snapshot_directory(self.working_directory)
+        self.base_directories = list_directories(self.working_directory)
+
+        for root, dirs, files in os.walk(self.test_folder, topdown=True):
+            dirs.sort()
+            relroot = path.relpath(root, self.test_folder)
+            target_root = path.normpath(path.join(self.working_directory, relroot))
+            if not path.isdir(target_root):
+                os.makedirs(target_root)
+
+            for name in sorted(files):
+                relpath = path.normpath(path.join(relroot, name))
+                if relpath in SPECIAL_TEST_FILES:
+                    continue
+
+                target = path.join(self.working_directory, relpath)
+                if relpath in self.base_files:
+                    self.shadow_file(relpath)
+                self.copy_file(path.join(root, name), target)
+                self.input_files[relpath] = get_signature(target)
+
+    def shadow_file(self, relpath: str):
+        """
+        Move a build file out of the way of an input with the same name
+        """
+        if self.shadow_directory is None:
+            # Next to the working directory, so that files are only renamed
+            parent = path.dirname(path.abspath(self.working_directory))
+            self.shadow_directory = tempfile.mkdtemp(prefix=".shadowed-", dir=parent)
+        shadow = path.join(self.shadow_directory, relpath)
+        os.makedirs(path.dirname(shadow), exist_ok=True)
+        os.replace(path.join(self.working_directory, relpath), shadow)
+        self.shadowed_files.append(relpath)
+
+    def restore_shadowed_files(self):
+        if self.shadow_directory is None:
+            return
+        for relpath in self.shadowed_files:
+            target = path.join(self.working_directory, relpath)
+            os.makedirs(path.dirname(target), exist_ok=True)
+            os.replace(path.join(self.shadow_directory, relpath), target)
+        shutil.rmtree(self.shadow_directory)
+        self.shadow_directory = None
+        self.shadowed_files = []
+
+    def copy_file(self, source: str, destination: str):
+        methods = self.copy_methods
+        if self.copy_method:
+            # Start from the method which worked last time
+            methods = methods[methods.index(self.copy_method):]
+
+        for method in methods:
+            try:
+                if method == "reflink":
+                    reflink_file(source, destination)
+                else:
+                    shutil.copy2(source, destination)
+            except (OSError, ImportError) as e:
+                if isinstance(e, OSError) and e.errno == errno.EEXIST:
+                    raise
+                continue
+
+            self.copy_method = method
+            return
+
+        raise OSError(f"Failed to place test file '{source}' into '{destination}'")
+
+    def get_stdin_lines(self) -> list[str]:
+        """
+        Returns the lines from `stdin.txt` in the test folder, if it exists
+        """
+        stdin_file = path.join(self.test_folder, "stdin.txt")
+        if not path.isfile(stdin_file):
+            return []
+        with open(stdin_file, "r") as f:
+            return f.read().strip().splitlines()
+
+    def list_files(self) -> list[str]:
+        """
+        List input files followed by files which the program created or
+        modified, oldest first.
+        """
+        outputs = []
+        for relpath, signature in snapshot_directory(self.working_directory).items():
+            if relpath in self.input_files:
+                continue
+            if self.base_files.get(relpath) != signature:
+                filename = path.join(self.working_directory, relpath)
+                outputs.append((signature[2], filename))
+        outputs.sort()
+
+        files = []
+        for relpath in self.input_files:
+            filename = path.join(self.working_directory, relpath)
+            if path.lexists(filename):
+                files.append(filename)
+        files.extend(filename for _, filename in outputs)
+        return files
+
+    def cleanup(self):
+        """
+        Remove everything that was added to the working directory, and put
+        back build files which inputs replaced
+        """
+        for relpath in snapshot_directory(self.working_directory):
+            if relpath not in self.base_files or relpath in self.shadowed_files:
+                os.remove(path.join(self.working_directory, relpath))
+        self.restore_shadowed_files()
+
+        for root, dirs, _ in os.walk(self.working_directory, topdown=False):
+            for name in dirs:
+                directory = path.join(root, name)
+                if path.relpath(directory, self.working_directory) in self.base_directories:
+                    continue
+                if path.islink(directory):
+                    os.remove(directory)
+                else:
+                    os.rmdir(directory)
+
+        self.input_files = {}
@@ -0,0 +1,136 @@
+from dataclasses import dataclass
+from typing import Any, Iterable, Optional, Union
+import os.path as path
+
+class SchemaError(ValueError):
+    pass
+
+@dataclass(frozen=True)
+class Field:
+    name: str
+    # Only str, int and list (of str) fields are supported
+    type: type = str
+    # Paths are resolved relative to the folder of the report file
+    is_path: bool = False
+
+    def parse(self, value: Any, base_directory: str, where: str) -> Any:
+        if self.type is list:
+            if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+                raise SchemaError(f"Expected field '{self.name}' in {where} to be a list of str")
+            if self.is_path:
+                return [path.join(base_directory, item) for item in value]
+            return list(value)
+
+        if self.type is int:
+            if not isinstance(value, int) or isinstance(value, bool):
+                raise SchemaError(f"Expected field '{self.name}' in {where} to be int")
+            return value
+
+        if not isinstance(value, str):
+            raise SchemaError(f"Expected field '{self.name}' in {where} to be str")
+        if self.is_path:
+            return path.join(base_directory, value)
+        return value
+
+class Section:
+    """
+    Fields of a single section in a report. Each `SectionSchema` makes a
+    subclass of this with a slot for every field its generators use, fields
+    which were not given are None.
+    """
+    __slots__ = ("title",)
+    schema: "SectionSchema"
+    title: str
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        Fields which were given, the same way they were written in the report
+        """
+        values = {"title": self.title}
+        for field in self.schema.fields:
+            value = getattr(self, field.name)
+            if value is not None:
+                values[field.name] = value
+        return values
+
+    def __reduce__(self):
+        # Classes of sections are made at runtime, so they can't be pickled by name
+        return (restore_section, (self.schema, self.to_dict()))
+
+    def __repr__(self) -> str:
+        return f"Section{self.to_dict()!r}"
+
+def restore_section(schema: "SectionSchema", values: dict[str, Any]) -> Section:
+    section = schema.section_type.__new__(schema.section_type)
+    section.title = values["title"]
+    for field in schema.fields:
+        setattr(section, field.name, values.get(field.name))
+    return section
+
+# Classes of sections by their fields, so that equal schemas share them
+section_types: dict[tuple[Field, ...], type[Section]] = {}
+
+class SectionSchema:
+    """
+    Fields which sections of a report can have, collected from the section
+    generators which will read them
+    """
+    fields: tuple[Field, ...]
+    section_type: type[Section]
+
+    def __init__(self, fields: Iterable[Field]) -> None:
+        merged: dict[str, Field] = {}
+        for field in fields:
+            if field.name == "title":
+                raise ValueError("Field 'title' is reserved for the title of sections")
+            other = merged.setdefault(field.name, field)
+            if other != field:
+                raise ValueError(f"Field '{field.name}' is used with different types: {other} and {field}")
+        self.fields = tuple(merged.values())
+
+        section_type = section_types.get(self.fields)
+        if section_type is None:
+            namespace = {
+                "__slots__": tuple(field.name for field in self.fields),
+                "__annotations__": {field.name: Optional[field.type] for field in self.fields},
+            }
+            section_type = type("Section", (Section,), namespace)
+            section_types[self.fields] = section_type
+        self.section_type = section_type
+        self.section_type.schema = self
+
+    def __reduce__(self):
+        return (SectionSchema, (self.fields,))
+
+    def parse_section(self, data: Union[dict, Section], base_directory: str = "", index: int = 0) -> Section:
+        """
+        Check the types of fields of a section from a report file, and resolve
+        paths in it. Fields which none of the generators use are ignored, and
+        sections which were already parsed are returned as is.
+        """
+        if isinstance(data, self.section_type):
+            return data
+        if isinstance(data, Section):
+            data = data.to_dict()
+        where = f"section {index + 1}"
+        if not isinstance(data, dict):
+            raise SchemaError(f"Expected {where} to be a table")
+
+        title = data.get("title")
+        if not isinstance(title, str):
+            raise SchemaError(f"Missing 'title' field in {where}")
+        where = f"section {index + 1} ('{title}')"
+
+        section = self.section_type.__new__(self.section_type)
+        section.title = title
+        for field in self.fields:
+            value = data.get(field.name)
+            if value is not None:
+                value = field.parse(value, base_directory, where)
+            setattr(section, field.name, value)
+        return section
+
+    def parse_sections(self, sections: list, base_directory: str = "") -> list[Section]:
+        if not isinstance(sections, list):
+            raise SchemaError("Expected 'sections' to be a list of tables")
+        return [self.parse_section(section, base_directory, i) for i, section in enumerate(sections)]
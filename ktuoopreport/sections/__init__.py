@@ -1,20 +1,56 @@
 from abc import abstractmethod, ABC
+from typing import Any
 
 from ktuoopreport.report import Report
 
-from ..pdf import PDF
+from ..build_registry import BuildRegistry
+from ..document import Document
+from ..schema import Field, Section
 
 # TODO: Create themes for storing collections of theme font names and sizes
 
 class SectionGenerator(ABC):
+    # Sections which build and run the student's projects can be left out
+    # of quick previews
+    runs_tests: bool = False
 
     @abstractmethod
-    def generate(self, pdf: PDF, section: dict, report: Report):
+    def generate(self, document: Document, section: Section, report: Report, data: Any):
+        """
+        Write the section into the document. `data` is whatever `prefetch`
+        returned for this section.
+        """
         pass
 
     @abstractmethod
-    def assert_fields(self, section: dict, report: Report):
+    def get_fields(self) -> list[Field]:
+        """
+        Fields of sections which this generator reads. Report generators make
+        the schema of their sections out of these, so the types of fields are
+        checked and paths are resolved when the report is loaded.
+        """
         pass
 
-    def has_required_fields(self, section: dict, report: Report) -> bool:
+    def assert_fields(self, section: Section, report: Report):
+        """
+        Check what the schema can't, like whether the files in fields exist
+        """
+        pass
+
+    def has_required_fields(self, section: Section, report: Report) -> bool:
         return False
+
+    def request_builds(self, section: Section, report: Report, builds: BuildRegistry):
+        """
+        Called before any layout is done, so that projects which will be needed
+        could start building in the background.
+        """
+        pass
+
+    def prefetch(self, section: Section, report: Report, builds: BuildRegistry) -> Any:
+        """
+        Prepare the expensive inputs of a section, which don't depend on the
+        layout (test runs, rendered images, parsed files). This is called from
+        a background worker, while previous sections are still being laid out.
+        """
+        return None
@@ -1,8 +1,27 @@
 from ..utils import list_files
 from classdiagramgen import extract_namespaces, merge_similar_namespaces, render_namespaces
 from ..report import Report
+from ..schema import Field, Section
 from . import SectionGenerator
-from ..pdf import PDF
+from ..document import Document
+from ..build_registry import BuildRegistry
+from ..images import encode
+from ..render_pool import RenderPool, RenderedImage, default_render_pool
+
+def render_class_diagrams(filenames: list[str], merge_same_diagrams: bool, font_file: str, font_size: int) -> bytes:
+    """
+    Parse the classes in source files and draw them, encoded as PNG so it
+    could be done in another process
+    """
+    diagrams = []
+    for filename in filenames:
+        for diagram in extract_namespaces(filename):
+            diagrams.append(diagram)
+
+    if merge_same_diagrams:
+        merge_similar_namespaces(diagrams)
+
+    return encode(render_namespaces(diagrams, font_file, font_size), "PNG")
 
 
 class ClassDiagramSection(SectionGenerator):
@@ -10,6 +29,7 @@ class ClassDiagramSection(SectionGenerator):
     diagram_font_size: int = 32
     merge_same_diagrams: bool = False
     numbering_label: str = "{index} pav. \"{title}\" klasių diagrama"
+    render_pool: RenderPool = default_render_pool
 
     def __init__(self,
             field: str,
@@ -21,24 +41,26 @@ class ClassDiagramSection(SectionGenerator):
         self.included_files = included_files
         self.excluded_files = excluded_files
 
-    def generate(self, pdf: PDF, section: dict, report: Report):
-        diagrams = []
-        for filename in list_files(section["project"], self.included_files, self.excluded_files):
-            for diagram in extract_namespaces(filename):
-                diagrams.append(diagram)
-
-        if self.merge_same_diagrams:
-            merge_similar_namespaces(diagrams)
+    def prefetch(self, section: Section, report: Report, builds: BuildRegistry) -> RenderedImage:
+        filenames = list(list_files(getattr(section, self.field), self.included_files, self.excluded_files))
+        return self.render_pool.submit(
+            render_class_diagrams,
+            filenames,
+            self.merge_same_diagrams,
+            self.diagram_font_file,
+            self.diagram_font_size
+        )
 
-        rendered_diagrams = render_namespaces(diagrams, self.diagram_font_file, self.diagram_font_size)
-        with pdf.unbreakable() as pdf: # type: ignore
-            pdf.newline()
-            pdf.image(rendered_diagrams, w=pdf.epw)
-            pdf.add_numbering(self.numbering_label.format(index="{index}", title=section["title"]))
-            pdf.newline()
+    def generate(self, document: Document, section: Section, report: Report, rendered_diagrams: RenderedImage):
+        document.newline()
+        document.add_figure(
+            rendered_diagrams,
+            self.numbering_label.format(index="{index}", title=section.title),
+            full_width = True
+        )
 
-    def has_required_fields(self, section: dict, report: Report) -> bool:
-        return self.field in section
+    def has_required_fields(self, section: Section, report: Report) -> bool:
+        return getattr(section, self.field) is not None
 
-    def assert_fields(self, section: dict, report: Report):
-        assert type(section.get(self.field)) == str, f"Expected field '{self.field}' in section to be str"
+    def get_fields(self) -> list[Field]:
+        return [Field(self.field, is_path=True)]
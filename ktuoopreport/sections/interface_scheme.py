@@ -1,6 +1,7 @@
 from ..report import Report
+from ..schema import Field, Section
 from . import SectionGenerator
-from ..pdf import PDF
+from ..document import Document
 from os.path import exists
 
 class InterfaceSchemeSection(SectionGenerator):
@@ -10,17 +11,18 @@ class InterfaceSchemeSection(SectionGenerator):
         super().__init__()
         self.field = field
 
-    def generate(self, pdf: PDF, section: dict, report: Report):
-        pdf.set_font("times-new-roman", 12)
-        with pdf.unbreakable() as pdf: # type: ignore
-            pdf.newline()
-            pdf.image(section[self.field])
-            pdf.add_numbering(self.numbering_label.format(index="{index}", title=section["title"]))
-            pdf.newline()
+    def generate(self, document: Document, section: Section, report: Report, data: None):
+        document.newline()
+        document.add_figure(
+            getattr(section, self.field),
+            self.numbering_label.format(index="{index}", title=section.title)
+        )
 
-    def has_required_fields(self, section: dict, report: Report) -> bool:
-        return self.field in section
+    def has_required_fields(self, section: Section, report: Report) -> bool:
+        return getattr(section, self.field) is not None
 
-    def assert_fields(self, section: dict, _: Report):
-        assert type(section.get(self.field)) == str, f"Expected field '{self.field}' in section to be str"
-        assert exists(section[self.field]), f"Image '{section[self.field]}' not found"
+    def get_fields(self) -> list[Field]:
+        return [Field(self.field, is_path=True)]
+
+    def assert_fields(self, section: Section, _: Report):
+        assert exists(getattr(section, self.field)), f"Image '{getattr(section, self.field)}' not found"
@@ -1,19 +1,18 @@
 from ..report import Report
+from ..schema import Field, Section
 from . import SectionGenerator
-from ..pdf import PDF
+from ..document import Document
 
 class MarkdownSection(SectionGenerator):
     def __init__(self, field: str):
         super().__init__()
         self.field = field
 
-    def generate(self, pdf: PDF, section: dict, report: Report):
-        pdf.set_font("times-new-roman", 12)
-        pdf.write_markdown(section[self.field])
-        pdf.newline()
+    def generate(self, document: Document, section: Section, report: Report, data: None):
+        document.add_markdown(getattr(section, self.field))
 
-    def has_required_fields(self, section: dict, report: Report) -> bool:
-        return self.field in section
+    def has_required_fields(self, section: Section, report: Report) -> bool:
+        return getattr(section, self.field) is not None
 
-    def assert_fields(self, section: dict, _: Report):
-        assert type(section.get(self.field)) == str, f"Expected field '{self.field}' in section to be str"
+    def get_fields(self) -> list[Field]:
+        return [Field(self.field)]
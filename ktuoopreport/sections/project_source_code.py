@@ -1,11 +1,14 @@
 from typing import Callable
 from ..utils import list_files
 from ..report import Report
+from ..schema import Field, Section
 from . import SectionGenerator
-from ..pdf import PDF
+from ..document import Document
+from ..build_registry import BuildRegistry
 import os.path as path
 
 from .. import dotnet
+from ..files import read_text_file
 
 class ProjectSourceCodeSection(SectionGenerator):
     file_label: str = "{filename}:"
@@ -23,38 +26,51 @@ class ProjectSourceCodeSection(SectionGenerator):
         self.excluded_files = excluded_files
         self.sort_files = sort_files
 
-    def print_colored_file(self, pdf: PDF, filename: str, text: str):
-        pdf.set_font("times-new-roman", 12)
-        with pdf.labeled_block(self.file_label.format(filename=filename)):
-            pdf.set_font("courier-new", 10)
-            pdf.write_syntax_highlighted(text, self.theme, filename)
+    def print_colored_file(self, document: Document, filename: str, text: str):
+        with document.labeled_block(self.file_label.format(filename=filename)):
+            document.add_listing(text, filename, self.theme)
 
-    def generate(self, pdf: PDF, section: dict, report: Report):
-        project_path = section[self.field]
+    def prefetch(self, section: Section, report: Report, builds: BuildRegistry) -> list[tuple[str, str]]:
+        project_path = getattr(section, self.field)
         project_files = list(list_files(project_path, self.included_files, self.excluded_files))
         if self.sort_files:
             project_files = self.sort_files(project_files)
 
-        self.write_files(pdf, project_files, project_path)
+        files = self.read_files(project_files, project_path)
 
-        tests_project_path = section.get("tests_"+self.field)
+        tests_project_path = getattr(section, "tests_" + self.field)
         if tests_project_path != None:
             tests_project_files = list(list_files(tests_project_path, self.included_files, self.excluded_files))
-            self.write_files(pdf, tests_project_files, tests_project_path)
+            files.extend(self.read_files(tests_project_files, tests_project_path))
 
+        return files
 
-    def write_files(self, pdf: PDF, filenames: list[str], relative_to: str):
+    def generate(self, document: Document, section: Section, report: Report, files: list[tuple[str, str]]):
+        for relpath, text in files:
+            self.print_colored_file(document, relpath, text)
+
+    def read_files(self, filenames: list[str], relative_to: str) -> list[tuple[str, str]]:
+        """
+        Returns a list of relative filenames and their contents, binary files
+        are skipped
+        """
+        files = []
         for filename in filenames:
-            text = None
-            with open(filename, "r", encoding="utf-8-sig") as f:
-                text = f.read().strip().replace("\t", "    ")
+            text = read_text_file(filename)
+            if text is None:
+                continue
+            text = text.strip().replace("\t", "    ")
 
             relpath = path.relpath(filename, relative_to)
-            self.print_colored_file(pdf, relpath, text)
+            files.append((relpath, text))
+        return files
+
+    def has_required_fields(self, section: Section, _: Report) -> bool:
+        return getattr(section, self.field) is not None
 
-    def has_required_fields(self, section: dict, _: Report) -> bool:
-        return self.field in section
+    def get_fields(self) -> list[Field]:
+        return [Field(self.field, is_path=True), Field("tests_" + self.field, is_path=True)]
 
-    def assert_fields(self, section: dict, _: Report):
-        project_path = section[self.field]
+    def assert_fields(self, section: Section, _: Report):
+        project_path = getattr(section, self.field)
         assert dotnet.is_project_root(project_path), "Expected to receive path of root project folder"
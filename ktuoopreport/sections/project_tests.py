@@ -1,163 +1,297 @@
+from dataclasses import dataclass
 from glob import glob
 from typing import Optional, Union
 
-from PIL.Image import Image
-from ..console_renderer import render_console
+from ..console_renderer import ConsoleRun, render_console_png, strip_runs
 from . import SectionGenerator
-from ..pdf import PDF
+from ..document import Document, DocumentImage
+from ..build_registry import BuildRegistry
 from ..report import Report
+from ..schema import Field, Section
 from .. import dotnet
+from ..sandbox import TestSandbox
+from ..execution import ExecutionLimits, Stream, TranscriptChunk, decode_transcript
+from ..files import ExcerptLimits, format_size, read_text_excerpt
+from .. import profiling
+from ..render_pool import RenderPool, RenderedImage, default_render_pool
+from ..spool import ImageSpool, default_image_spool
 from os import path
 import os
-from tempfile import TemporaryDirectory
+
+@dataclass
+class TestFile:
+    filename: str
+    # Text of the file, or the path of an image in the image spool
+    content: str
+    is_image: bool = False
+
+@dataclass
+class TestResult:
+    name: str
+    files: list[TestFile]
+    console_image: Optional[RenderedImage] = None
+    error_image: Optional[RenderedImage] = None
 
 class ProjectTestsSection(SectionGenerator):
+    runs_tests: bool = True
     test_label: str = "{level} {test_name} Testas"
     file_label: str = "{filename}:"
     console_label: str = "Konsolės išvestis:"
     console_numbering_label: str = "{index} pav. Konsolės išvestis"
+    error_label: str = "Klaidų išvestis:"
+    error_numbering_label: str = "{index} pav. Klaidų išvestis"
+    truncated_output_label: str = "[... išvestis sutrumpinta ...]"
+    timed_out_label: str = "[... programa sustabdyta po {timeout} s ...]"
+    # Shown instead of the contents of binary files
+    binary_file_label: str = "[dvejetainis failas, {size}]"
+    # Shown between the start and the end of files which are over the limits
+    omitted_lines_label: str = "[... praleista eilučių: {lines} ...]"
 
     image_numbering_label: str = "{index} pav. Ekrano vaizdas"
 
     builld_arguments: list[str] = ["--no-dependencies", "--nologo", "/nowarn:netsdk1138"]
+    execution_limits: ExecutionLimits = ExecutionLimits()
+    # Limits of each file of a test, sections can change them with the
+    # "max_file_lines" and "max_file_bytes" fields (0 for no limit)
+    file_limits: ExcerptLimits = ExcerptLimits(max_lines=300, max_bytes=64 * 1024)
 
     console_font_file: str = "fonts/consolas.ttf"
     console_font_size: int = 24
+    console_background: str = "#000000"
+    console_foreground: str = "#FFFFFF"
+    # Color of what was typed into the program
+    console_input_color: str = "#F9F1A5"
+    # How many times a console can be taller than wide and still fit on a page
+    # together with its labels. Taller consoles are widened, so that they are
+    # scaled down instead of running off the page.
+    console_max_aspect: float = 1.35
+    # Consoles are drawn in these processes, while tests keep running
+    render_pool: RenderPool = default_render_pool
+    # Images which tests produce are copied here
+    image_spool: ImageSpool = default_image_spool
 
     def __init__(self, field: str, tests_folder: str = "tests") -> None:
         super().__init__()
         self.field = field
         self.tests_folder = tests_folder
 
-    def generate(self, pdf: PDF, section: dict, report: Report):
-        project_path = section[self.field]
+    def request_builds(self, section: Section, report: Report, builds: BuildRegistry):
+        project_path = getattr(section, self.field)
+        tests_folder = path.join(project_path, self.tests_folder)
+
+        if ProjectTestsSection.has_subfolders(tests_folder) and not dotnet.is_web_project(project_path):
+            builds.request(project_path, self.builld_arguments)
+
+    def prefetch(self, section: Section, report: Report, builds: BuildRegistry) -> list[TestResult]:
+        project_path = getattr(section, self.field)
         tests_folder = path.join(project_path, self.tests_folder)
 
         # If project dosen't have any tests, do nothing
         if not (tests_folder and ProjectTestsSection.has_subfolders(tests_folder)):
+            return []
+
+        limits = self.get_file_limits(section)
+        if dotnet.is_web_project(project_path):
+            return self.prefetch_static(tests_folder, limits)
+        else:
+            return self.prefetch_dynamic(project_path, tests_folder, builds, limits)
+
+    def get_file_limits(self, section: Section) -> ExcerptLimits:
+        max_lines = getattr(section, "max_file_lines")
+        max_bytes = getattr(section, "max_file_bytes")
+        return ExcerptLimits(
+            self.file_limits.max_lines if max_lines is None else (max_lines or None),
+            self.file_limits.max_bytes if max_bytes is None else (max_bytes or None)
+        )
+
+    def generate(self, document: Document, section: Section, report: Report, tests: list[TestResult]):
+        if len(tests) == 0:
             return
 
-        tests_screenshots = section.get("tests_screenshots")
+        tests_screenshots = getattr(section, "tests_screenshots")
+        document.prepare_figures(self.list_figures(tests_screenshots or [], tests))
         if tests_screenshots:
             for file in tests_screenshots:
-                self.display_numbered_image(pdf, file, self.image_numbering_label)
-
-        if dotnet.is_web_project(project_path):
-            self.generate_static(pdf, tests_folder)
-        else:
-            self.generate_dynamic(pdf, project_path, tests_folder)
+                document.add_figure(file, self.image_numbering_label)
 
+        for i in range(len(tests)):
+            test = tests[i]
+            with document.section_block(self.test_label, test_index = i + 1, test_name = test.name):
+                self.render_test(document, test)
 
-    def generate_dynamic(self, pdf: PDF, project_path: str, tests_folder: str):
-        # Build project
-        build_directory = TemporaryDirectory()
-        executable = dotnet.build_project(project_path, build_directory.name, self.builld_arguments)
+    def prefetch_dynamic(self, project_path: str, tests_folder: str, builds: BuildRegistry, limits: ExcerptLimits) -> list[TestResult]:
+        # Wait for the project build, which was started before layout
+        executable = builds.get(project_path)
         assert executable != None, "Failed to build project"
 
         # Get folders in which there are test cases
         tests = ProjectTestsSection.list_subfolders(tests_folder)
         tests.sort()
 
-        # Run each test-case one by one
-        for i in range(len(tests)):
-            test_folder = tests[i]
+        # Run each test-case one by one. Other sections could be running tests
+        # in the same build directory, so it needs to be locked.
+        results = []
+        for test_folder in tests:
             test_name = path.relpath(test_folder, tests_folder)
-            with pdf.section_block(self.test_label, test_index = i + 1, test_name = test_name):
-                self.render_test(pdf, executable, test_folder)
+            with builds.lock(project_path):
+                results.append(self.run_test(executable, test_folder, test_name, limits))
 
-        # Cleanup build files
-        build_directory.cleanup()
+        return results
 
-    def generate_static(self, pdf: PDF, tests_folder: str):
+    def prefetch_static(self, tests_folder: str, limits: ExcerptLimits) -> list[TestResult]:
         # Get folders in which there are test cases
         tests = ProjectTestsSection.list_subfolders(tests_folder)
         tests.sort()
 
-        for i in range(len(tests)):
-            test_folder = tests[i]
+        results = []
+        for test_folder in tests:
             test_name = path.relpath(test_folder, tests_folder)
-            with pdf.section_block(self.test_label, test_index = i + 1, test_name = test_name):
-                input_dir = path.join(test_folder, "inputs")
-                self.print_files(pdf, glob(f"{input_dir}/**"), input_dir)
 
-                output_dir = path.join(test_folder, "outputs")
-                self.print_files(pdf, glob(f"{output_dir}/**"), output_dir)
+            input_dir = path.join(test_folder, "inputs")
+            output_dir = path.join(test_folder, "outputs")
+            files = self.read_files(glob(f"{input_dir}/**"), input_dir, limits)
+            files.extend(self.read_files(glob(f"{output_dir}/**"), output_dir, limits))
+
+            results.append(TestResult(test_name, files))
 
-    def render_test(self, pdf: PDF, executable: str, test_folder: str):
+        return results
+
+    def run_test(self, executable: str, test_folder: str, test_name: str, limits: ExcerptLimits) -> TestResult:
         """
-        Render test case to the page
+        Run test case and collect everything that will need to be rendered
         """
         assert os.access(executable, os.X_OK), "Excpected to be able to run executable, insufficient permissions"
         assert path.isdir(test_folder), "Failed to verify that given test folder is a folder"
 
-        # Run program
-        errcode, stdout = dotnet.run_test(executable, test_folder)
-
         working_directory = path.dirname(executable)
 
-        # Collect and sort used test files by creation time
-        files_to_render = dotnet.list_test_files(executable)
-        files_to_render.sort(key=lambda file: os.stat(file).st_ctime)
-
-        self.print_files(pdf, files_to_render, working_directory)
-
-        # Render console output
-        console_output = stdout.strip()
-        if len(console_output) > 0:
-            console_image = render_console(console_output, self.console_font_file, self.console_font_size)
-
-            self.display_numbered_image(pdf, console_image, self.console_numbering_label, self.console_label, full_width = True)
-
-    def display_numbered_image(
-            self,
-            pdf: PDF,
-            image: str|Image,
-            numbering_label: str,
-            label: Optional[str] = None,
-            full_width: bool = False,
-        ):
-        pdf.set_font("times-new-roman", 12)
-        with pdf.unbreakable() as pdf: # type: ignore
-            if label:
-                pdf.print(label)
-                pdf.newline()
-            if full_width:
-                pdf.image(image, w=pdf.epw)
-            else:
-                pdf.image(image)
-            pdf.add_numbering(numbering_label)
-            pdf.newline()
+        with TestSandbox(working_directory, test_folder) as sandbox:
+            # Run program
+            result = dotnet.run_test(executable, sandbox, self.execution_limits)
+            if result.usage:
+                profiling.log_usage(f"Test '{test_folder}'", result.usage)
+
+            # Files need to be read now, because the next test will reuse the
+            # same working directory
+            files = self.read_files(sandbox.list_files(), working_directory, limits)
+
+        # Render console output, together with the input it was given
+        console_output = self.get_console_runs(result.transcript, ("stdout", "stdin"))
+        if result.stdout_truncated:
+            console_output.append(("\n" + self.truncated_output_label, self.console_foreground))
+        if result.timed_out:
+            timed_out_label = self.timed_out_label.format(timeout=self.execution_limits.timeout)
+            console_output.append(("\n" + timed_out_label, self.console_foreground))
+
+        error_output = self.get_console_runs(result.transcript, ("stderr",))
+        if result.stderr_truncated:
+            error_output.append(("\n" + self.truncated_output_label, self.console_foreground))
+
+        return TestResult(
+            test_name,
+            files,
+            self.render_console_output(console_output),
+            self.render_console_output(error_output)
+        )
+
+    def get_console_runs(self, transcript: list[TranscriptChunk], streams: tuple[Stream, ...]) -> list[ConsoleRun]:
+        runs = [
+            (text.replace("\r\n", "\n"), self.console_input_color if stream == "stdin" else self.console_foreground)
+            for stream, text in decode_transcript(transcript, streams)
+        ]
+        return strip_runs(runs)
+
+    def render_console_output(self, runs: list[ConsoleRun]) -> Optional[RenderedImage]:
+        runs = strip_runs(runs)
+        if len(runs) == 0:
+            return None
+        return self.render_pool.submit(
+            render_console_png,
+            runs,
+            self.console_font_file,
+            self.console_font_size,
+            self.console_background,
+            self.console_max_aspect
+        )
+
+    def list_figures(self, screenshots: list[str], tests: list[TestResult]) -> list[tuple[DocumentImage, bool]]:
+        """
+        Every image that will be added as a figure, and whether it's full width
+        """
+        figures: list[tuple[DocumentImage, bool]] = [(file, False) for file in screenshots]
+        for test in tests:
+            figures.extend((file.content, False) for file in test.files if file.is_image)
+            if test.console_image:
+                figures.append((test.console_image, True))
+            if test.error_image:
+                figures.append((test.error_image, True))
+        return figures
+
+    def render_test(self, document: Document, test: TestResult):
+        """
+        Render test case into the document
+        """
+        self.print_files(document, test.files)
+
+        if test.console_image:
+            document.add_figure(test.console_image, self.console_numbering_label, self.console_label, full_width = True)
 
-    def print_files(self, pdf: PDF, files: list[str], root_dir: str):
+        if test.error_image:
+            document.add_figure(test.error_image, self.error_numbering_label, self.error_label, full_width = True)
+
+    def read_files(self, files: list[str], root_dir: str, limits: ExcerptLimits = ExcerptLimits()) -> list[TestFile]:
+        """
+        Read given files, text files are placed before images. Only the size
+        of binary files is shown, and only the start and the end of text files
+        which are over the limits.
+        """
+        text_files = []
         image_files = []
 
         for file in files:
+            relpath = path.relpath(file, root_dir)
             lower_file = file.lower()
             if lower_file.endswith(".png") or lower_file.endswith(".jpg") or lower_file.endswith(".jpeg"):
-                image_files.append(file)
+                # Copied, because the next test will reuse the same file
+                image_files.append(TestFile(relpath, self.image_spool.put_file(file), is_image=True))
                 continue
 
-            relpath = path.relpath(file, root_dir)
-            content = None
-            with open(file, "r", encoding="utf-8-sig") as f:
-                content = f.read().strip()
-            self.print_file(pdf, content, relpath)
+            excerpt = read_text_excerpt(file, limits)
+            if excerpt is None:
+                content = self.binary_file_label.format(size=format_size(path.getsize(file)))
+            else:
+                content = excerpt.get_text(self.omitted_lines_label)
+            text_files.append(TestFile(relpath, content.strip()))
+
+        return text_files + image_files
+
+    def print_files(self, document: Document, files: list[TestFile]):
+        for file in files:
+            if file.is_image:
+                document.add_figure(file.content, self.image_numbering_label)
+            else:
+                self.print_file(document, file.content, file.filename)
 
-        for file in image_files:
-            self.display_numbered_image(pdf, file, self.image_numbering_label)
+    def print_file(self, document: Document, text: str, filename: str):
+        with document.labeled_block(self.file_label.format(filename=filename)):
+            document.add_listing(text)
 
-    def print_file(self, pdf: PDF, text: str, filename: str):
-        pdf.set_font("times-new-roman", 12)
-        with pdf.labeled_block(self.file_label.format(filename=filename)):
-            pdf.set_font("courier-new", 10)
-            pdf.print(text, multiline=True)
+    def has_required_fields(self, section: Section, _: Report) -> bool:
+        return getattr(section, self.field) is not None
 
-    def has_required_fields(self, section: dict, _: Report) -> bool:
-        return self.field in section
+    def get_fields(self) -> list[Field]:
+        return [
+            Field(self.field, is_path=True),
+            Field("tests_screenshots", list, is_path=True),
+            Field("max_file_lines", int),
+            Field("max_file_bytes", int),
+        ]
 
-    def assert_fields(self, section: dict, _: Report):
-        project_path = section[self.field]
+    def assert_fields(self, section: Section, _: Report):
+        project_path = getattr(section, self.field)
         assert dotnet.is_project_root(project_path), "Expected to receive path of root project folder"
+        for name in ("max_file_lines", "max_file_bytes"):
+            assert (getattr(section, name) or 0) >= 0, f"Expected field '{name}' in section to not be negative"
 
     @staticmethod
     def list_subfolders(directory: str) -> list[str]:
@@ -0,0 +1,119 @@
+from io import BytesIO
+from tempfile import TemporaryDirectory
+from typing import Optional
+from PIL import Image as ImageUtils
+import hashlib
+import os
+import os.path as path
+import shutil
+
+def get_image_extension(data: bytes|str) -> str:
+    """
+    Extension of an image given by its data or filename
+    """
+    try:
+        with ImageUtils.open(BytesIO(data) if isinstance(data, bytes) else data) as image:
+            image_format = image.format
+    except (OSError, ValueError):
+        image_format = None
+    return (image_format or "img").lower()
+
+def write_spooled(directory: str, data: bytes) -> str:
+    """
+    Write encoded image into `directory`, named by the md5 of its content.
+    Files are content addressed, so an existing one is never written again.
+    """
+    filename = path.join(directory, f"{hashlib.md5(data).hexdigest()}.{get_image_extension(data)}")
+    if path.exists(filename):
+        return filename
+
+    # Other processes could be writing the same image at the same time
+    partial_filename = f"{filename}.{os.getpid()}.part"
+    with open(partial_filename, "wb") as f:
+        f.write(data)
+    os.replace(partial_filename, filename)
+    return filename
+
+def copy_spooled(directory: str, source: str) -> str:
+    """
+    Same as `write_spooled` for an image file, which is copied without being
+    read into memory whole
+    """
+    digest = hashlib.md5()
+    with open(source, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    filename = path.join(directory, f"{digest.hexdigest()}.{get_image_extension(source)}")
+    if path.exists(filename):
+        return filename
+
+    partial_filename = f"{filename}.{os.getpid()}.part"
+    shutil.copyfile(source, partial_filename)
+    os.replace(partial_filename, filename)
+    return filename
+
+class ImageSpool:
+    """
+    Temporary folder for images which are generated while making a report.
+    They are written once, encoded, and documents reference them by path, so
+    they are only read into memory while they are being embedded.
+    """
+    directory: Optional[TemporaryDirectory]
+    # Folder of the spool, also set in worker processes which write into the
+    # folder of the main process
+    name: Optional[str]
+
+    def __init__(self) -> None:
+        self.directory = None
+        self.name = None
+
+    def __deepcopy__(self, memo):
+        # Shared by copies of the pdf which `unbreakable` makes
+        return self
+
+    def open(self) -> str:
+        """
+        Create the folder if it doesn't exist yet, and return its path
+        """
+        if self.name is None:
+            self.directory = TemporaryDirectory(prefix="ktuoopreport-")
+            self.name = self.directory.name
+        return self.name
+
+    def use(self, name: str):
+        """
+        Write into the folder of another spool, which is removed by its owner
+        """
+        if name == self.name:
+            # Forked processes get the spool of their parent, which must not
+            # be dropped here, or its folder would be removed with it
+            return
+        self.directory = None
+        self.name = name
+
+    def put(self, data: bytes) -> str:
+        return write_spooled(self.open(), data)
+
+    def put_file(self, filename: str) -> str:
+        """
+        Copy an image file into the spool, for one which could be changed or
+        removed before the document is written
+        """
+        return copy_spooled(self.open(), filename)
+
+    def get_digest(self, filename: str) -> Optional[str]:
+        """
+        Returns the md5 of an image's content if it's in the spool, or None
+        """
+        if self.name is None or path.dirname(filename) != self.name:
+            return None
+        return path.basename(filename).split(".")[0]
+
+    def cleanup(self):
+        if self.directory is not None:
+            self.directory.cleanup()
+        self.directory = None
+        self.name = None
+
+# Used by everything which was not given a spool
+default_image_spool = ImageSpool()
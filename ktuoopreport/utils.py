@@ -2,6 +2,10 @@ from os.path import join, relpath
 from os import walk
 from fnmatch import fnmatch
 from typing import Iterable
+from pygments.lexer import Lexer
+from pygments.lexers import get_lexer_by_name, get_lexer_for_filename
+from pygments.lexers.special import TextLexer
+from pygments.util import ClassNotFound
 
 def is_file_included(filename: str, included: list[str], excluded: list[str]) -> bool:
     if not any(fnmatch(filename, pattern) for pattern in included):
@@ -18,3 +22,16 @@ def list_files(folder_path: str, included: list[str], excluded: list[str]) -> It
             full_path = join(root, name)
             if is_file_included(relpath(full_path, folder_path), included, excluded):
                 yield full_path
+
+def get_lexer(language: str) -> Lexer:
+    """
+    Find lexer by language name or by filename, falls back to plain text
+    """
+    try:
+        return get_lexer_by_name(language)
+    except ClassNotFound:
+        pass
+    try:
+        return get_lexer_for_filename(language)
+    except ClassNotFound:
+        return TextLexer()
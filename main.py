@@ -1,74 +1,146 @@
 #!/usr/bin/env python
 import click
 import sys
-import toml
 import os.path as path
-from enum import Enum
 from typing import Optional
 
-from dacite.core import from_dict
-from dacite.config import Config
-
 from ktuoopreport import Report, Gender, Person, ReportGenerator1, ReportGenerator2
-from ktuoopreport.report_generator import ReportGenerator
-
-# TODO: This whole library needs a big refactor:
-# 1. Generate an intemediatary file before pdfs, so the final report could be
-#    edited. (maybe latex?)
-# 2. Remove the relative path BS when using relative filenames
+from ktuoopreport.report_generator import ReportGenerator, get_creation_date
+from ktuoopreport import profiling
+from ktuoopreport.layout import Layout, LayoutCache
+from ktuoopreport.fonts import FontSubsetCache
+from ktuoopreport.pdf import render_layout
+from ktuoopreport.report_file import TomlDecodeError, read_toml, parse_report
+from ktuoopreport.schema import SchemaError
 
-def read_report_toml(filename: str) -> Report:
-    report = None
+def read_report_toml(filename: str) -> tuple[Report, ReportGenerator]:
     try:
-        parsed_toml = toml.load(filename)
-        report = from_dict(
-                data_class = Report,
-                data = parsed_toml, # type: ignore
-                config = Config(cast = [Enum])
-        )
-    except toml.TomlDecodeError as e:
+        data = read_toml(filename)
+    except TomlDecodeError as e:
         click.echo(click.style(f"Failed to decode input file ({filename}):", fg="red"))
         click.echo(click.style(str(e), fg="red"))
         sys.exit(1)
-    except Exception as e:
+
+    generator = determine_generator_from_title(str(data.get("title", "")))
+    if not generator:
+        click.echo(click.style("Couldn't determine which generator to use", fg="red"))
+        click.echo(click.style("Report title must include '(P175B118)' or '(P175B123)'", fg="red"))
+        sys.exit(1)
+
+    try:
+        report = parse_report(data, generator.schema, path.dirname(filename))
+    except SchemaError as e:
         click.echo(click.style(f"Validation error from input file ({filename}):", fg="red"))
+        click.echo(click.style(str(e), fg="red"))
         sys.exit(1)
 
-    base_directory = path.dirname(filename)
-    for section in report.sections:
-        if "project" in section:
-            section["project"] = path.join(base_directory, section["project"])
-        if "tests_project" in section:
-            section["tests_project"] = path.join(base_directory, section["tests_project"])
-        if "interface_scheme" in section:
-            section["interface_scheme"] = path.join(base_directory, section["interface_scheme"])
-        if "tests_screenshots" in section:
-            section["tests_screenshots"] = list(path.join(base_directory, p) for p in section["tests_screenshots"])
+    return report, generator
 
-    return report
+def parse_section_numbers(ctx, param, value: Optional[str]) -> Optional[set[int]]:
+    """
+    Parse a list of section numbers and ranges, like "3,5-7". Whether the
+    report has those sections is checked by its generator.
+    """
+    if value is None:
+        return None
+    numbers = set()
+    for part in value.split(","):
+        first, dash, last = part.strip().partition("-")
+        try:
+            start, end = int(first), int(last if dash else first)
+        except ValueError:
+            start, end = 0, -1
+        if end < start:
+            raise click.BadParameter(f"'{part.strip()}' is not a section number or a range like 5-7")
+        numbers.update(range(start, end + 1))
+    return numbers
 
-def determine_generator_from_report(report: Report) -> Optional[ReportGenerator]:
-    if "(P175B118)" in report.title:
+def determine_generator_from_title(title: str) -> Optional[ReportGenerator]:
+    if "(P175B118)" in title:
         return ReportGenerator1()
-    elif "(P175B123)" in report.title:
+    elif "(P175B123)" in title:
         return ReportGenerator2()
 
 @click.command()
 @click.argument("input", type=click.Path(exists=True, readable=True, dir_okay=False))
 @click.argument("output", required=False, type=click.Path(writable=True, dir_okay=False))
-def main(input: str, output: str):
+@click.option("--profile", is_flag=True, help="Print timings and resource usage of test runs")
+@click.option("--layout", "layout_file", type=click.Path(writable=True, dir_okay=False),
+              help="Also save the layout of the report, which can be edited and rendered again")
+@click.option("--layout-cache", type=click.Path(file_okay=False),
+              help="Folder in which layouts of sections are cached between runs")
+@click.option("--font-cache", type=click.Path(file_okay=False),
+              help="Folder in which embedded font subsets are cached between runs")
+@click.option("--shared-font-subset", is_flag=True,
+              help="Embed the same set of common characters of each font into every report, "
+                   "so that cached font subsets can be reused")
+@click.option("--image-dpi", type=click.IntRange(min=0),
+              help="Resolution to which bigger images are scaled down, 0 keeps them as they are")
+@click.option("--compression-level", type=click.IntRange(0, 9),
+              help="zlib level of pdfs, higher makes smaller files but takes longer")
+@click.option("--reproducible", is_flag=True,
+              help="Don't put the current time into the pdf, so the same report always gives the same file")
+@click.option("-j", "--jobs", type=click.IntRange(min=0), default=1, show_default=True,
+              help="Lay out sections of pdfs in this many processes, 0 for one per CPU")
+@click.option("--sections", "selected_sections", metavar="LIST", callback=parse_section_numbers,
+              help="Preview only these sections (like 3,5-7) without the title page and the table of "
+                   "contents. Sections keep their numbers, figures too if the layout cache has the rest.")
+@click.option("--skip-tests", is_flag=True,
+              help="Don't build or run projects for test sections, only their titles are kept")
+def main(
+        input: str,
+        output: str,
+        profile: bool,
+        layout_file: Optional[str],
+        layout_cache: Optional[str],
+        font_cache: Optional[str],
+        shared_font_subset: bool,
+        image_dpi: Optional[int],
+        compression_level: Optional[int],
+        reproducible: bool,
+        jobs: int,
+        selected_sections: Optional[set[int]],
+        skip_tests: bool
+    ):
+    if profile:
+        profiling.enable()
+
     if not output:
         output = path.splitext(input)[0] + ".pdf"
 
-    # Beware this method is devious. I can end the program with sys.exit
-    report = read_report_toml(input)
+    subset_cache = None
+    if font_cache or shared_font_subset:
+        subset_cache = FontSubsetCache(font_cache, shared_font_subset)
 
-    generator = determine_generator_from_report(report)
-    if not generator:
-        click.echo(click.style("Couldn't determine which generator to use", fg="red"))
-        click.echo(click.style("Report title must include '(P175B118)' or '(P175B123)'", fg="red"))
+    # A saved layout is rendered as is, without reading any report
+    if input.endswith(".json"):
+        if not render_layout(Layout.load(input), output, subset_cache, get_creation_date(reproducible), compression_level):
+            click.echo(f"{output} is up to date")
+        return
+
+    # Beware this method is devious. I can end the program with sys.exit
+    report, generator = read_report_toml(input)
+    if image_dpi is not None:
+        generator.image_dpi = image_dpi
+    generator.compression_level = compression_level
+    generator.layout_processes = jobs
+    generator.reproducible = reproducible
+    generator.skip_tests = skip_tests
+    generator.selected_sections = selected_sections
+    try:
+        generator.get_selected_indices(report)
+    except ValueError as e:
+        click.echo(click.style(str(e), fg="red"))
         sys.exit(1)
-    generator.generate(report, output)
+    changed = generator.generate(
+        report,
+        output,
+        layout_file = layout_file,
+        layout_cache = LayoutCache(layout_cache) if layout_cache else None,
+        font_cache = subset_cache
+    )
+    if not changed:
+        click.echo(f"{output} is up to date")
 
 def example():
     # Create example report with no projects
@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+@pytest.fixture
+def in_report_folder(tmp_path, monkeypatch):
+    """
+    Fonts and icons are loaded relative to the current folder, they are
+    linked into a temporary one so that font caches aren't left in the
+    repository
+    """
+    folder = tmp_path / "cwd"
+    folder.mkdir()
+    for name in ("fonts", "university-icon.png"):
+        os.symlink(os.path.join(ROOT, name), folder / name)
+    monkeypatch.chdir(folder)
+    return folder
@@ -0,0 +1,48 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from io import BytesIO
+import os
+import zlib
+
+import fpdf.fpdf as fpdf_module
+import pytest
+from PIL import Image
+
+from ktuoopreport.compression import PARALLEL_COMPRESS_SIZE, compress_streams
+from ktuoopreport.pdf import PatchedFPDF
+
+def make_streams(count, size):
+    return [os.urandom(size // 2) + bytes(size // 2) for _ in range(count)]
+
+@pytest.mark.parametrize("size", [100, PARALLEL_COMPRESS_SIZE])
+def test_compress_streams_gives_the_same_result_as_zlib(size):
+    streams = make_streams(4, size)
+    for level in (0, 1, zlib.Z_DEFAULT_COMPRESSION, 9):
+        assert compress_streams(streams, level, max_workers=4) == [zlib.compress(stream, level) for stream in streams]
+
+def write_pdf(workers, noise):
+    pdf = PatchedFPDF(None, "portrait", "cm", "A4", record=False)
+    pdf.compression_workers = workers
+    pdf.set_creation_date(datetime(2020, 1, 1, tzinfo=timezone.utc))
+    pdf.set_font("helvetica", size=10)
+    for page in range(8):
+        pdf.add_page()
+        for line in range(40):
+            pdf.cell(0, 0.5, f"Puslapis {page}, eilute {line} " * 3, ln=1)
+        buffer = BytesIO()
+        noise.rotate(page * 90).save(buffer, "PNG")
+        pdf.image(buffer, w=5)
+    return bytes(pdf.output())
+
+def test_pdf_is_the_same_with_any_number_of_workers():
+    noise = Image.frombytes("RGB", (300, 300), os.urandom(300 * 300 * 3))
+    assert write_pdf(4, noise) == write_pdf(1, noise)
+
+def test_pdf_written_alongside_another_is_the_same():
+    # Page contents are compressed per document, not through fpdf's zlib
+    noise = Image.frombytes("RGB", (300, 300), os.urandom(300 * 300 * 3))
+    expected = write_pdf(1, noise)
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(lambda _: write_pdf(2, noise), range(4)))
+    assert results == [expected] * 4
+    assert fpdf_module.zlib is zlib
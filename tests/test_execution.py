@@ -0,0 +1,177 @@
+import logging
+import os
+import signal
+import sys
+import time
+
+from ktuoopreport import dotnet
+from ktuoopreport.execution import ExecutionCore, ExecutionLimits, OutputBuffer, Transcript, execute, run_command
+
+def make_program(tmp_path, name, source):
+    filename = tmp_path / name
+    filename.write_text(f"#!{sys.executable}\n{source}")
+    os.chmod(filename, 0o755)
+    return str(filename)
+
+def test_output_buffer_keeps_everything_under_limits():
+    buffer = OutputBuffer(max_bytes=100, max_lines=10)
+    buffer.write(b"one\n")
+    buffer.write(b"two\n")
+    assert buffer.getvalue() == "one\ntwo\n"
+    assert not buffer.truncated
+
+def test_output_buffer_cuts_at_byte_limit():
+    buffer = OutputBuffer(max_bytes=5, max_lines=10)
+    buffer.write(b"abc")
+    buffer.write(b"defgh")
+    buffer.write(b"ijk")
+    assert buffer.getvalue() == "abcde"
+    assert buffer.truncated
+
+def test_output_buffer_cuts_after_last_allowed_line():
+    buffer = OutputBuffer(max_bytes=100, max_lines=2)
+    buffer.write(b"one\ntwo\nthree\n")
+    assert buffer.getvalue() == "one\ntwo\n"
+    assert buffer.truncated
+
+def test_output_buffer_exactly_at_line_limit_is_not_truncated():
+    buffer = OutputBuffer(max_bytes=100, max_lines=2)
+    buffer.write(b"one\n")
+    buffer.write(b"two\n")
+    assert not buffer.truncated
+
+    buffer.write(b"three")
+    assert buffer.getvalue() == "one\ntwo\n"
+    assert buffer.truncated
+
+def test_output_buffer_adds_only_kept_output_to_transcript():
+    transcript = Transcript(time.monotonic())
+    buffer = OutputBuffer(max_bytes=100, max_lines=1, transcript=transcript, stream="stderr")
+    buffer.write(b"kept\ndropped\n")
+    assert [(stream, data) for stream, data, _ in transcript.getvalue()] == [("stderr", b"kept\n")]
+
+def test_program_is_killed_when_output_limit_is_hit(tmp_path):
+    program = make_program(tmp_path, "spam", "while True: print('spam', flush=True)")
+    limits = ExecutionLimits(max_output_lines=5, timeout=30, nice=None)
+    core = ExecutionCore(1)
+
+    started_at = time.monotonic()
+    result = core.run(execute(program, [], str(tmp_path), limits, core=core))
+
+    assert time.monotonic() - started_at < 10
+    assert not result.timed_out
+    assert result.stdout_truncated
+    assert result.stdout == "spam\n" * 5
+
+def test_limits_apply_to_the_program_and_what_it_starts(tmp_path):
+    source = "\n".join([
+        "import os, resource, subprocess, sys",
+        "print(resource.getrlimit(resource.RLIMIT_NOFILE)[0], os.nice(0))",
+        "sys.stdout.flush()",
+        "subprocess.run([sys.executable, '-c', 'import os, resource; print(resource.getrlimit(resource.RLIMIT_NOFILE)[0], os.nice(0))'])",
+    ])
+    program = make_program(tmp_path, "limits", source)
+    limits = ExecutionLimits(open_files=64, nice=5, timeout=30)
+    core = ExecutionCore(1)
+    niceness = os.nice(0)
+
+    result = core.run(execute(program, [], str(tmp_path), limits, core=core))
+
+    expected = f"64 {min(niceness + 5, 19)}\n"
+    assert result.stdout == expected * 2
+
+ECHO = """
+import sys
+print("Enter:", flush=True)
+for line in sys.stdin:
+    print("Got", line.strip(), flush=True)
+"""
+
+def test_execute_writes_stdin_and_records_transcript(tmp_path):
+    program = make_program(tmp_path, "echo", ECHO)
+    core = ExecutionCore(1)
+
+    result = core.run(execute(program, [b"a\n", b"b\n"], str(tmp_path), ExecutionLimits(), prompt_delay=0.05, core=core))
+
+    assert result.returncode == 0
+    assert result.stdout == "Enter:\nGot a\nGot b\n"
+    assert not result.timed_out and not result.stdout_truncated
+    # Each line is recorded before the output which answers it
+    streams = [stream for stream, _, _ in result.transcript]
+    assert streams[-4:] == ["stdin", "stdout", "stdin", "stdout"]
+
+def test_program_is_killed_after_timeout(tmp_path):
+    program = make_program(tmp_path, "spin", "import time\nprint('started', flush=True)\ntime.sleep(60)")
+    core = ExecutionCore(1)
+
+    started_at = time.monotonic()
+    result = core.run(execute(program, [], str(tmp_path), ExecutionLimits(timeout=0.5), core=core))
+
+    assert time.monotonic() - started_at < 10
+    assert result.timed_out
+    assert result.returncode == -signal.SIGKILL
+    assert result.stdout == "started\n"
+
+def test_cancelling_kills_the_program(tmp_path):
+    pid_file = tmp_path / "pid"
+    program = make_program(tmp_path, "spin", f"import os, time\nopen({str(pid_file)!r}, 'w').write(str(os.getpid()))\ntime.sleep(60)")
+    core = ExecutionCore(1)
+
+    future = core.submit(execute(program, [], str(tmp_path), ExecutionLimits(timeout=60), core=core))
+    while not pid_file.exists() or not pid_file.read_text():
+        time.sleep(0.01)
+    future.cancel()
+
+    pid = int(pid_file.read_text())
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            # Killed and reaped
+            break
+        time.sleep(0.01)
+    else:
+        raise AssertionError("program is still running")
+
+def test_only_max_processes_run_at_the_same_time(tmp_path):
+    program = make_program(tmp_path, "sleep", "import time\ntime.sleep(0.3)")
+    core = ExecutionCore(2)
+
+    started_at = time.monotonic()
+    futures = [core.submit(execute(program, [], str(tmp_path), ExecutionLimits(), core=core)) for _ in range(4)]
+    for future in futures:
+        assert future.result().returncode == 0
+
+    assert time.monotonic() - started_at >= 0.6
+
+def test_run_command_returns_none_after_timeout(tmp_path):
+    core = ExecutionCore(1)
+    assert core.run(run_command([sys.executable, "-c", "raise SystemExit(3)"], core=core)) == 3
+    assert core.run(run_command([sys.executable, "-c", "import time; time.sleep(60)"], timeout=0.2, core=core)) is None
+
+def test_stopped_build_is_logged(tmp_path, monkeypatch, caplog):
+    make_program(tmp_path, "dotnet", "import time\ntime.sleep(60)")
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(dotnet, "BUILD_TIMEOUT", 0.2)
+
+    with caplog.at_level(logging.WARNING, "ktuoopreport.dotnet"):
+        assert dotnet.build_project(str(tmp_path / "project"), str(tmp_path / "out")) is None
+
+    assert "was stopped after 0.2 s" in caplog.text
+
+def test_max_rss_is_the_programs_own(tmp_path):
+    # This process holds a lot more memory than the program, which it would
+    # inherit if the usage came from ru_maxrss of the fork
+    ballast = bytearray(os.urandom(64 * 1024 * 1024))
+    program = tmp_path / "small"
+    program.write_text("#!/bin/sh\nsleep 0.3\n")
+    os.chmod(program, 0o755)
+    core = ExecutionCore(1)
+
+    result = core.run(execute(str(program), [], str(tmp_path), ExecutionLimits(), core=core))
+
+    assert result.usage is not None
+    if sys.platform == "linux":
+        assert result.usage.max_rss is not None
+        assert 0 < result.usage.max_rss < len(ballast) / 4
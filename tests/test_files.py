@@ -0,0 +1,133 @@
+import codecs
+
+import pytest
+
+from ktuoopreport import files
+from ktuoopreport.files import ExcerptLimits, TextExcerpt, detect_encoding, format_size, read_text_excerpt, read_text_file, take_excerpt
+
+@pytest.mark.parametrize("block, encoding", [
+    (codecs.BOM_UTF8 + b"text", "utf-8-sig"),
+    (codecs.BOM_UTF16_LE + "text".encode("utf-16-le"), "utf-16"),
+    (codecs.BOM_UTF16_BE + "text".encode("utf-16-be"), "utf-16"),
+    (codecs.BOM_UTF32_LE + "text".encode("utf-32-le"), "utf-32"),
+    ("Rezultatai: ąčę\n".encode("utf-8"), "utf-8"),
+    ("Rezultatai: ąčę\n".encode("cp1257"), "cp1257"),
+    (b"", "utf-8"),
+])
+def test_detects_encoding_of_text(block, encoding):
+    assert detect_encoding(block) == encoding
+
+def test_utf8_cut_in_the_middle_of_a_character_is_still_utf8():
+    assert detect_encoding("ąčę".encode("utf-8")[:-1]) == "utf-8"
+
+@pytest.mark.parametrize("block", [
+    b"MZ\x90\x00\x03\x00\x00\x00",
+    bytes(range(1, 32)) * 10 + b"\xff",
+])
+def test_detects_binary(block):
+    assert detect_encoding(block) is None
+
+def test_reads_text_in_its_encoding_with_normalized_newlines(tmp_path):
+    filename = tmp_path / "data.txt"
+    filename.write_bytes("pirma\r\nantra\rtrečia\n".encode("cp1257"))
+    assert read_text_file(str(filename)) == "pirma\nantra\ntrečia\n"
+
+def test_binary_files_are_not_read_past_the_start(tmp_path, monkeypatch):
+    filename = tmp_path / "App.dll"
+    filename.write_bytes(b"MZ\0" + b"x" * files.SNIFF_SIZE * 4)
+
+    reads = []
+    real_open = open
+    def tracking_open(*args, **kwargs):
+        f = real_open(*args, **kwargs)
+        original_read = f.read
+        def read(size=-1):
+            data = original_read(size)
+            reads.append(len(data))
+            return data
+        f.read = read
+        return f
+    monkeypatch.setattr("builtins.open", tracking_open)
+
+    assert read_text_file(str(filename)) is None
+    assert sum(reads) <= files.SNIFF_SIZE
+
+@pytest.mark.parametrize("size", [10, files.SNIFF_SIZE + 10, files.MMAP_SIZE + 10])
+def test_reads_small_medium_and_memory_mapped_files_the_same(tmp_path, size):
+    text = ("eilutė\r\n" * size)[:size]
+    filename = tmp_path / "data.txt"
+    filename.write_bytes(text.encode("utf-8"))
+    assert read_text_file(str(filename)) == text.replace("\r\n", "\n").replace("\r", "\n")
+
+def test_format_size():
+    assert format_size(512) == "512 B"
+    assert format_size(1536) == "1.5 KiB"
+    assert format_size(3 * 1024 * 1024) == "3.0 MiB"
+    assert format_size(5 * 1024 ** 3) == "5120.0 MiB"
+
+def excerpt_of_text(text, limits):
+    lines = text.split("\n")
+    if text.endswith("\n"):
+        lines.pop()
+    return take_excerpt(lines, limits)
+
+def test_excerpt_keeps_everything_under_limits():
+    excerpt = take_excerpt(["a", "b", "c"], ExcerptLimits(max_lines=3, max_bytes=100))
+    assert excerpt.omitted_lines == 0
+    assert excerpt.get_text("[{lines}]") == "a\nb\nc"
+
+def test_excerpt_keeps_start_and_end_of_lines():
+    excerpt = take_excerpt([str(i) for i in range(10)], ExcerptLimits(max_lines=5))
+    assert excerpt == TextExcerpt(["0", "1", "2"], ["8", "9"], 5)
+    assert excerpt.get_text("[... {lines} ...]") == "0\n1\n2\n[... 5 ...]\n8\n9"
+
+def test_excerpt_splits_byte_limit_between_start_and_end():
+    # Each line takes 4 bytes with its newline
+    excerpt = take_excerpt(["aaa", "bbb", "ccc", "ddd", "eee"], ExcerptLimits(max_bytes=9))
+    assert excerpt == TextExcerpt(["aaa"], ["eee"], 3)
+
+def test_excerpt_of_one_huge_line_keeps_nothing():
+    excerpt = take_excerpt(["x" * 100], ExcerptLimits(max_bytes=10))
+    assert excerpt == TextExcerpt([], [], 1)
+
+@pytest.mark.parametrize("ending", ["", "\n", "\r\n"])
+@pytest.mark.parametrize("limits", [
+    ExcerptLimits(max_lines=6, max_bytes=100),
+    ExcerptLimits(max_lines=None, max_bytes=50),
+    ExcerptLimits(max_lines=300, max_bytes=64 * 1024),
+])
+def test_streamed_excerpt_is_the_same_as_the_whole_text(tmp_path, monkeypatch, limits, ending):
+    # Small chunks, so that the tail is found across several of them
+    monkeypatch.setattr(files, "READ_SIZE", 7)
+    lines = [f"eilutė {i} " + "x" * (i % 13) for i in range(5000)]
+    text = ending.join(lines) + ending if ending else "\n".join(lines)
+    filename = tmp_path / "results.txt"
+    filename.write_bytes(text.encode("utf-8"))
+
+    excerpt = read_text_excerpt(str(filename), limits)
+
+    assert excerpt == excerpt_of_text(text.replace("\r\n", "\n"), limits)
+
+@pytest.mark.parametrize("encoding", ["utf-16", "cp1257"])
+def test_excerpt_of_other_encodings(tmp_path, encoding):
+    text = "".join(f"ąčę {i}\n" for i in range(1000))
+    filename = tmp_path / "results.txt"
+    filename.write_bytes(text.encode(encoding))
+    limits = ExcerptLimits(max_lines=4, max_bytes=1000)
+
+    assert read_text_excerpt(str(filename), limits) == TextExcerpt(["ąčę 0", "ąčę 1"], ["ąčę 998", "ąčę 999"], 996)
+
+def test_excerpt_with_only_a_line_limit_is_streamed(tmp_path, monkeypatch):
+    # `max_file_bytes = 0` turns the byte limit off
+    filename = tmp_path / "results.txt"
+    filename.write_text("".join(f"eilutė {i}\r\n" for i in range(10000)), encoding="utf-8")
+    monkeypatch.setattr(files, "read_text_file", None)
+
+    excerpt = read_text_excerpt(str(filename), ExcerptLimits(max_lines=4, max_bytes=None))
+
+    assert excerpt == TextExcerpt(["eilutė 0", "eilutė 1"], ["eilutė 9998", "eilutė 9999"], 9996)
+
+def test_excerpt_of_binary_file_is_none(tmp_path):
+    filename = tmp_path / "App.dll"
+    filename.write_bytes(b"MZ\0\0" * 1000)
+    assert read_text_excerpt(str(filename), ExcerptLimits(max_lines=10, max_bytes=100)) is None
@@ -0,0 +1,29 @@
+from datetime import datetime, timezone
+
+import fpdf.fpdf as fpdf_module
+from fpdf.ttfonts import TTFontFile
+
+from ktuoopreport.fonts import FontSubsetCache
+from ktuoopreport.pdf import PatchedFPDF
+
+def write_pdf(cache, text):
+    pdf = PatchedFPDF(None, "portrait", "cm", "A4", record=False, subset_cache=cache)
+    pdf.set_creation_date(datetime(2020, 1, 1, tzinfo=timezone.utc))
+    pdf.add_font("arial", fname="fonts/arial.ttf", uni=True)
+    pdf.set_font("arial", size=10)
+    pdf.add_page()
+    pdf.cell(0, 0.5, text)
+    return bytes(pdf.output())
+
+def test_subsets_are_kept_in_the_cache_of_each_pdf(in_report_folder, monkeypatch):
+    first, second = FontSubsetCache(), FontSubsetCache()
+
+    expected = write_pdf(first, "Ąžuolas")
+    write_pdf(second, "Beržas")
+    assert len(first.entries) == 1 and len(second.entries) == 1
+    assert first.entries.keys() != second.entries.keys()
+    assert fpdf_module.TTFontFile is TTFontFile
+
+    # The second time the subset comes from the cache, without parsing the font
+    monkeypatch.setattr(TTFontFile, "makeSubset", None)
+    assert write_pdf(first, "Ąžuolas") == expected
@@ -0,0 +1,186 @@
+from io import BytesIO
+import json
+import os
+import os.path as path
+
+import pytest
+from PIL import Image
+
+import main
+from ktuoopreport.layout import Layout, LayoutCache
+from ktuoopreport.pdf import render_layout
+from ktuoopreport.report_generator import get_creation_date
+from ktuoopreport.spool import ImageSpool
+
+def encoded_png(color):
+    image = Image.new("RGB", (2, 2), color)
+    buffer = BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+def make_layout(tmp_path):
+    layout = Layout("cm", (21.0, 29.7))
+    layout.fonts.append(("arial", "", "fonts/arial.ttf", True))
+    layout.start = {"section_levels": [2], "numbering_index": 3}
+    layout.end = {"section_levels": [3], "numbering_index": 5}
+
+    screenshot = tmp_path / "screenshot.png"
+    screenshot.write_bytes(encoded_png("blue"))
+    ids = [
+        layout.add_image(encoded_png("red")),
+        layout.add_image(Image.new("RGB", (3, 1), "green")),
+        layout.add_image(str(screenshot)),
+    ]
+    for i, image_id in enumerate(ids):
+        layout.add(i + 1, {"type": "image", "x": 1, "y": 2, "w": 3, "h": 4, "image": image_id})
+        layout.add(i + 1, {"type": "text", "x": 1, "y": 28, "w": 19, "h": 0.5, "text": f"Puslapis {i + 1}"}, in_footer=True)
+    return layout, ids
+
+def read_image_of(image):
+    return image.mode, image.size, image.tobytes()
+
+def read_image(filename):
+    with Image.open(filename) as image:
+        return read_image_of(image)
+
+def test_save_and_load_keep_everything(tmp_path):
+    layout, ids = make_layout(tmp_path)
+    filename = str(tmp_path / "out" / "report.json")
+    os.makedirs(path.dirname(filename))
+    layout.save(filename)
+
+    loaded = Layout.load(filename)
+
+    assert loaded.unit == "cm" and loaded.page_size == (21.0, 29.7)
+    assert loaded.fonts == layout.fonts
+    assert loaded.start == layout.start and loaded.end == layout.end
+    assert [(page.elements, page.footer) for page in loaded.pages] == [(page.elements, page.footer) for page in layout.pages]
+
+    # Images in memory are written next to the layout, files are referenced
+    # where they are, relative to the layout
+    red, green, screenshot = (loaded.images[image_id] for image_id in ids)
+    assert path.dirname(red) == str(tmp_path / "out" / "report-images")
+    assert open(red, "rb").read() == encoded_png("red")
+    assert read_image(green) == read_image_of(Image.new("RGB", (3, 1), "green"))
+    assert path.normpath(screenshot) == str(tmp_path / "screenshot.png")
+    with open(filename, encoding="utf-8") as f:
+        assert json.load(f)["images"][ids[2]] == path.join("..", "screenshot.png")
+
+def test_spooled_images_are_copied_out_of_the_spool(tmp_path, monkeypatch):
+    spool = ImageSpool()
+    monkeypatch.setattr("ktuoopreport.layout.default_image_spool", spool)
+    try:
+        spooled = spool.put(encoded_png("red"))
+        layout = Layout("cm", (21.0, 29.7))
+        image_id = layout.add_image(spooled)
+        # Same id as the data would get in memory
+        assert image_id == Layout("cm", (21.0, 29.7)).add_image(encoded_png("red"))
+
+        layout.save(str(tmp_path / "report.json"))
+    finally:
+        spool.cleanup()
+
+    saved = Layout.load(str(tmp_path / "report.json")).images[image_id]
+    assert open(saved, "rb").read() == encoded_png("red")
+
+def test_slice_takes_pages_without_footers_and_only_their_images(tmp_path):
+    layout, ids = make_layout(tmp_path)
+
+    section = layout.slice(2, 3, {"a": 1}, {"a": 2})
+
+    assert [page.elements for page in section.pages] == [page.elements for page in layout.pages[1:]]
+    assert all(page.footer == [] for page in section.pages)
+    assert set(section.images) == set(ids[1:])
+    assert section.start == {"a": 1} and section.end == {"a": 2}
+
+def test_truncate_forgets_everything_after_mark():
+    layout = Layout("cm", (21.0, 29.7))
+    layout.add(1, {"type": "text", "text": "kept"})
+    mark = layout.mark()
+    layout.add(1, {"type": "text", "text": "dropped"})
+    layout.add(2, {"type": "text", "text": "dropped"})
+
+    layout.truncate(mark)
+
+    assert len(layout.pages) == 1
+    assert [element["text"] for element in layout.pages[0].elements] == ["kept"]
+
+def test_saved_layout_renders_the_same_report(tmp_path, in_report_folder):
+    pypdf = pytest.importorskip("pypdf")
+    report_file = tmp_path / "report.toml"
+    report_file.write_text("\n".join([
+        'title = "Objektinis programavimas I (P175B118)"',
+        'lecturer = { name = "Alice", gender = "female" }',
+        'student = { name = "Bob", gender = "male" }',
+        "[[sections]]",
+        'title = "Pirmas"',
+        'problem = "Parašyti **programą**, kuri skaičiuoja *vidurkį*.\\n\\n* punktas\\n* kitas"',
+    ]), encoding="utf-8")
+    report, generator = main.read_report_toml(str(report_file))
+    generator.reproducible = True
+    generator.generate(report, str(tmp_path / "report.pdf"), layout_file=str(tmp_path / "layout.json"))
+
+    layout = Layout.load(str(tmp_path / "layout.json"))
+    assert render_layout(layout, str(tmp_path / "replayed.pdf"), creation_date=get_creation_date(True))
+    # Rendering again gives the same file, which is left untouched
+    assert not render_layout(layout, str(tmp_path / "replayed.pdf"), creation_date=get_creation_date(True))
+
+    original = pypdf.PdfReader(str(tmp_path / "report.pdf"))
+    replayed = pypdf.PdfReader(str(tmp_path / "replayed.pdf"))
+    assert len(replayed.pages) == len(original.pages)
+    for original_page, replayed_page in zip(original.pages, replayed.pages):
+        # The table of contents is drawn after its page's footer, so only
+        # the order of lines can differ
+        assert sorted(replayed_page.extract_text().splitlines()) == sorted(original_page.extract_text().splitlines())
+        assert len(replayed_page.images) == len(original_page.images)
+
+def make_project(tmp_path):
+    project = tmp_path / "project"
+    (project / "obj").mkdir(parents=True)
+    (project / "Program.cs").write_text("class Program {}")
+    (project / "obj" / "build.cache").write_text("1")
+    return str(project)
+
+def test_cache_key_follows_fields_and_files(tmp_path):
+    cache = LayoutCache(str(tmp_path / "cache"))
+    project = make_project(tmp_path)
+    section = {"title": "Pirmas", "project": project}
+
+    key = cache.get_key(section, "generator")
+    assert cache.get_key(dict(reversed(list(section.items()))), "generator") == key
+
+    assert cache.get_key({**section, "title": "Antras"}, "generator") != key
+    assert cache.get_key(section, "other generator") != key
+
+    # Build output doesn't change how a section looks
+    (tmp_path / "project" / "obj" / "build.cache").write_text("22")
+    assert cache.get_key(section, "generator") == key
+
+    (tmp_path / "project" / "Program.cs").write_text("class Program { }")
+    assert cache.get_key(section, "generator") != key
+
+def test_cache_key_follows_files_in_lists(tmp_path):
+    cache = LayoutCache(str(tmp_path / "cache"))
+    screenshot = tmp_path / "screenshot.png"
+    screenshot.write_bytes(b"1")
+    section = {"tests_screenshots": [str(screenshot)]}
+
+    key = cache.get_key(section)
+    screenshot.write_bytes(b"22")
+    assert cache.get_key(section) != key
+
+def test_cache_returns_stored_layouts_and_ignores_broken_ones(tmp_path):
+    cache = LayoutCache(str(tmp_path / "cache"))
+    layout, ids = make_layout(tmp_path)
+
+    assert cache.get("missing") is None
+    cache.put("key", layout)
+    loaded = cache.get("key")
+    assert loaded is not None
+    assert [page.elements for page in loaded.pages] == [page.elements for page in layout.pages]
+    assert path.dirname(loaded.images[ids[0]]) == cache.image_directory
+
+    (tmp_path / "cache" / "broken.json").write_text("{")
+    assert cache.get("broken") is None
+    (tmp_path / "cache" / "old.json").write_text('{"version": 0}')
+    assert cache.get("old") is None
@@ -0,0 +1,59 @@
+import click
+import pytest
+from click.testing import CliRunner
+
+import main
+from ktuoopreport.report_generator import ReportGenerator
+
+REPORT = """
+title = "Objektinis programavimas I (P175B118)"
+lecturer = { name = "Alice", gender = "female" }
+student = { name = "Bob", gender = "male" }
+
+[[sections]]
+title = "First"
+
+[[sections]]
+title = "Second"
+"""
+
+def parse(value):
+    return main.parse_section_numbers(None, None, value)
+
+def test_parses_numbers_and_ranges():
+    assert parse("3,5-7") == {3, 5, 6, 7}
+    assert parse(" 2 , 2-3 ") == {2, 3}
+    assert parse("4-4") == {4}
+    assert parse(None) is None
+
+@pytest.mark.parametrize("value", ["", "a", "3-", "-2", "1,,2", "7-5"])
+def test_rejects_malformed_lists(value):
+    with pytest.raises(click.BadParameter):
+        parse(value)
+
+def write_report(tmp_path):
+    input = tmp_path / "report.toml"
+    input.write_text(REPORT)
+    return str(input)
+
+def test_generator_rejects_sections_the_report_does_not_have(tmp_path):
+    report, generator = main.read_report_toml(write_report(tmp_path))
+
+    assert isinstance(generator, ReportGenerator)
+    generator.selected_sections = {2, 1}
+    assert generator.get_selected_indices(report) == [0, 1]
+
+    generator.selected_sections = {0}
+    with pytest.raises(ValueError):
+        generator.get_selected_indices(report)
+
+    generator.selected_sections = {2, 3}
+    with pytest.raises(ValueError, match="no section 3"):
+        generator.get_selected_indices(report)
+
+def test_cli_shows_error_of_generator(tmp_path):
+    result = CliRunner().invoke(main.main, [write_report(tmp_path), "--sections", "1,5"])
+
+    assert result.exit_code == 1
+    assert "Report has no section 5, it has 2 sections" in result.output
+    assert not (tmp_path / "report.pdf").exists()
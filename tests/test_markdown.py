@@ -0,0 +1,76 @@
+import time
+
+from ktuoopreport.markdown import Block, Span, parse_inline, parse_markdown
+
+def styles(spans):
+    return [(span.text, span.bold, span.italic, span.code) for span in spans]
+
+def test_emphasis():
+    assert styles(parse_inline("a **b** *c* ***d***")) == [
+        ("a ", False, False, False),
+        ("b", True, False, False),
+        (" ", False, False, False),
+        ("c", False, True, False),
+        (" ", False, False, False),
+        ("d", True, True, False),
+    ]
+    assert styles(parse_inline("_it_ __bold__")) == [
+        ("it", False, True, False),
+        (" ", False, False, False),
+        ("bold", True, False, False),
+    ]
+
+def test_underscores_inside_words_are_text():
+    assert styles(parse_inline("snake_case_name")) == [("snake_case_name", False, False, False)]
+
+def test_unmatched_and_escaped_delimiters_are_text():
+    assert styles(parse_inline("**unclosed")) == [("**unclosed", False, False, False)]
+    assert styles(parse_inline("\\*not\\*")) == [("*not*", False, False, False)]
+
+def test_code_spans_keep_their_content():
+    assert styles(parse_inline("`x*y` and ``a`b``")) == [
+        ("x*y", False, False, True),
+        (" and ", False, False, False),
+        ("a`b", False, False, True),
+    ]
+
+def test_code_spans_take_emphasis_around_them():
+    assert styles(parse_inline("**`List<int>`**")) == [("List<int>", True, False, True)]
+
+def test_blocks():
+    text = "\n".join([
+        "# Title #",
+        "first",
+        "second",
+        "",
+        "* one",
+        "  - nested",
+        "1. x",
+        "10) y",
+        "```cs",
+        "int x;",
+        "",
+        "```",
+        "after",
+    ])
+    assert parse_markdown(text) == [
+        Block("heading", [Span("Title")], level=1),
+        Block("paragraph", [Span("first second")]),
+        Block("bullet", [Span("one")]),
+        Block("bullet", [Span("nested")], level=1),
+        Block("numbered", [Span("x")], number=1),
+        Block("numbered", [Span("y")], number=10),
+        Block("code", text="int x;\n", language="cs"),
+        Block("paragraph", [Span("after")]),
+    ]
+
+def test_unclosed_code_block_runs_to_the_end():
+    assert parse_markdown("~~~\na\r\nb") == [Block("code", text="a\nb")]
+
+def test_hashes_without_space_are_not_headings():
+    assert parse_markdown("#include") == [Block("paragraph", [Span("#include")])]
+
+def test_unmatched_delimiters_are_parsed_in_linear_time():
+    started_at = time.perf_counter()
+    parse_markdown("*a " * 20_000 + "_b " * 20_000 + "`" * 1000)
+    assert time.perf_counter() - started_at < 5
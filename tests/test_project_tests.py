@@ -0,0 +1,29 @@
+import os.path as path
+
+from PIL import Image
+
+from ktuoopreport.sections.project_tests import ProjectTestsSection
+from ktuoopreport.spool import ImageSpool
+
+def test_read_files_spools_images_after_text_files(tmp_path):
+    root = tmp_path / "build"
+    root.mkdir()
+    Image.new("RGB", (4, 3), "red").save(root / "plot.png")
+    (root / "results.txt").write_text("  Rezultatai  \n")
+
+    section = ProjectTestsSection("project")
+    section.image_spool = ImageSpool()
+    try:
+        files = section.read_files([str(root / "plot.png"), str(root / "results.txt")], str(root))
+
+        assert [(file.filename, file.is_image) for file in files] == [("results.txt", False), ("plot.png", True)]
+        assert files[0].content == "Rezultatai"
+        image = files[1].content
+        assert path.dirname(image) == section.image_spool.name
+        assert (root / "plot.png").read_bytes() == open(image, "rb").read()
+
+        # The spooled copy outlives the file of the test
+        (root / "plot.png").unlink()
+        assert path.isfile(image)
+    finally:
+        section.image_spool.cleanup()
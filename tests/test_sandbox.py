@@ -0,0 +1,97 @@
+import os
+import os.path as path
+
+# Renamed, so pytest doesn't take it for a class of tests
+from ktuoopreport.sandbox import TestSandbox as Sandbox
+
+def write(filename, text):
+    os.makedirs(path.dirname(filename), exist_ok=True)
+    with open(filename, "w") as f:
+        f.write(text)
+
+def read(filename):
+    with open(filename) as f:
+        return f.read()
+
+def make_build(tmp_path):
+    build = tmp_path / "build"
+    write(str(build / "App"), "executable")
+    write(str(build / "Data.txt"), "default data")
+    return str(build)
+
+def make_test(tmp_path, name="t1", files=None):
+    if files is None:
+        files = {"Data.txt": "test data", "in/extra.txt": "extra"}
+    test = tmp_path / "tests" / name
+    for relpath, text in files.items():
+        write(str(test / relpath), text)
+    write(str(test / "stdin.txt"), "line")
+    return str(test)
+
+def test_inputs_replace_build_files_while_test_runs(tmp_path):
+    build = make_build(tmp_path)
+    test = make_test(tmp_path)
+
+    with Sandbox(build, test) as sandbox:
+        assert read(path.join(build, "Data.txt")) == "test data"
+        assert read(path.join(build, "in", "extra.txt")) == "extra"
+        assert not path.exists(path.join(build, "stdin.txt"))
+        files = sandbox.list_files()
+        assert path.join(build, "Data.txt") in files
+
+    assert read(path.join(build, "Data.txt")) == "default data"
+    assert sorted(os.listdir(build)) == ["App", "Data.txt"]
+    # Nothing is left next to the build either
+    assert sorted(os.listdir(tmp_path)) == ["build", "tests"]
+
+def test_each_test_gets_its_own_inputs(tmp_path):
+    build = make_build(tmp_path)
+    first = make_test(tmp_path, "t1", {"Data.txt": "first"})
+    second = make_test(tmp_path, "t2", {"Data.txt": "second"})
+
+    for test, expected in ((first, "first"), (second, "second")):
+        with Sandbox(build, test):
+            assert read(path.join(build, "Data.txt")) == expected
+
+def test_program_can_not_change_test_folder(tmp_path):
+    build = make_build(tmp_path)
+    test = make_test(tmp_path)
+    source = path.join(test, "in", "extra.txt")
+    mode = os.stat(source).st_mode
+
+    with Sandbox(build, test):
+        target = path.join(build, "in", "extra.txt")
+        # Inputs stay writable for the program
+        assert os.access(target, os.W_OK)
+        with open(target, "a") as f:
+            f.write(" changed")
+
+    assert read(source) == "extra"
+    assert os.stat(source).st_mode == mode
+
+def test_outputs_are_listed_and_removed(tmp_path):
+    build = make_build(tmp_path)
+    test = make_test(tmp_path)
+
+    with Sandbox(build, test) as sandbox:
+        write(path.join(build, "results", "out.txt"), "result")
+        files = sandbox.list_files()
+        assert files[-1] == path.join(build, "results", "out.txt")
+        # Inputs come before outputs
+        assert files.index(path.join(build, "Data.txt")) < len(files) - 1
+
+    assert not path.exists(path.join(build, "results"))
+    assert not path.exists(path.join(build, "in"))
+
+def test_unchanged_build_files_are_not_outputs(tmp_path):
+    build = make_build(tmp_path)
+    test = make_test(tmp_path, files={"other.txt": "x"})
+
+    with Sandbox(build, test) as sandbox:
+        assert sandbox.list_files() == [path.join(build, "other.txt")]
+
+def test_stdin_lines(tmp_path):
+    build = make_build(tmp_path)
+    test = make_test(tmp_path)
+    with Sandbox(build, test) as sandbox:
+        assert sandbox.get_stdin_lines() == ["line"]
@@ -0,0 +1,97 @@
+import os.path as path
+import pickle
+import re
+
+import pytest
+
+from ktuoopreport.report import Gender
+from ktuoopreport.report_file import parse_report
+from ktuoopreport.schema import Field, SchemaError, SectionSchema
+
+SCHEMA = SectionSchema([
+    Field("project", is_path=True),
+    Field("problem"),
+    Field("tests_screenshots", list, is_path=True),
+    Field("max_file_lines", int),
+])
+
+def test_parses_fields_and_resolves_paths():
+    section = SCHEMA.parse_section({
+        "title": "Pirmas",
+        "project": "lab1",
+        "problem": "Užduotis",
+        "tests_screenshots": ["a.png", "b.png"],
+        "max_file_lines": 10,
+        "unknown": "ignored",
+    }, "reports")
+
+    assert section.title == "Pirmas"
+    assert section.project == path.join("reports", "lab1")
+    assert section.problem == "Užduotis"
+    assert section.tests_screenshots == [path.join("reports", "a.png"), path.join("reports", "b.png")]
+    assert section.max_file_lines == 10
+    assert not hasattr(section, "unknown")
+
+def test_missing_fields_are_none():
+    section = SCHEMA.parse_section({"title": "Pirmas"})
+    assert section.project is None and section.tests_screenshots is None
+    assert section.to_dict() == {"title": "Pirmas"}
+
+@pytest.mark.parametrize("data, message", [
+    ({"project": "lab1"}, "Missing 'title' field in section 1"),
+    ({"title": "A", "project": 1}, "'project' in section 1 ('A') to be str"),
+    ({"title": "A", "max_file_lines": True}, "'max_file_lines' in section 1 ('A') to be int"),
+    ({"title": "A", "tests_screenshots": ["a.png", 2]}, "'tests_screenshots' in section 1 ('A') to be a list of str"),
+    ("A", "Expected section 1 to be a table"),
+])
+def test_rejects_wrong_types(data, message):
+    with pytest.raises(SchemaError, match=re.escape(message)):
+        SCHEMA.parse_section(data)
+
+def test_sections_have_only_slots_of_the_schema():
+    section = SCHEMA.parse_section({"title": "Pirmas"})
+    with pytest.raises(AttributeError):
+        section.other = 1
+
+def test_conflicting_fields_are_rejected():
+    with pytest.raises(ValueError):
+        SectionSchema([Field("project"), Field("project", list)])
+    with pytest.raises(ValueError):
+        SectionSchema([Field("title")])
+    # The same field from two generators is merged
+    assert SectionSchema([Field("problem"), Field("problem")]).fields == (Field("problem"),)
+
+def test_equal_schemas_share_section_class():
+    other = SectionSchema(SCHEMA.fields)
+    assert other.section_type is SCHEMA.section_type
+    section = SCHEMA.parse_section({"title": "Pirmas"})
+    assert other.parse_section(section) is section
+
+def test_sections_survive_pickling():
+    section = SCHEMA.parse_section({"title": "Pirmas", "project": "lab1", "max_file_lines": 3})
+    restored = pickle.loads(pickle.dumps(section))
+    assert restored.to_dict() == section.to_dict()
+    assert type(restored).schema.fields == SCHEMA.fields
+
+def test_parse_report():
+    report = parse_report({
+        "title": "Ataskaita",
+        "student": [{"name": "Bob", "gender": "male"}, {"name": "Eve", "gender": "female"}],
+        "lecturer": {"name": "Alice", "gender": "female"},
+        "sections": [{"title": "Pirmas", "project": "lab1"}],
+    }, SCHEMA, "reports")
+
+    assert [student.name for student in report.student] == ["Bob", "Eve"]
+    assert report.lecturer.gender == Gender.FEMALE
+    assert report.sections[0].project == path.join("reports", "lab1")
+
+@pytest.mark.parametrize("data, message", [
+    ({}, "Missing 'title' field"),
+    ({"title": "A", "student": {"gender": "male"}}, "Expected 'student' to be a table with a 'name'"),
+    ({"title": "A", "student": {"name": "Bob", "gender": "x"}}, "Expected 'gender' of 'student' to be one of"),
+    ({"title": "A", "student": {"name": "Bob", "gender": "male"}, "lecturer": {"name": "Alice", "gender": "female"}, "sections": {}},
+     "Expected 'sections' to be a list of tables"),
+])
+def test_parse_report_rejects_incomplete_reports(data, message):
+    with pytest.raises(SchemaError, match=message):
+        parse_report(data, SCHEMA)